@@ -0,0 +1,48 @@
+"""
+Capacity estimate: processing cost of one scan window for large numbers of simulated Tilts.
+
+Every window includes non-Tilt iBeacons and malformed frames,
+at 10% of the Tilt advertisement volume each.
+"""
+
+from brewblox_tilt import broadcaster, parser, scanner
+
+from .common import measure, report, service_environment
+
+SCAN_WINDOW_S = 5
+
+SCENARIOS = [
+    # Number of Tilts
+    100,
+    1000,
+    5000,
+]
+
+
+def main():
+    for num_tilts in SCENARIOS:
+        with service_environment(num_calibrated=0):
+            load = scanner.LoadScanner(num_tilts=num_tilts,
+                                       rate=1,
+                                       ibeacon_rate=num_tilts * 0.1,
+                                       malformed_rate=num_tilts * 0.1,
+                                       seed=0)
+            data_parser = parser.CV.get()
+            bc = broadcaster.Broadcaster()
+
+            def cycle():
+                load.feed(SCAN_WINDOW_S)
+                bc.publish(data_parser.parse(load._drain()))
+
+            # Warm up: registers device names
+            cycle()
+
+            received = load.received
+            seconds = measure(cycle, 1, repeat=3)
+            per_cycle = (load.received - received) // 3
+            report(f'tilts={num_tilts} window={SCAN_WINDOW_S}s', seconds, per_cycle, 'adv')
+            print(f'{"":<40} {seconds / SCAN_WINDOW_S:10.1%} of one CPU core')
+
+
+if __name__ == '__main__':
+    main()
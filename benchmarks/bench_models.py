@@ -0,0 +1,97 @@
+"""
+Compares hot path types with the pydantic models they replaced.
+Reports time and allocated memory blocks per object.
+"""
+
+import tracemalloc
+from typing import Callable
+
+from pydantic import BaseModel
+
+from brewblox_tilt.models import TiltEvent, TiltMessage, TiltTemperatureSync
+
+from .common import measure, report
+
+
+class PydanticTiltEvent(BaseModel):
+    mac: str
+    uuid: str
+    major: int
+    minor: int
+    txpower: int
+    rssi: int
+
+
+class PydanticTiltTemperatureSync(BaseModel):
+    type: str
+    service: str
+    block: str
+
+
+class PydanticTiltMessage(BaseModel):
+    name: str
+    mac: str
+    color: str
+    data: dict
+    samples: int = 1
+    sync: list[PydanticTiltTemperatureSync]
+
+
+DATA = {
+    'temperature[degF]': 68.0,
+    'temperature[degC]': 20.0,
+    'specificGravity': 1.050,
+    'plato[degP]': 12.39,
+    'rssi[dBm]': -80,
+}
+
+NUM_OBJECTS = 10000
+
+
+def allocations(factory: Callable) -> float:
+    """
+    Returns the average number of memory blocks still allocated per created object.
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = [factory() for _ in range(NUM_OBJECTS)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    del objects
+    return blocks / NUM_OBJECTS
+
+
+def main():
+    event_kwargs = dict(mac='AA7F97FC141E',
+                        uuid='a495bb10-c5b1-4b44-b512-1370f02d74de',
+                        major=68,
+                        minor=1050,
+                        txpower=0,
+                        rssi=-80)
+    sync = TiltTemperatureSync(type='TempSensorExternal', service='spark-one', block='Sensor')
+    pydantic_sync = PydanticTiltTemperatureSync(type='TempSensorExternal', service='spark-one', block='Sensor')
+
+    cases = {
+        'TiltEvent pydantic': lambda: PydanticTiltEvent(**event_kwargs),
+        'TiltEvent': lambda: TiltEvent(**event_kwargs),
+        'TiltMessage pydantic': lambda: PydanticTiltMessage(name='Red',
+                                                            mac='AA7F97FC141E',
+                                                            color='Red',
+                                                            data=DATA,
+                                                            sync=[pydantic_sync]),
+        'TiltMessage': lambda: TiltMessage(name='Red',
+                                           mac='AA7F97FC141E',
+                                           color='Red',
+                                           data=DATA,
+                                           sync=(sync,)),
+    }
+
+    for name, factory in cases.items():
+        report(name, measure(factory, NUM_OBJECTS), 1, 'object')
+        print(f'{"":<40} {allocations(factory):10.2f} blocks/object')
+
+
+if __name__ == '__main__':
+    main()
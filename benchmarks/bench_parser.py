@@ -0,0 +1,46 @@
+"""
+Compares the per-device and batch implementations of EventDataParser.parse().
+Used to select parser.BATCH_MIN_DEVICES.
+"""
+
+from brewblox_tilt import parser
+
+from .common import measure, report, service_environment, tilt_events
+
+SCENARIOS = [
+    # (devices, samples per device)
+    (1, 1),
+    (8, 5),
+    (16, 5),
+    (32, 5),
+    (48, 5),
+    (64, 5),
+    (100, 5),
+    (100, 10),
+    (200, 5),
+]
+
+
+def main():
+    for aggregation in ['last', 'mean', 'median']:
+        with service_environment(aggregation=aggregation):
+            data_parser = parser.CV.get()
+
+            for num_devices, samples in SCENARIOS:
+                events = tilt_events(num_devices, samples)
+                label = f'{aggregation} devices={num_devices} samples={samples}'
+                number = max(1, 2000 // len(events))
+
+                # Warm up: registers device names
+                data_parser.parse(events)
+
+                report(f'{label} scalar',
+                       measure(lambda: data_parser.parse_scalar(events), number),
+                       len(events))
+                report(f'{label} batch',
+                       measure(lambda: data_parser.parse_batch(events), number),
+                       len(events))
+
+
+if __name__ == '__main__':
+    main()
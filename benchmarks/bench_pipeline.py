@@ -0,0 +1,64 @@
+"""
+Measures throughput of the individual stages between BLE callback and MQTT publish.
+
+A generated capture is replayed through ReplayScanner.
+Publishing uses MockMQTTClient, so results do not depend on a broker.
+"""
+
+import asyncio
+import time
+
+from brewblox_tilt import broadcaster, parser, scanner
+
+from .common import measure, report, service_environment, tilt_capture
+
+SCENARIOS = [
+    # (devices, samples per device)
+    (8, 10),
+    (32, 10),
+]
+
+
+def main():
+    for num_devices, samples in SCENARIOS:
+        with service_environment():
+            records = tilt_capture(num_devices, samples, noise=1)
+            label = f'devices={num_devices} samples={samples}'
+
+            # Callback: decode and buffer advertisements
+            replay = scanner.ReplayScanner(records)
+
+            def handle():
+                for record in records:
+                    replay._handle(record.mac, record.manufacturer_data, record.rssi)
+                replay._drain()
+
+            report(f'{label} callback', measure(handle, 10), len(records), 'adv')
+
+            # Parser: aggregate buffered events into messages
+            replay = scanner.ReplayScanner(records)
+            replay.feed(samples + 1)
+            events = replay._drain()
+            data_parser = parser.CV.get()
+            messages = data_parser.parse(events)
+            report(f'{label} parse', measure(lambda: data_parser.parse(events), 20), len(events))
+
+            # Broadcaster: encode and publish messages
+            bc = broadcaster.Broadcaster()
+            report(f'{label} publish', measure(lambda: bc.publish(messages), 100), len(messages), 'msg')
+
+            # End to end: replay the capture in 1s scan windows
+            bc = broadcaster.Broadcaster()
+            scanner.CV.set(scanner.ReplayScanner(records))
+
+            async def run_all():
+                while not scanner.CV.get().done:
+                    await bc.run()
+
+            start = time.perf_counter()
+            asyncio.run(run_all())
+            report(f'{label} end to end', time.perf_counter() - start, len(records), 'adv')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Measures cold start: time from interpreter start until the first device state is published.
+
+Every run starts a new interpreter, so imports are included.
+The service runs with simulated Tilts and MockMQTTClient.
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+RUNS = 5
+
+
+def child():
+    # Runs in a new interpreter
+    start = time.perf_counter()
+
+    from brewblox_tilt import app_factory, const, mqtt, startup
+
+    from .common import MockMQTTClient
+
+    config_dir = Path(os.environ['BENCH_CONFIG_DIR'])
+    const.CONFIG_DIR = config_dir
+    const.DEVICES_FILE_PATH = config_dir / 'devices.yml'
+    const.SG_CAL_FILE_PATH = config_dir / 'SGCal.csv'
+    const.TEMP_CAL_FILE_PATH = config_dir / 'tempCal.csv'
+    const.HISTORY_BUFFER_PATH = config_dir / 'history_buffer.sqlite'
+    const.FILTER_STATE_PATH = config_dir / 'filter_state.json'
+    const.ANALYTICS_STATE_PATH = config_dir / 'analytics_state.json'
+
+    @asynccontextmanager
+    async def mock_lifespan():
+        yield
+
+    mqtt.setup = lambda: mqtt.CV.set(MockMQTTClient())
+    mqtt.lifespan = mock_lifespan
+
+    async def run():
+        app = app_factory.create_app()
+        timer = startup.CV.get()
+        async with app.router.lifespan_context(app):
+            while timer.first_publish is None:
+                await asyncio.sleep(0.001)
+
+        print(json.dumps({
+            'first_publish': time.perf_counter() - start,
+            'phases': dict(timer.phases),
+        }))
+
+    asyncio.run(run())
+
+
+def main():
+    results = []
+    with TemporaryDirectory() as tmpdir:
+        env = {
+            **os.environ,
+            'BENCH_CONFIG_DIR': tmpdir,
+            'BREWBLOX_TILT_SIMULATE': '["Red"]',
+            'BREWBLOX_TILT_SCAN_DURATION': '0.1',
+        }
+        for _ in range(RUNS):
+            proc = subprocess.run([sys.executable, '-m', 'benchmarks.bench_startup', '--child'],
+                                  env=env,
+                                  capture_output=True,
+                                  check=True,
+                                  text=True)
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    first_publish = [r['first_publish'] for r in results]
+    print(f'{"time to first publish (scan=0.1s)":<40} '
+          f'{min(first_publish) * 1e3:10.1f} ms min {statistics.median(first_publish) * 1e3:10.1f} ms median')
+
+    for phase in results[0]['phases']:
+        seconds = statistics.median(r['phases'][phase] for r in results)
+        print(f'{"  " + phase:<40} {seconds * 1e3:10.1f} ms median')
+
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        child()
+    else:
+        main()
@@ -0,0 +1,167 @@
+"""
+Shared setup for benchmarks.
+
+Benchmarks are run as modules from the repository root:
+
+    python -m benchmarks.bench_parser
+"""
+
+import timeit
+from contextlib import contextmanager
+from pathlib import Path
+from random import Random
+from tempfile import TemporaryDirectory
+from typing import Callable, Generator
+
+from brewblox_tilt import (analytics, cluster, const, filters, history_buffer, metrics, mqtt, parser, scanner,
+                           startup, utils)
+from brewblox_tilt.capture import CaptureRecord
+from brewblox_tilt.models import ServiceConfig, TiltEvent
+from brewblox_tilt.stored import calibration, devices
+
+
+def tilt_mac(idx: int) -> str:
+    return f'{0xA4950000_0000 + idx:012X}'
+
+
+def tilt_events(num_devices: int, samples: int, seed=0) -> list[TiltEvent]:
+    """
+    Generates `samples` events for each of `num_devices` Tilts.
+    Every other device is a Tilt Pro.
+    """
+    rand = Random(seed)
+    uuids = list(const.TILT_UUID_COLORS)
+    events = []
+    for _ in range(samples):
+        for idx in range(num_devices):
+            is_pro = idx % 2 == 1
+            temp_f = rand.uniform(60, 70)
+            sg = rand.uniform(1.000, 1.060)
+            events.append(TiltEvent(mac=tilt_mac(idx),
+                                    uuid=uuids[idx % len(uuids)],
+                                    major=int(temp_f * 10) if is_pro else int(temp_f),
+                                    minor=int(sg * 10000) if is_pro else int(sg * 1000),
+                                    txpower=0,
+                                    rssi=rand.randint(-90, -50)))
+    return events
+
+
+def tilt_capture(num_devices: int, samples: int, interval=1.0, noise=1, seed=0) -> list[CaptureRecord]:
+    """
+    Generates a capture with the same Tilt values as `tilt_events()`.
+    Every device advertises once per `interval` seconds.
+    For every Tilt advertisement, `noise` advertisements from other devices are added.
+    """
+    rand = Random(seed)
+    events = tilt_events(num_devices, samples, seed)
+    records = []
+    for idx, evt in enumerate(events):
+        timestamp = (idx // num_devices) * interval + rand.uniform(0, interval)
+        records.append(CaptureRecord(timestamp=timestamp,
+                                     mac=':'.join(evt.mac[i:i+2] for i in range(0, 12, 2)),
+                                     manufacturer_data={
+                                         const.APPLE_VID: scanner.encode_beacon(evt.uuid,
+                                                                                evt.major,
+                                                                                evt.minor,
+                                                                                evt.txpower),
+                                     },
+                                     rssi=evt.rssi))
+        for _ in range(noise):
+            records.append(CaptureRecord(timestamp=timestamp,
+                                         mac=f'{rand.getrandbits(48):012X}',
+                                         manufacturer_data={rand.choice([0x0006, 0x0075, const.APPLE_VID]):
+                                                            rand.randbytes(rand.randint(4, 25))},
+                                         rssi=rand.randint(-100, -40)))
+    return sorted(records, key=lambda r: r.timestamp)
+
+
+class MockMQTTClient:
+    """
+    Stands in for FastMQTT in benchmarks.
+    Published messages are counted, but not sent.
+    """
+
+    class Client:
+        is_connected = True
+
+    def __init__(self) -> None:
+        self.client = MockMQTTClient.Client()
+        self.count = 0
+        self.bytes = 0
+
+    def publish(self, topic: str, payload: bytes, **kwargs):
+        self.count += 1
+        self.bytes += len(payload)
+
+    def subscribe(self, topic: str, **kwargs):
+        return lambda func: func
+
+
+@contextmanager
+def service_environment(num_calibrated=4, **config) -> Generator[ServiceConfig, None, None]:
+    """
+    Sets up config, calibration, devices, parser, and publishing dependencies
+    with configuration files in a temporary directory.
+    MQTT is replaced by MockMQTTClient.
+    Calibration data is generated for the first `num_calibrated` devices.
+    """
+    cfg = ServiceConfig(**config)
+    restored = {
+        'get_config': utils.get_config,
+        'CONFIG_DIR': const.CONFIG_DIR,
+        'DEVICES_FILE_PATH': const.DEVICES_FILE_PATH,
+        'SG_CAL_FILE_PATH': const.SG_CAL_FILE_PATH,
+        'TEMP_CAL_FILE_PATH': const.TEMP_CAL_FILE_PATH,
+        'HISTORY_BUFFER_PATH': const.HISTORY_BUFFER_PATH,
+        'FILTER_STATE_PATH': const.FILTER_STATE_PATH,
+        'ANALYTICS_STATE_PATH': const.ANALYTICS_STATE_PATH,
+    }
+
+    with TemporaryDirectory() as tmpdir:
+        try:
+            utils.get_config = lambda: cfg
+            const.CONFIG_DIR = Path(tmpdir)
+            const.DEVICES_FILE_PATH = Path(tmpdir, 'devices.yml')
+            const.SG_CAL_FILE_PATH = Path(tmpdir, 'SGCal.csv')
+            const.TEMP_CAL_FILE_PATH = Path(tmpdir, 'tempCal.csv')
+            const.HISTORY_BUFFER_PATH = Path(tmpdir, 'history_buffer.sqlite')
+            const.FILTER_STATE_PATH = Path(tmpdir, 'filter_state.json')
+            const.ANALYTICS_STATE_PATH = Path(tmpdir, 'analytics_state.json')
+
+            const.SG_CAL_FILE_PATH.write_text(''.join(
+                f'{tilt_mac(idx)}, {1 + v / 100}, {1 + v / 100 + 0.002}\n'
+                for idx in range(num_calibrated)
+                for v in range(5)))
+            const.TEMP_CAL_FILE_PATH.write_text(''.join(
+                f'{tilt_mac(idx)}, {v}, {v + 1}\n'
+                for idx in range(num_calibrated)
+                for v in range(40, 80, 10)))
+
+            calibration.setup()
+            devices.CV.set(devices.DeviceConfig(const.DEVICES_FILE_PATH))
+            parser.setup()
+            mqtt.CV.set(MockMQTTClient())
+            history_buffer.setup()
+            cluster.setup()
+            filters.setup()
+            analytics.setup()
+            metrics.setup()
+            startup.setup()
+            yield cfg
+
+        finally:
+            utils.get_config = restored['get_config']
+            for k, v in restored.items():
+                if k != 'get_config':
+                    setattr(const, k, v)
+
+
+def measure(func: Callable, number: int, repeat=5) -> float:
+    """
+    Returns the best average duration in seconds of a single call to `func`.
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def report(name: str, seconds: float, items: int, unit='event'):
+    print(f'{name:<40} {seconds * 1e3:10.3f} ms/call {seconds / items * 1e6:10.2f} us/{unit}')
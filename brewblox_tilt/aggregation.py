@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import statistics
+from array import array
+from math import fsum
+from typing import TYPE_CHECKING, Callable, Sequence
+
+from .models import TiltEvent
+
+# NumPy is imported when first used, to keep it out of service startup
+if TYPE_CHECKING:  # pragma: no cover
+    import numpy as np
+
+# Fraction of samples discarded at each end by the trimmed mean
+TRIM_PROPORTION = 0.2
+
+Reducer = Callable[[Sequence[float]], float]
+
+
+def reduce_last(values: Sequence[float]) -> float:
+    return values[-1]
+
+
+def reduce_mean(values: Sequence[float]) -> float:
+    return fsum(values) / len(values)
+
+
+def reduce_median(values: Sequence[float]) -> float:
+    return statistics.median(values)
+
+
+def reduce_trimmed_mean(values: Sequence[float]) -> float:
+    cut = int(len(values) * TRIM_PROPORTION)
+    trimmed = sorted(values)[cut:len(values)-cut]
+    return fsum(trimmed) / len(trimmed)
+
+
+REDUCERS: dict[str, Reducer] = {
+    'last': reduce_last,
+    'mean': reduce_mean,
+    'median': reduce_median,
+    'trimmed_mean': reduce_trimmed_mean,
+}
+
+
+def group_last_index(groups: np.ndarray) -> np.ndarray:
+    """
+    Returns the index of the last element of each group in `groups`.
+    Group indices must be contiguous, and start at 0.
+    """
+    import numpy as np
+
+    order = np.argsort(groups, kind='stable')
+    ends = np.cumsum(np.bincount(groups))
+    return order[ends - 1]
+
+
+def reduce_groups(method: str, groups: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Grouped equivalent of the functions in REDUCERS.
+    Results are identical: means are summed per group using fsum().
+
+    `groups` contains the group index for each element in `values`.
+    Group indices must be contiguous, and start at 0.
+    Within each group, values must be in the order they were received.
+
+    Returns an array with one reduced value per group.
+    """
+    import numpy as np
+
+    if method == 'last':
+        return values[group_last_index(groups)]
+
+    counts = np.bincount(groups)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    bounds = zip(starts.tolist(), ends.tolist())
+
+    if method == 'mean':
+        ordered = values[np.argsort(groups, kind='stable')].tolist()
+        return np.array([fsum(ordered[start:end]) / (end - start)
+                         for start, end in bounds])
+
+    # Sort by group, and then by value
+    ordered = values[np.lexsort((values, groups))]
+
+    if method == 'median':
+        return (ordered[starts + (counts - 1) // 2] + ordered[starts + counts // 2]) / 2
+
+    if method == 'trimmed_mean':
+        ordered = ordered.tolist()
+        trimmed = [ordered[start+cut:end-cut]
+                   for (start, end), cut in zip(bounds, (counts * TRIM_PROPORTION).astype(int).tolist())]
+        return np.array([fsum(group) / len(group) for group in trimmed])
+
+    raise ValueError(f'Unknown reducer: {method}')
+
+
+class SampleBuffer:
+    """
+    Fixed-size ring buffer of raw advertisement values for a single device.
+
+    Storage is allocated once, and reused after every drain.
+    If more than `size` samples are appended between drains, the oldest are overwritten.
+    """
+
+    __slots__ = ('mac', 'uuid', 'size', 'count', 'index', 'major', 'minor', 'txpower', 'rssi')
+
+    def __init__(self, mac: str, uuid: str, size: int) -> None:
+        self.mac = mac
+        self.uuid = uuid
+        self.size = max(size, 1)
+        self.count = 0
+        self.index = 0
+        self.major = array('H', bytes(2 * self.size))
+        self.minor = array('H', bytes(2 * self.size))
+        self.txpower = array('b', bytes(self.size))
+        self.rssi = array('h', bytes(2 * self.size))
+
+    def append(self, uuid: str, major: int, minor: int, txpower: int, rssi: int):
+        idx = self.index
+        self.uuid = uuid
+        self.major[idx] = major
+        self.minor[idx] = minor
+        self.txpower[idx] = txpower
+        self.rssi[idx] = rssi
+        self.index = (idx + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def clear(self):
+        self.count = 0
+        self.index = 0
+
+    def drain(self) -> list[TiltEvent]:
+        """
+        Returns buffered samples in the order they were received,
+        and clears the buffer.
+        """
+        start = (self.index - self.count) % self.size
+        events = [
+            TiltEvent(mac=self.mac,
+                      uuid=self.uuid,
+                      major=self.major[i],
+                      minor=self.minor[i],
+                      txpower=self.txpower[i],
+                      rssi=self.rssi[i])
+            for i in ((start + offset) % self.size
+                      for offset in range(self.count))
+        ]
+        self.clear()
+        return events
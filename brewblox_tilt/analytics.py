@@ -0,0 +1,207 @@
+"""
+Incremental fermentation analytics per device.
+
+Original gravity is the highest gravity measured since it was last reset.
+Measurements are smoothed with a short rolling median first, so a single outlier does not raise it.
+It can be reset or set by publishing to `brewcast/tilt/<name>/original_gravity`,
+with a {MAC: value} payload. If value is null, the next measurement becomes the original gravity.
+
+Apparent attenuation and ABV are derived from original and current gravity.
+The gravity rate is the slope of a least-squares fit of recent measurements.
+
+Every update is O(1): running sums are kept for measurements in the window.
+Original gravity is periodically written to file, so it survives service restarts.
+"""
+
+import json
+import logging
+import re
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Iterable
+
+from . import checkpoint, const, mqtt, utils
+from .models import TiltMessage
+
+LOGGER = logging.getLogger(__name__)
+
+CV: ContextVar['FermentationAnalytics'] = ContextVar('analytics.FermentationAnalytics')
+
+# Converts gravity drop to ABV
+ABV_FACTOR = 131.25
+
+SECONDS_PER_DAY = 86400
+
+# Original gravity is derived from the median of this many recent measurements
+OG_MEDIAN_SAMPLES = 5
+
+
+class DeviceAnalytics:
+    """
+    Incremental state for a single device.
+    Times are in days, relative to the first measurement, to preserve precision.
+    """
+
+    __slots__ = ('og', 'recent', 'epoch', 'window', 'sum_t', 'sum_sg', 'sum_tt', 'sum_tsg')
+
+    def __init__(self, og: float | None = None) -> None:
+        self.og = og
+        self.recent: deque[float] = deque(maxlen=OG_MEDIAN_SAMPLES)
+        self.epoch: float | None = None
+        self.window: deque[tuple[float, float]] = deque()
+        self.sum_t = 0.0
+        self.sum_sg = 0.0
+        self.sum_tt = 0.0
+        self.sum_tsg = 0.0
+
+    def update_og(self, sg: float) -> bool:
+        """
+        Raises original gravity to the median of recent measurements, if it is higher.
+        For an even number of measurements, the lower median is used.
+        Returns whether original gravity changed.
+        """
+        self.recent.append(sg)
+        ordered = sorted(self.recent)
+        median = ordered[(len(ordered) - 1) // 2]
+        if self.og is None or median > self.og:
+            self.og = median
+            return True
+        return False
+
+    def add(self, timestamp: float, sg: float, window_s: float):
+        """
+        Adds a measurement, and removes measurements older than `window_s`.
+        `timestamp` is a wall clock time in seconds.
+        """
+        if self.epoch is None:
+            self.epoch = timestamp
+
+        t = (timestamp - self.epoch) / SECONDS_PER_DAY
+        self.window.append((t, sg))
+        self.sum_t += t
+        self.sum_sg += sg
+        self.sum_tt += t * t
+        self.sum_tsg += t * sg
+
+        oldest = t - window_s / SECONDS_PER_DAY
+        while self.window[0][0] < oldest:
+            old_t, old_sg = self.window.popleft()
+            self.sum_t -= old_t
+            self.sum_sg -= old_sg
+            self.sum_tt -= old_t * old_t
+            self.sum_tsg -= old_t * old_sg
+
+    def slope(self) -> float | None:
+        """
+        Returns the change in gravity per day, or None if it can't be determined.
+        """
+        n = len(self.window)
+        if n < 2:
+            return None
+
+        denominator = n * self.sum_tt - self.sum_t * self.sum_t
+        if denominator <= 1e-12:
+            return None
+
+        return (n * self.sum_tsg - self.sum_t * self.sum_sg) / denominator
+
+
+class FermentationAnalytics(checkpoint.CheckpointState):
+    description = 'analytics state'
+
+    def __init__(self, path: Path, slope_window: float, checkpoint_interval: float) -> None:
+        super().__init__(path, checkpoint_interval)
+        self.slope_window = max(slope_window, 1)
+
+        self.devices: dict[str, DeviceAnalytics] = {}
+
+    def update(self, messages: Iterable[TiltMessage], timestamp: float) -> dict[str, dict]:
+        """
+        Adds gravity measurements from `messages`.
+        Filtered gravity is used if available.
+        Returns the analytics fields for each device.
+        `timestamp` is a wall clock time in seconds.
+        """
+        fields: dict[str, dict] = {}
+
+        for msg in messages:
+            sg = msg.data.get('filteredSpecificGravity', msg.data.get('specificGravity'))
+            if sg is None:
+                continue
+
+            device = self.devices.get(msg.mac)
+            if device is None:
+                device = DeviceAnalytics()
+                self.devices[msg.mac] = device
+
+            if device.update_og(sg):
+                self.dirty = True
+
+            device.add(timestamp, sg, self.slope_window)
+            og = device.og
+
+            values = {
+                'originalGravity': round(og, 4),
+                'apparentAttenuation[%]': round((og - sg) / (og - 1) * 100, 1) if og > 1 else 0,
+                'abv[%]': round((og - sg) * ABV_FACTOR, 2),
+            }
+
+            slope = device.slope()
+            if slope is not None:
+                values['specificGravityRate[1/day]'] = round(slope, 5)
+
+            fields[msg.mac] = values
+
+        return fields
+
+    def set_original_gravity(self, values: dict[str, float | None]):
+        """
+        Sets or resets original gravity for devices.
+        If the value is None, the next measurement becomes the original gravity.
+        """
+        for mac, og in values.items():
+            if not re.match(const.NORMALIZED_MAC_PATTERN, mac):
+                LOGGER.error(f'Failed to set original gravity for {mac}: not a normalized device MAC address.')
+                continue
+
+            og = None if og is None else float(og)
+            device = self.devices.setdefault(mac, DeviceAnalytics())
+            device.og = og
+            device.recent.clear()
+            self.dirty = True
+            LOGGER.info(f'Original gravity set: {mac}={og}')
+
+    def dump(self) -> str:
+        return json.dumps({
+            mac: {'og': device.og}
+            for mac, device in self.devices.items()
+        })
+
+    def load(self, text: str):
+        self.devices = {
+            mac: DeviceAnalytics(None if obj['og'] is None else float(obj['og']))
+            for mac, obj in json.loads(text).items()
+        }
+
+    def reset(self):
+        self.devices = {}
+
+
+def lifespan():
+    return checkpoint.lifespan(CV.get())
+
+
+def setup():
+    config = utils.get_config()
+    mqtt_client = mqtt.CV.get()
+    CV.set(FermentationAnalytics(const.ANALYTICS_STATE_PATH,
+                                 config.analytics_slope_window,
+                                 config.analytics_checkpoint_interval))
+
+    @mqtt_client.subscribe(f'brewcast/tilt/{config.name}/original_gravity')
+    async def on_original_gravity(client, topic, payload, qos, properties):
+        try:
+            CV.get().set_original_gravity(json.loads(payload))
+        except (ValueError, TypeError, AttributeError) as ex:
+            LOGGER.error(f'Invalid original gravity command: {utils.strex(ex)}')
@@ -4,7 +4,8 @@ from pprint import pformat
 
 from fastapi import FastAPI
 
-from . import broadcaster, mqtt, parser, scanner, stored, utils
+from . import (analytics, broadcaster, cluster, filters, history_buffer, metrics, mqtt, parser, scanner, startup,
+               stored, utils)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -30,22 +31,61 @@ def setup_logging(debug: bool):
 async def lifespan(app: FastAPI):
     LOGGER.info(utils.get_config())
     LOGGER.debug('LOGGERS:\n' + pformat(logging.root.manager.loggerDict))
+    timer = startup.CV.get()
 
     async with AsyncExitStack() as stack:
-        await stack.enter_async_context(mqtt.lifespan())
-        await stack.enter_async_context(broadcaster.lifespan())
+        with timer.phase('mqtt.lifespan'):
+            await stack.enter_async_context(mqtt.lifespan())
+        with timer.phase('stored.lifespan'):
+            await stack.enter_async_context(stored.lifespan())
+        with timer.phase('history_buffer.lifespan'):
+            await stack.enter_async_context(history_buffer.lifespan())
+        with timer.phase('filters.lifespan'):
+            await stack.enter_async_context(filters.lifespan())
+        with timer.phase('analytics.lifespan'):
+            await stack.enter_async_context(analytics.lifespan())
+
+        with timer.phase('scanner.lifespan'):
+            await stack.enter_async_context(scanner.lifespan())
+        with timer.phase('broadcaster.lifespan'):
+            await stack.enter_async_context(broadcaster.lifespan())
+
+        LOGGER.info(timer.report())
         yield
 
 
 def create_app() -> FastAPI:
+    startup.setup()
+    timer = startup.CV.get()
+
     config = utils.get_config()
     setup_logging(config.debug)
 
     # Call setup functions for modules
-    mqtt.setup()
-    stored.setup()
-    parser.setup()
-    scanner.setup()
+    # Heavy dependencies are imported by the modules that use them, when they are first needed
+    with timer.phase('mqtt.setup'):
+        mqtt.setup()
+    with timer.phase('stored.setup'):
+        stored.setup()
+    with timer.phase('cluster.setup'):
+        cluster.setup()
+    with timer.phase('history_buffer.setup'):
+        history_buffer.setup()
+    with timer.phase('parser.setup'):
+        parser.setup()
+    with timer.phase('filters.setup'):
+        filters.setup()
+    with timer.phase('analytics.setup'):
+        analytics.setup()
+    with timer.phase('scanner.setup'):
+        scanner.setup()
+    with timer.phase('metrics.setup'):
+        metrics.setup()
 
     app = FastAPI(lifespan=lifespan)
+
+    # Metrics are only served if uvicorn binds to a port
+    if config.metrics_port:
+        app.include_router(metrics.router)
+
     return app
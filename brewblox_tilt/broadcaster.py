@@ -1,53 +1,80 @@
 import asyncio
 import logging
+import time
 from contextlib import asynccontextmanager, suppress
 
-from . import mqtt, scanner, utils
+from . import analytics, cluster, filters, history_buffer, metrics, mqtt, parser, scanner, startup, utils
+from .deadband import DeadbandFilter
+from .models import TiltEvent, TiltMessage
+from .pipeline import ReadingQueue, run_stage
+from .scheduler import ScanScheduler
+from .serialization import StateEncoder, dumps
+from .sync import SyncPublisher
 
 LOGGER = logging.getLogger(__name__)
 
-EXCEPTION_DELAY_S = 30
-
 
 class Broadcaster:
     def __init__(self):
         config = utils.get_config()
         self.name = config.name
 
-        self.scan_duration = max(config.scan_duration, 0.1)
-        self.inactive_scan_interval = max(config.inactive_scan_interval, 0)
-        self.active_scan_interval = max(config.active_scan_interval, 0)
-
         self.state_topic = f'brewcast/state/{self.name}'
         self.history_topic = f'brewcast/history/{self.name}'
 
-        # Changes based on scan response
-        self.scan_interval = 0
-        self.prev_num_messages = 0
-
-    async def run(self):
+        self.state_encoder = StateEncoder(self.name, self.state_topic)
+        self.sync = SyncPublisher()
+
+        # Retained state is only published again if values change
+        self.state_filter = DeadbandFilter(
+            deadbands={
+                'specificGravity': max(config.sg_deadband, 0),
+                'temperature[degC]': max(config.temp_deadband, 0),
+            },
+            heartbeat=max(config.state_heartbeat_interval, 0),
+        )
+        self.stats_interval = max(config.state_heartbeat_interval, 60)
+        self.stats_timestamp = time.monotonic()
+
+        # Scan window and interval are based on observed advertisement rates
+        self.scheduler = ScanScheduler()
+        metrics.CV.get().observe_schedule(self.scheduler)
+
+        # Scanning, parsing, and publishing run as separate tasks
+        # If publishing can't keep up, the oldest readings are dropped
+        self.events: ReadingQueue[list[TiltEvent]] = ReadingQueue(config.pipeline_queue_size)
+        self.messages: ReadingQueue[TiltMessage] = ReadingQueue(config.pipeline_queue_size)
+
+        # If no devices are detected, the publisher still publishes service presence
+        self.presence_timeout = self.scheduler.max_window + max(self.scheduler.max_backoff,
+                                                                self.scheduler.active_interval)
+
+    def publish(self, messages: list[TiltMessage]):
+        with metrics.CV.get().publish_duration.time():
+            self._publish(messages)
+
+    def _publish(self, messages: list[TiltMessage]):
         mqtt_client = mqtt.CV.get()
-        messages = await scanner.CV.get().scan(self.scan_duration)
-        curr_num_messages = len(messages)
-        prev_num_messages = self.prev_num_messages
-        self.prev_num_messages = curr_num_messages
-
-        # Adjust scan interval based on whether devices are detected or not
-        if curr_num_messages == 0 or curr_num_messages < prev_num_messages:
-            self.scan_interval = self.inactive_scan_interval
-        else:
-            self.scan_interval = self.active_scan_interval
 
         # Always broadcast a presence message
         # This will make the service show up in the UI even without active Tilts
         mqtt_client.publish(self.state_topic,
-                            {
+                            dumps({
                                 'key': self.name,
                                 'type': 'Tilt.state.service',
                                 'timestamp': utils.time_ms(),
-                            },
+                            }),
                             retain=True)
 
+        # Analytics are updated by all nodes, so ownership can change without losing state
+        fermentation = analytics.CV.get().update(messages, time.time())
+
+        # In cluster mode, only devices owned by this node are published
+        now = time.monotonic()
+        coordinator = cluster.CV.get()
+        if coordinator.enabled:
+            messages = coordinator.update(mqtt_client, messages, now)
+
         if not messages:
             return
 
@@ -55,60 +82,106 @@ class Broadcaster:
 
         # Publish history
         # Devices can share an event
-        mqtt_client.publish(self.history_topic,
-                            {
-                                'key': self.name,
-                                'data': {
-                                    msg.name: msg.data
-                                    for msg in messages
-                                },
-                            })
+        # If the client is disconnected, or older messages are still buffered,
+        # the message is buffered and published later with its original timestamp.
+        timestamp = utils.time_ms()
+        metrics.CV.get().observe_messages(messages, now)
+
+        history = {
+            'key': self.name,
+            'data': {
+                msg.name: msg.data
+                for msg in messages
+            },
+        }
+        buffer = history_buffer.CV.get()
+        if mqtt_client.client.is_connected and not buffer.count:
+            mqtt_client.publish(self.history_topic, dumps(history))
+        else:
+            history['timestamp'] = timestamp
+            buffer.append(timestamp, self.history_topic, dumps(history))
 
         # Publish state
         # Publish individual devices separately
         # This lets us retain last published value if a device stops publishing
-        timestamp = utils.time_ms()
+        # Unchanged state is not published again until the heartbeat interval expires
+        # Fermentation analytics are only included in state
         for msg in messages:
-            mqtt_client.publish(f'{self.state_topic}/{msg.color}/{msg.mac}',
-                                {
-                                    'key': self.name,
-                                    'type': 'Tilt.state',
-                                    'timestamp': timestamp,
-                                    'color': msg.color,
-                                    'mac': msg.mac,
-                                    'name': msg.name,
-                                    'data': msg.data,
-                                },
-                                retain=True)
-
-            for sync in msg.sync:
-                if sync.type == 'TempSensorExternal':
-                    mqtt_client.publish('brewcast/spark/blocks/patch',
-                                        {
-                                            'id': sync.block,
-                                            'serviceId': sync.service,
-                                            'type': 'TempSensorExternal',
-                                            'data': {
-                                                'setting[degC]': msg.data['temperature[degC]'],
-                                            },
-                                        })
-
-    async def repeat(self):
-        config = utils.get_config()
-        while True:
-            try:
-                await asyncio.sleep(self.scan_interval)
-                await self.run()
-            except Exception as ex:
-                LOGGER.error(utils.strex(ex), exc_info=config.debug)
-                await asyncio.sleep(EXCEPTION_DELAY_S)
+            if not self.state_filter.check(msg, now):
+                continue
+
+            topic, payload = self.state_encoder.encode(msg, timestamp, fermentation.get(msg.mac))
+            mqtt_client.publish(topic, payload, retain=True)
+            startup.CV.get().published()
+
+        # Sync temperatures to Spark blocks
+        # This is rate limited separately from device state
+        self.sync.publish(mqtt_client, messages, now)
+
+        if now - self.stats_timestamp >= self.stats_interval:
+            self.stats_timestamp = now
+            LOGGER.info(f'Device state messages: published={self.state_filter.published}, ' +
+                        f'suppressed={self.state_filter.suppressed}')
+            LOGGER.info(f'Block sync patches: sent={self.sync.sent}, suppressed={self.sync.suppressed}')
+            LOGGER.info(f'Dropped readings: events={self.events.dropped}, messages={self.messages.dropped}')
+            if coordinator.enabled:
+                LOGGER.info(f'Cluster devices: owned={coordinator.owned}, skipped={coordinator.skipped}')
+
+    async def run(self):
+        """
+        Scans, parses, and publishes in series.
+        """
+        window = self.scheduler.window
+        with metrics.CV.get().scan_duration.time():
+            messages = await scanner.CV.get().scan(window)
+        filters.CV.get().apply(messages)
+        self.scheduler.update({msg.mac: msg.samples for msg in messages}, window, time.monotonic())
+        self.publish(messages)
+        await history_buffer.CV.get().replay(mqtt.CV.get())
+
+    async def scan_step(self):
+        await asyncio.sleep(self.scheduler.interval)
+        window = self.scheduler.window
+        with metrics.CV.get().scan_duration.time():
+            events = await scanner.CV.get().collect(window)
+
+        # Events are grouped by the same MAC notation as parsed messages
+        grouped: dict[str, list[TiltEvent]] = {}
+        for evt in events:
+            grouped.setdefault(utils.normalize_mac(evt.mac), []).append(evt)
+
+        self.scheduler.update({mac: len(device_events) for mac, device_events in grouped.items()},
+                              window,
+                              time.monotonic())
+        for mac, device_events in grouped.items():
+            self.events.put(mac, device_events)
+
+    async def parse_step(self):
+        batch = await self.events.get()
+        events = [evt for device_events in batch for evt in device_events]
+        with metrics.CV.get().parse_duration.time():
+            messages = parser.CV.get().parse(events)
+        filters.CV.get().apply(messages)
+        for msg in messages:
+            self.messages.put(msg.mac, msg)
+
+    async def publish_step(self):
+        messages = await self.messages.get(self.presence_timeout)
+        self.publish(messages)
+        await history_buffer.CV.get().replay(mqtt.CV.get())
 
 
 @asynccontextmanager
 async def lifespan():
     bc = Broadcaster()
-    task = asyncio.create_task(bc.repeat())
+    tasks = [
+        asyncio.create_task(run_stage('Scan', bc.scan_step)),
+        asyncio.create_task(run_stage('Parse', bc.parse_step)),
+        asyncio.create_task(run_stage('Publish', bc.publish_step)),
+    ]
     yield
-    task.cancel()
-    with suppress(asyncio.CancelledError):
-        await task
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        with suppress(asyncio.CancelledError):
+            await task
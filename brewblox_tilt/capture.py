@@ -0,0 +1,87 @@
+"""
+Recording and loading of raw BLE advertisements.
+
+Captures are stored as JSON lines, with one advertisement per line:
+
+    {"timestamp": 1700000000.125, "mac": "AA:7F:97:FC:14:1E", "rssi": -80, "data": {"76": "0215a495..."}}
+
+`data` contains the manufacturer data, with company IDs as keys, and hex-encoded values.
+"""
+
+import json
+from pathlib import Path
+from typing import NamedTuple, TextIO
+
+
+class CaptureRecord(NamedTuple):
+    timestamp: float
+    mac: str
+    manufacturer_data: dict[int, bytes]
+    rssi: int
+
+
+def encode_record(record: CaptureRecord) -> str:
+    return json.dumps({
+        'timestamp': record.timestamp,
+        'mac': record.mac,
+        'rssi': record.rssi,
+        'data': {str(k): v.hex() for k, v in record.manufacturer_data.items()},
+    })
+
+
+def decode_record(line: str) -> CaptureRecord:
+    obj = json.loads(line)
+    return CaptureRecord(timestamp=float(obj['timestamp']),
+                         mac=obj['mac'],
+                         manufacturer_data={int(k): bytes.fromhex(v) for k, v in obj['data'].items()},
+                         rssi=int(obj['rssi']))
+
+
+def read_capture(path: Path) -> list[CaptureRecord]:
+    """
+    Loads all records from a capture file, sorted by timestamp.
+    Empty lines are ignored.
+    """
+    with open(path) as f:
+        records = [decode_record(line) for line in f if line.strip()]
+    return sorted(records, key=lambda r: r.timestamp)
+
+
+def write_capture(path: Path, records: list[CaptureRecord]):
+    with CaptureWriter(path) as writer:
+        for record in records:
+            writer.write(record)
+
+
+class CaptureWriter:
+    """
+    Appends records to a capture file.
+    Writes are buffered, and flushed when the writer is closed.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.count = 0
+        self._file: TextIO | None = None
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def write(self, record: CaptureRecord):
+        if self._file is None:
+            self.open()
+        self._file.write(encode_record(record) + '\n')
+        self.count += 1
+
+    def __enter__(self) -> 'CaptureWriter':
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
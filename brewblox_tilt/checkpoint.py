@@ -0,0 +1,93 @@
+"""
+State that is periodically written to file, so it survives service restarts.
+"""
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager, suppress
+from pathlib import Path
+
+from . import utils
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CheckpointState(ABC):
+    """
+    Base class for state that is written to file if it changed.
+    Subclasses set `dirty` when the state changes.
+    """
+
+    # Used in log messages
+    description = 'state'
+
+    def __init__(self, path: Path, checkpoint_interval: float) -> None:
+        self.path = Path(path)
+        self.checkpoint_interval = max(checkpoint_interval, 1)
+        self.dirty = False
+
+    @abstractmethod
+    def dump(self) -> str:
+        """
+        Serializes the state.
+        """
+
+    @abstractmethod
+    def load(self, text: str):
+        """
+        Replaces the state with the serialized state in `text`.
+        """
+
+    @abstractmethod
+    def reset(self):
+        """
+        Clears the state.
+        """
+
+    def read(self):
+        """
+        Loads state from file.
+        If the file is missing or invalid, the state is reset.
+        """
+        try:
+            if self.path.exists():
+                self.load(self.path.read_text())
+                LOGGER.info(f'{self.description.capitalize()} loaded from `{self.path}`')
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as ex:
+            LOGGER.error(f'Failed to load {self.description}, state is reset: {utils.strex(ex)}')
+            self.reset()
+
+    async def checkpoint(self):
+        """
+        Writes state to file in a worker thread, if it changed.
+        """
+        if not self.dirty:
+            return
+
+        self.dirty = False
+        try:
+            await asyncio.to_thread(utils.write_atomic, self.path, self.dump())
+        except OSError as ex:
+            LOGGER.error(f'Failed to write {self.description}: {utils.strex(ex)}')
+
+    async def repeat_checkpoint(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            await self.checkpoint()
+
+
+@asynccontextmanager
+async def lifespan(state: CheckpointState):
+    """
+    Reads state on startup, and writes it periodically and on shutdown.
+    """
+    await asyncio.to_thread(state.read)
+    task = asyncio.create_task(state.repeat_checkpoint())
+    try:
+        yield
+    finally:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+        await state.checkpoint()
@@ -0,0 +1,134 @@
+"""
+Coordinates multiple services that scan for the same Tilts.
+
+If enabled, services with the same name share compact sightings over MQTT.
+Every service elects an owner for each device, based on the shared sightings.
+Only the owner publishes device state, history, and block sync.
+
+The node with the best RSSI becomes owner.
+A new owner is only elected if its RSSI is better than that of the current owner by more than the hysteresis.
+Owners claim their devices in their sightings, so all nodes agree on who is the current owner.
+"""
+
+import json
+import logging
+import socket
+import time
+from contextvars import ContextVar
+from typing import Iterable
+
+from fastapi_mqtt import FastMQTT
+
+from . import mqtt, utils
+from .models import TiltMessage
+from .serialization import dumps
+
+LOGGER = logging.getLogger(__name__)
+
+CV: ContextVar['ClusterCoordinator'] = ContextVar('cluster.ClusterCoordinator')
+
+
+class ClusterCoordinator:
+    def __init__(self) -> None:
+        config = utils.get_config()
+        self.enabled = config.cluster
+        self.node = config.cluster_node or socket.gethostname()
+        self.topic = f'brewcast/tilt/{config.name}/cluster'
+        self.hysteresis = max(config.cluster_hysteresis, 0)
+        self.timeout = max(config.cluster_timeout, 0)
+
+        self.owned = 0
+        self.skipped = 0
+
+        # Last sighting by each node, per MAC
+        # Sightings are stored as (RSSI, monotonic timestamp, owner claim)
+        self.sightings: dict[str, dict[str, tuple[float, float, bool]]] = {}
+
+    def receive(self, payload: dict, now: float):
+        """
+        Stores sightings published by another node.
+        `now` is a monotonic timestamp in seconds.
+        """
+        node = payload['node']
+        if node == self.node:
+            return
+
+        claimed = set(payload.get('owned', []))
+        for mac, rssi in payload['devices'].items():
+            self.sightings.setdefault(mac, {})[node] = (rssi, now, mac in claimed)
+
+    def elect(self, mac: str, now: float) -> str | None:
+        """
+        Returns the node that owns `mac`, based on recent sightings.
+        If a node claims the device, it remains owner unless another node
+        has a better RSSI by more than the hysteresis.
+        """
+        nodes = self.sightings.get(mac, {})
+        for node, (_, timestamp, _) in list(nodes.items()):
+            if now - timestamp >= self.timeout:
+                del nodes[node]
+
+        if not nodes:
+            return None
+
+        best = max(nodes, key=lambda node: (nodes[node][0], node))
+        claimants = [node for node, (_, _, claimed) in nodes.items() if claimed]
+
+        if claimants:
+            current = max(claimants, key=lambda node: (nodes[node][0], node))
+            if nodes[best][0] <= nodes[current][0] + self.hysteresis:
+                return current
+
+        return best
+
+    def update(self, mqtt_client: FastMQTT, messages: Iterable[TiltMessage], now: float) -> list[TiltMessage]:
+        """
+        Records and publishes local sightings for `messages`.
+        Returns the messages for devices owned by this node.
+        `now` is a monotonic timestamp in seconds.
+        """
+        owned: list[TiltMessage] = []
+        devices: dict[str, float] = {}
+
+        for msg in messages:
+            rssi = msg.data['rssi[dBm]']
+            nodes = self.sightings.setdefault(msg.mac, {})
+            prev = nodes.get(self.node)
+            nodes[self.node] = (rssi, now, prev is not None and prev[2])
+
+            is_owner = self.elect(msg.mac, now) == self.node
+            nodes[self.node] = (rssi, now, is_owner)
+            devices[msg.mac] = rssi
+
+            if is_owner:
+                owned.append(msg)
+                self.owned += 1
+            else:
+                self.skipped += 1
+
+        if devices:
+            mqtt_client.publish(self.topic,
+                                dumps({
+                                    'node': self.node,
+                                    'devices': devices,
+                                    'owned': [msg.mac for msg in owned],
+                                }))
+
+        return owned
+
+
+def setup():
+    config = utils.get_config()
+    CV.set(ClusterCoordinator())
+
+    if not config.cluster:
+        return
+
+    mqtt_client = mqtt.CV.get()
+
+    @mqtt_client.subscribe(CV.get().topic)
+    async def on_sightings(client, topic, payload, qos, properties):
+        try:
+            CV.get().receive(json.loads(payload), time.monotonic())
+        except (ValueError, KeyError, TypeError, AttributeError) as ex:
+            LOGGER.error(f'Invalid cluster sightings: {utils.strex(ex)}')
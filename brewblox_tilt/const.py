@@ -5,6 +5,9 @@ CONFIG_DIR = Path('/share')
 DEVICES_FILE_PATH = Path(CONFIG_DIR, 'devices.yml')
 SG_CAL_FILE_PATH = Path(CONFIG_DIR, 'SGCal.csv')
 TEMP_CAL_FILE_PATH = Path(CONFIG_DIR, 'tempCal.csv')
+HISTORY_BUFFER_PATH = Path(CONFIG_DIR, 'history_buffer.sqlite')
+FILTER_STATE_PATH = Path(CONFIG_DIR, 'filter_state.json')
+ANALYTICS_STATE_PATH = Path(CONFIG_DIR, 'analytics_state.json')
 
 NORMALIZED_MAC_PATTERN = re.compile(r'^[A-F0-9]{12}$')
 DEVICE_NAME_PATTERN = re.compile(r'^[a-zA-Z0-9 _\-\(\)\|]{1,100}$')
@@ -22,3 +25,13 @@ TILT_UUID_COLORS = {
 }
 
 APPLE_VID = 0x004C
+
+# Fields that can be smoothed by filters in devices.yml
+# Kalman filters use these defaults if noise variances are not set
+FILTER_FIELDS = ('specificGravity', 'temperature[degC]')
+FILTER_DEFAULT_ALPHA = 0.2
+FILTER_DEFAULT_NOISE = {
+    # (process noise, measurement noise)
+    'specificGravity': (1e-8, 1e-6),
+    'temperature[degC]': (1e-3, 1e-1),
+}
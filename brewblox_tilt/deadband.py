@@ -0,0 +1,54 @@
+import logging
+
+from .models import TiltMessage
+
+LOGGER = logging.getLogger(__name__)
+
+
+class DeadbandFilter:
+    """
+    Decides whether a device state must be published again.
+
+    State is published if any of the tracked fields changed more than its deadband,
+    if the device name changed, or if it was not published for `heartbeat` seconds.
+    """
+
+    def __init__(self, deadbands: dict[str, float], heartbeat: float) -> None:
+        self.deadbands = deadbands
+        self.heartbeat = heartbeat
+        self.published = 0
+        self.suppressed = 0
+
+        # Last published values, per MAC
+        self._last: dict[str, tuple[str, float, dict]] = {}
+
+    def check(self, msg: TiltMessage, now: float) -> bool:
+        """
+        Returns whether `msg` should be published.
+        If so, its values become the new reference.
+        `now` is a monotonic timestamp in seconds.
+        """
+        last = self._last.get(msg.mac)
+
+        if last is None or self._changed(msg, now, *last):
+            self._last[msg.mac] = (msg.name, now, msg.data)
+            self.published += 1
+            return True
+
+        self.suppressed += 1
+        return False
+
+    def _changed(self, msg: TiltMessage, now: float, name: str, timestamp: float, data: dict) -> bool:
+        if msg.name != name or now - timestamp >= self.heartbeat:
+            return True
+
+        for key, deadband in self.deadbands.items():
+            value = msg.data.get(key)
+            prev = data.get(key)
+            if value is None or prev is None:
+                if value is not prev:
+                    return True
+            elif abs(value - prev) > deadband:
+                return True
+
+        return False
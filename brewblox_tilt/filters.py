@@ -0,0 +1,150 @@
+"""
+Online smoothing of parsed Tilt values.
+
+Filters are configured per device in devices.yml.
+Filtered values are added to messages next to the raw values:
+`specificGravity` is smoothed as `filteredSpecificGravity`, and so on.
+
+Every filter update is O(1), and only depends on the previous filter state.
+Filter state is periodically written to file, so it survives service restarts.
+"""
+
+import json
+import logging
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Iterable
+
+from . import checkpoint, const, parser, utils
+from .models import TiltFilterSettings, TiltMessage
+from .stored import devices
+
+LOGGER = logging.getLogger(__name__)
+
+CV: ContextVar['FilterStage'] = ContextVar('filters.FilterStage')
+
+
+class FilterState:
+    """
+    State of a single filter, for a single field of a single device.
+
+    EMA filters only track the smoothed value.
+    Kalman filters are one-dimensional, with a constant value model:
+    the value is expected to drift slowly, with variance `process_noise` per update.
+    """
+
+    __slots__ = ('settings', 'value', 'variance')
+
+    def __init__(self,
+                 settings: TiltFilterSettings,
+                 value: float | None = None,
+                 variance: float | None = None,
+                 ) -> None:
+        self.settings = settings
+        self.value = value
+        self.variance = variance
+
+    def update(self, measurement: float) -> float:
+        settings = self.settings
+
+        if self.value is None:
+            self.value = measurement
+            self.variance = settings.measurement_noise
+        elif settings.type == 'ema':
+            self.value += settings.alpha * (measurement - self.value)
+        else:
+            variance = self.variance + settings.process_noise
+            gain = variance / (variance + settings.measurement_noise)
+            self.value += gain * (measurement - self.value)
+            self.variance = (1 - gain) * variance
+
+        return self.value
+
+
+def _add_filtered(data: dict, field: str, value: float):
+    if field == 'specificGravity':
+        data['filteredSpecificGravity'] = round(value, 4)
+        data['filteredPlato[degP]'] = parser.sg_to_plato(value)
+    else:
+        data['filteredTemperature[degC]'] = round(value, 2)
+        data['filteredTemperature[degF]'] = round(value * 9 / 5 + 32, 2)
+
+
+class FilterStage(checkpoint.CheckpointState):
+    description = 'filter state'
+
+    def __init__(self, path: Path, checkpoint_interval: float) -> None:
+        super().__init__(path, checkpoint_interval)
+
+        # Filter state per MAC, per field
+        self.states: dict[str, dict[str, FilterState]] = {}
+
+    def apply(self, messages: Iterable[TiltMessage]):
+        """
+        Adds filtered values to the data of all `messages` with configured filters.
+        If filter settings changed, the filter is reset.
+        """
+        registry = devices.CV.get()
+
+        for msg in messages:
+            targets = registry.filter_targets(msg.name)
+            if not targets:
+                continue
+
+            device_states = self.states.setdefault(msg.mac, {})
+            for settings in targets:
+                value = msg.data.get(settings.field)
+                if value is None:
+                    continue
+
+                state = device_states.get(settings.field)
+                if state is None or state.settings != settings:
+                    state = FilterState(settings)
+                    device_states[settings.field] = state
+
+                _add_filtered(msg.data, settings.field, state.update(value))
+                self.dirty = True
+
+    def dump(self) -> str:
+        return json.dumps({
+            mac: {
+                field: {
+                    'type': state.settings.type,
+                    'alpha': state.settings.alpha,
+                    'process_noise': state.settings.process_noise,
+                    'measurement_noise': state.settings.measurement_noise,
+                    'value': state.value,
+                    'variance': state.variance,
+                }
+                for field, state in device_states.items()
+            }
+            for mac, device_states in self.states.items()
+        })
+
+    def load(self, text: str):
+        self.states = {
+            mac: {
+                field: FilterState(TiltFilterSettings(field=field,
+                                                      type=obj['type'],
+                                                      alpha=obj['alpha'],
+                                                      process_noise=obj['process_noise'],
+                                                      measurement_noise=obj['measurement_noise']),
+                                   value=obj['value'],
+                                   variance=obj['variance'])
+                for field, obj in device_states.items()
+            }
+            for mac, device_states in json.loads(text).items()
+        }
+
+    def reset(self):
+        self.states = {}
+
+
+def lifespan():
+    return checkpoint.lifespan(CV.get())
+
+
+def setup():
+    config = utils.get_config()
+    CV.set(FilterStage(const.FILTER_STATE_PATH,
+                       config.filter_checkpoint_interval))
@@ -0,0 +1,139 @@
+"""
+Disk-backed buffer for history messages that could not be published.
+
+While the MQTT client is disconnected, history messages are stored in an SQLite database.
+After the connection is restored, they are published in timestamp order.
+"""
+
+import asyncio
+import logging
+import sqlite3
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from fastapi_mqtt import FastMQTT
+
+from . import const, utils
+
+LOGGER = logging.getLogger(__name__)
+
+CV: ContextVar['HistoryBuffer'] = ContextVar('history_buffer.HistoryBuffer')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp INTEGER NOT NULL,
+    topic TEXT NOT NULL,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_order ON history (timestamp, id);
+"""
+
+
+class HistoryBuffer:
+    def __init__(self, path: Path, max_size: int, batch_size: int) -> None:
+        self.path = Path(path)
+        self.max_size = max(max_size, 1)
+        self.batch_size = max(batch_size, 1)
+
+        # Number of messages currently stored
+        self.count = 0
+        self.evicted = 0
+        self.replayed = 0
+
+        self._db: sqlite3.Connection | None = None
+
+    def open(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # The connection is opened and used on the event loop, and is never used concurrently
+            # The thread check is disabled for tests, where the lifespan runs in another thread than the test
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+            self.count = db.execute('SELECT COUNT(*) FROM history').fetchone()[0]
+            self._db = db
+        except (OSError, sqlite3.Error) as ex:
+            LOGGER.error(f'Failed to open history buffer, history will not be buffered: {utils.strex(ex)}')
+            return
+
+        if self.count:
+            LOGGER.info(f'History buffer contains {self.count} messages')
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def append(self, timestamp: int, topic: str, payload: bytes):
+        """
+        Stores a message.
+        If the buffer is full, the oldest messages are evicted.
+        """
+        if self._db is None:
+            return
+
+        with self._db:
+            self._db.execute('INSERT INTO history (timestamp, topic, payload) VALUES (?, ?, ?)',
+                             (timestamp, topic, payload))
+            self.count += 1
+
+            excess = self.count - self.max_size
+            if excess > 0:
+                self._db.execute('DELETE FROM history WHERE id IN ' +
+                                 '(SELECT id FROM history ORDER BY timestamp, id LIMIT ?)',
+                                 (excess,))
+                self.count -= excess
+                self.evicted += excess
+
+    def replay_batch(self, mqtt_client: FastMQTT) -> int:
+        """
+        Publishes and removes the oldest stored messages.
+        Returns the number of published messages.
+        """
+        if self._db is None:
+            return 0
+
+        with self._db:
+            rows = self._db.execute('SELECT id, topic, payload FROM history ORDER BY timestamp, id LIMIT ?',
+                                    (self.batch_size,)).fetchall()
+            for _, topic, payload in rows:
+                mqtt_client.publish(topic, payload)
+            self._db.executemany('DELETE FROM history WHERE id = ?',
+                                 [(id,) for id, _, _ in rows])
+
+        self.count -= len(rows)
+        self.replayed += len(rows)
+        return len(rows)
+
+    async def replay(self, mqtt_client: FastMQTT):
+        """
+        Publishes all stored messages, one batch at a time.
+        Stops if the client is disconnected.
+        """
+        while self.count and mqtt_client.client.is_connected:
+            if not self.replay_batch(mqtt_client):
+                break
+            await asyncio.sleep(0)
+
+            if not self.count:
+                LOGGER.info(f'History buffer replayed, total={self.replayed}, evicted={self.evicted}')
+
+
+@asynccontextmanager
+async def lifespan():
+    buffer = CV.get()
+    buffer.open()
+    try:
+        yield
+    finally:
+        buffer.close()
+
+
+def setup():
+    config = utils.get_config()
+    CV.set(HistoryBuffer(const.HISTORY_BUFFER_PATH,
+                         config.history_buffer_size,
+                         config.history_replay_batch_size))
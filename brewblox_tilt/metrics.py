@@ -0,0 +1,181 @@
+"""
+Prometheus metrics for scanning, parsing, and publishing.
+
+Durations are recorded in histograms.
+Counters and device gauges are read from service objects when metrics are collected,
+so they add no cost to handling individual advertisements.
+
+If metrics are disabled, prometheus_client is not imported, and recording is a no-op.
+"""
+
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Iterable
+
+from fastapi import APIRouter, Response
+
+from . import parser, scanner, utils
+from .models import TiltMessage
+from .scheduler import ScanScheduler
+
+CV: ContextVar['ServiceMetrics'] = ContextVar('metrics.ServiceMetrics')
+
+# Devices not seen for this long are not counted as active, and are no longer exported
+DEVICE_ACTIVE_TIMEOUT_S = 300
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+SCAN_BUCKETS = (0.5, 1, 2.5, 5, 10, 15, 30, 60)
+
+router = APIRouter()
+
+
+class DisabledHistogram:
+    def observe(self, value: float):
+        pass
+
+    def time(self) -> nullcontext:
+        return nullcontext()
+
+
+class ServiceMetrics:
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+
+        # Last message and monotonic timestamp, per MAC
+        self.devices: dict[str, tuple[TiltMessage, float]] = {}
+        self.scheduler: ScanScheduler | None = None
+
+        if not enabled:
+            self.registry = None
+            self.scan_duration = DisabledHistogram()
+            self.parse_duration = DisabledHistogram()
+            self.publish_duration = DisabledHistogram()
+            return
+
+        from prometheus_client import CollectorRegistry, Histogram
+
+        self.registry = CollectorRegistry()
+        self.scan_duration = Histogram('tilt_scan_duration_seconds',
+                                       'Duration of BLE scans',
+                                       buckets=SCAN_BUCKETS,
+                                       registry=self.registry)
+        self.parse_duration = Histogram('tilt_parse_duration_seconds',
+                                        'Duration of parsing a batch of Tilt events',
+                                        buckets=LATENCY_BUCKETS,
+                                        registry=self.registry)
+        self.publish_duration = Histogram('tilt_publish_duration_seconds',
+                                          'Duration of publishing a batch of Tilt messages',
+                                          buckets=LATENCY_BUCKETS,
+                                          registry=self.registry)
+        self.registry.register(self)
+
+    def observe_messages(self, messages: Iterable[TiltMessage], now: float):
+        if self.enabled:
+            for msg in messages:
+                self.devices[msg.mac] = (msg, now)
+
+    def observe_schedule(self, scheduler: ScanScheduler):
+        if self.enabled:
+            self.scheduler = scheduler
+
+    def collect(self):
+        from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+        scn = scanner.CV.get()
+        advertisements = CounterMetricFamily('tilt_advertisements',
+                                             'BLE advertisements received by the scanner')
+        advertisements.add_metric([], scn.received)
+        yield advertisements
+
+        rejected = CounterMetricFamily('tilt_advertisements_rejected',
+                                       'BLE advertisements and Tilt events that were discarded',
+                                       labels=['reason'])
+        for reason, count in scn.rejected.items():
+            rejected.add_metric([reason], count)
+        rejected.add_metric(['out_of_bounds_sg'], parser.CV.get().out_of_bounds)
+        yield rejected
+
+        adapter_advertisements = CounterMetricFamily('tilt_adapter_advertisements',
+                                                     'BLE advertisements received by each adapter',
+                                                     labels=['adapter'])
+        adapter_samples = CounterMetricFamily('tilt_adapter_samples',
+                                              'Tilt samples received by each adapter',
+                                              labels=['adapter'])
+        adapter_selected = CounterMetricFamily('tilt_adapter_selected',
+                                               'Scans in which samples from the adapter were used for a device',
+                                               labels=['adapter'])
+        for adapter, stats in scn.adapter_stats().items():
+            adapter_advertisements.add_metric([adapter], stats['received'])
+            adapter_samples.add_metric([adapter], stats['samples'])
+            adapter_selected.add_metric([adapter], stats['selected'])
+        yield adapter_advertisements
+        yield adapter_samples
+        yield adapter_selected
+
+        now = time.monotonic()
+        active = GaugeMetricFamily('tilt_active_devices',
+                                   f'Devices seen in the last {DEVICE_ACTIVE_TIMEOUT_S}s')
+        rssi = GaugeMetricFamily('tilt_device_rssi_dbm',
+                                 'Last reported device RSSI',
+                                 labels=['mac', 'color', 'name'])
+        age = GaugeMetricFamily('tilt_device_last_seen_seconds',
+                                'Time since the device was last seen',
+                                labels=['mac', 'color', 'name'])
+
+        # Devices that are no longer active are removed, and their gauges are no longer exported
+        for mac, (msg, timestamp) in list(self.devices.items()):
+            if now - timestamp >= DEVICE_ACTIVE_TIMEOUT_S:
+                del self.devices[mac]
+                continue
+            labels = [mac, msg.color, msg.name]
+            rssi.add_metric(labels, msg.data['rssi[dBm]'])
+            age.add_metric(labels, now - timestamp)
+
+        active.add_metric([], len(self.devices))
+        yield active
+        yield rssi
+        yield age
+
+        if self.scheduler is not None:
+            yield from self.collect_schedule(self.scheduler)
+
+    def collect_schedule(self, scheduler: ScanScheduler):
+        from prometheus_client.core import GaugeMetricFamily
+
+        window = GaugeMetricFamily('tilt_scan_window_seconds',
+                                   'Duration of the next scan')
+        window.add_metric([], scheduler.window)
+        yield window
+
+        interval = GaugeMetricFamily('tilt_scan_interval_seconds',
+                                     'Delay before the next scan')
+        interval.add_metric([], scheduler.interval)
+        yield interval
+
+        misses = GaugeMetricFamily('tilt_scan_consecutive_misses',
+                                   'Consecutive scans without any known device in range')
+        misses.add_metric([], scheduler.misses)
+        yield misses
+
+        rate = GaugeMetricFamily('tilt_device_advertisement_rate_hz',
+                                 'Estimated rate of received advertisements',
+                                 labels=['mac'])
+        for mac, device in scheduler.devices.items():
+            rate.add_metric([mac], device.rate)
+        yield rate
+
+
+# Collection reads state that is changed by the event loop
+# The route is async, so collection is not done in a worker thread
+@router.get('/metrics')
+async def get_metrics() -> Response:
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+    return Response(generate_latest(CV.get().registry),
+                    media_type=CONTENT_TYPE_LATEST)
+
+
+def setup():
+    config = utils.get_config()
+    CV.set(ServiceMetrics(enabled=bool(config.metrics_port)))
@@ -1,6 +1,8 @@
-from typing import Literal
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal, NamedTuple
 
-from pydantic import BaseModel, Field
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -21,13 +23,57 @@ class ServiceConfig(BaseSettings):
 
     lower_bound: float = 0.5
     upper_bound: float = 2
+    scan_mode: Literal['continuous', 'interval'] = 'continuous'
+    adapters: list[str] = Field(default_factory=list)
+    adapter_merge: Literal['strongest', 'freshest'] = 'strongest'
     scan_duration: float = 5
     inactive_scan_interval: float = 5
     active_scan_interval: float = 10
+    scan_window_min: float = 1
+    scan_capture_probability: float = 0.99
+    scan_backoff_max: float = 60
+    scan_device_timeout: float = 300
+    aggregation: Literal['last', 'mean', 'median', 'trimmed_mean'] = 'median'
+    sample_buffer_size: int = 32
+
+    sg_deadband: float = 0
+    temp_deadband: float = 0
+    state_heartbeat_interval: float = 300
+    sync_deadband: float = 0
+    # TempSensorExternal blocks become invalid if they are not patched within their timeout
+    # Keep sync_refresh_interval well below the block timeout,
+    # and sync_min_interval close to the scan interval, so changes are not delayed
+    sync_min_interval: float = 10
+    sync_refresh_interval: float = 60
+    pipeline_queue_size: int = 8
+    history_buffer_size: int = 100000
+    history_replay_batch_size: int = 100
+    filter_checkpoint_interval: float = 60
+    analytics_slope_window: float = 21600
+    analytics_checkpoint_interval: float = 60
+    metrics_port: int = 0
+
+    cluster: bool = False
+    cluster_node: str = ''
+    cluster_hysteresis: float = 5
+    cluster_timeout: float = 60
+
     simulate: list[str] = Field(default_factory=list)
+    simulate_load: int = 0
+    simulate_load_rate: float = 1
+    simulate_load_ibeacon_rate: float = 0
+    simulate_load_malformed_rate: float = 0
+    simulate_load_time_scale: float = 1
+    record: Path | None = None
+    replay: Path | None = None
+    replay_speed: float = 0
+
 
+# Types below are created for every received event, or every parsed device.
+# They are not validated: all values are decoded by the service itself.
 
-class TiltEvent(BaseModel):
+
+class TiltEvent(NamedTuple):
     mac: str
     uuid: str
     major: int
@@ -36,15 +82,27 @@ class TiltEvent(BaseModel):
     rssi: int
 
 
-class TiltTemperatureSync(BaseModel):
+@dataclass(frozen=True, slots=True)
+class TiltTemperatureSync:
     type: str
     service: str
     block: str
 
 
-class TiltMessage(BaseModel):
+@dataclass(frozen=True, slots=True)
+class TiltFilterSettings:
+    field: str
+    type: Literal['ema', 'kalman']
+    alpha: float = 0
+    process_noise: float = 0
+    measurement_noise: float = 0
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class TiltMessage:
     name: str
     mac: str
     color: str
     data: dict
-    sync: list[TiltTemperatureSync]
+    samples: int = 1
+    sync: tuple[TiltTemperatureSync, ...] = ()
@@ -1,35 +1,130 @@
+from __future__ import annotations
+
 import logging
 from contextvars import ContextVar
+from typing import TYPE_CHECKING, Sequence
 
-from pint import UnitRegistry
-
-from . import const, utils
-from .models import TiltEvent, TiltMessage, TiltTemperatureSync
+from . import aggregation, const, utils
+from .models import TiltEvent, TiltMessage
 from .stored import calibration, devices
 
-_UREG: ContextVar['UnitRegistry'] = ContextVar('parser.UnitRegistry')
+# NumPy is imported when first used, to keep it out of service startup
+# Most setups never parse batches large enough for the array implementation
+if TYPE_CHECKING:  # pragma: no cover
+    import numpy as np
+
 CV: ContextVar['EventDataParser'] = ContextVar('parser.EventDataParser')
 
 LOGGER = logging.getLogger(__name__)
 
+# Batches with fewer devices are parsed one device at a time
+# Measured with `python -m benchmarks.bench_parser`
+BATCH_MIN_DEVICES = 48
+
+
+def _f_to_c(value_f):
+    # Works for both floats and NumPy arrays, with identical results
+    return (value_f - 32) * 5 / 9
+
+
+def _sg_to_plato(sg):
+    # From https://www.brewersfriend.com/plato-to-sg-conversion-chart/
+    # Powers are written as multiplications, to get identical results for floats and NumPy arrays
+    return ((-1 * 616.868)
+            + (1111.14 * sg)
+            - (630.272 * sg * sg)
+            + (135.997 * sg * sg * sg))
+
 
 def deg_f_to_c(value_f: float | None) -> float | None:
     if value_f is None:
         return None
-    ureg = _UREG.get()
-    value_c = ureg.Quantity(value_f, ureg.degF).to('degC').magnitude
-    return round(value_c, 2)
+    return utils.round_scaled(_f_to_c(value_f), 2)
+
+
+def deg_f_to_c_array(values_f: np.ndarray) -> np.ndarray:
+    """
+    Converts all values in `values_f` at once.
+    Results are identical to deg_f_to_c().
+    NaN values are kept as NaN.
+    """
+    import numpy as np
+
+    return np.round(_f_to_c(np.asarray(values_f, dtype=float)), 2)
 
 
 def sg_to_plato(sg: float | None) -> float | None:
     if sg is None:
         return None
-    # From https://www.brewersfriend.com/plato-to-sg-conversion-chart/
-    plato = ((-1 * 616.868)
-             + (1111.14 * sg)
-             - (630.272 * sg**2)
-             + (135.997 * sg**3))
-    return round(plato, 3)
+    return utils.round_scaled(_sg_to_plato(sg), 3)
+
+
+def sg_to_plato_array(sg: np.ndarray) -> np.ndarray:
+    """
+    Converts all values in `sg` at once.
+    Results are identical to sg_to_plato().
+    NaN values are kept as NaN.
+    """
+    import numpy as np
+
+    return np.round(_sg_to_plato(np.asarray(sg, dtype=float)), 3)
+
+
+def index_strings(values: Sequence[str]) -> tuple[list[str], np.ndarray]:
+    """
+    Returns the unique elements of `values` in order of appearance,
+    and an array with the index of each element in `values` in the unique list.
+    """
+    import numpy as np
+
+    # Hashing is much faster than sorting strings with np.unique()
+    index: dict[str, int] = {}
+    indices = np.fromiter((index.setdefault(v, len(index)) for v in values),
+                          dtype=np.intp,
+                          count=len(values))
+    return list(index), indices
+
+
+def round_pro(values: np.ndarray, is_pro: np.ndarray, ndigits: int, pro_ndigits: int) -> np.ndarray:
+    """
+    Rounds values to `ndigits`, or `pro_ndigits` where `is_pro` is set.
+    NaN values are kept as NaN.
+    """
+    import numpy as np
+
+    return np.where(is_pro,
+                    np.round(values, pro_ndigits),
+                    np.round(values, ndigits))
+
+
+def whole_degrees(value_f: float, is_pro: bool) -> float | int:
+    """
+    Regular Tilts report whole degrees, which are published as int.
+    """
+    if not is_pro and value_f.is_integer():
+        return int(value_f)
+    return value_f
+
+
+def whole_degrees_array(values_f: np.ndarray, is_pro: np.ndarray) -> list[float | int]:
+    """
+    Converts all values in `values_f` at once.
+    Results are identical to whole_degrees().
+    """
+    import numpy as np
+
+    whole = ~is_pro & (values_f == np.floor(values_f))
+    converted = values_f.astype(object)
+    converted[whole] = values_f[whole].astype(int).tolist()
+    return converted.tolist()
+
+
+def nan_to_none(values: np.ndarray) -> list[float | None]:
+    import numpy as np
+
+    converted = values.astype(object)
+    converted[np.isnan(values)] = None
+    return converted.tolist()
 
 
 class EventDataParser():
@@ -37,9 +132,18 @@ class EventDataParser():
         config = utils.get_config()
         self.lower_bound = config.lower_bound
         self.upper_bound = config.upper_bound
+        self.aggregation = config.aggregation
+        self.reducer = aggregation.REDUCERS[config.aggregation]
+
+        self.colors: list[str] = list(const.TILT_UUID_COLORS.values())
+        self.uuid_index: dict[str, int] = {uuid: idx
+                                           for idx, uuid in enumerate(const.TILT_UUID_COLORS)}
 
         self.session_macs: set[str] = set()
 
+        # Number of events discarded for having an impossible SG value
+        self.out_of_bounds = 0
+
     def _decode_event_data(self, event: TiltEvent) -> dict | None:
         """
         Extract raw temp and SG values from the event data object.
@@ -68,8 +172,7 @@ class EventDataParser():
         # The Tilt sometimes broadcasts SG values in the millions
         # Prevent data pollution by discarding values that are physically impossible
         if sg < self.lower_bound or sg > self.upper_bound:
-            LOGGER.warning(f'Discarding Tilt event for {color}/{event.mac}. ' +
-                           f'SG={sg} bounds=[{self.lower_bound}, {self.upper_bound}]')
+            self._warn_out_of_bounds(color, event.mac, sg)
             return None
 
         return {
@@ -77,56 +180,44 @@ class EventDataParser():
             'temp_f': temp_f,
             'sg': sg,
             'is_pro': is_tilt_pro,
+            'rssi': event.rssi,
         }
 
-    def _parse_event(self, event: TiltEvent) -> TiltMessage | None:
-        """
-        Adds raw and calibrated values for a single Tilt event to the combined `message` object.
-
-        If the event is invalid, `message` is returned unchanged.
-        """
-        device_config = devices.CV.get()
-        sg_cal = calibration.SG_CAL.get()
-        temp_cal = calibration.TEMP_CAL.get()
-
-        decoded = self._decode_event_data(event)
-        if decoded is None:
-            return None
+    def _warn_out_of_bounds(self, color: str, mac: str, sg: float):
+        self.out_of_bounds += 1
+        LOGGER.warning(f'Discarding Tilt event for {color}/{mac}. ' +
+                       f'SG={sg} bounds=[{self.lower_bound}, {self.upper_bound}]')
 
-        color = decoded['color']
-        mac = event.mac.strip().replace(':', '').upper()
-        name = device_config.lookup(mac, color)
+    def _lookup_name(self, mac: str, color: str) -> str:
+        name = devices.CV.get().lookup(mac, color)
 
         if mac not in self.session_macs:
             self.session_macs.add(mac)
             LOGGER.info(f'Tilt detected: {mac=}, {color=}, {name=}')
 
-        raw_temp_f = decoded['temp_f']
-        raw_temp_c = deg_f_to_c(raw_temp_f)
-
-        is_pro = decoded['is_pro']
-        temp_digits = 1 if is_pro else 0
-        sg_digits = 4 if is_pro else 3
-
-        cal_temp_f = temp_cal.calibrated_value([mac, name],
-                                               raw_temp_f,
-                                               temp_digits)
-        cal_temp_c = deg_f_to_c(cal_temp_f)
-
-        raw_sg = decoded['sg']
-        cal_sg = sg_cal.calibrated_value([mac, name],
-                                         raw_sg,
-                                         sg_digits)
-
-        raw_plato = sg_to_plato(raw_sg)
-        cal_plato = sg_to_plato(cal_sg)
-
+        return name
+
+    def _message(self,
+                 mac: str,
+                 name: str,
+                 color: str,
+                 samples: int,
+                 rssi: int,
+                 raw_temp_f: float,
+                 raw_temp_c: float,
+                 cal_temp_f: float | None,
+                 cal_temp_c: float | None,
+                 raw_sg: float,
+                 cal_sg: float | None,
+                 raw_plato: float,
+                 cal_plato: float | None,
+                 ) -> TiltMessage:
         data = {
             'temperature[degF]': raw_temp_f,
             'temperature[degC]': raw_temp_c,
             'specificGravity': raw_sg,
             'plato[degP]': raw_plato,
-            'rssi[dBm]': event.rssi,
+            'rssi[dBm]': rssi,
         }
 
         # If calibrated values are present, they become the default
@@ -144,42 +235,207 @@ class EventDataParser():
             data['plato[degP]'] = cal_plato
             data['uncalibratedPlato[degP]'] = raw_plato
 
-        sync: list[TiltTemperatureSync] = []
-
-        for src in device_config.sync:
-            sync_tilt = src.get('tilt')
-            sync_type = src.get('type')
-            sync_service = src.get('service')
-            sync_block = src.get('block')
-
-            if sync_tilt != name \
-                    or not sync_type \
-                    or not sync_service \
-                    or not sync_block:
-                continue
-
-            sync.append(TiltTemperatureSync(
-                type=sync_type,
-                service=sync_service,
-                block=sync_block,
-            ))
-
         return TiltMessage(name=name,
                            mac=mac,
                            color=color,
                            data=data,
-                           sync=sync)
+                           samples=samples,
+                           sync=devices.CV.get().sync_targets(name))
+
+    def _parse_device(self, mac: str, events: list[TiltEvent]) -> TiltMessage | None:
+        """
+        Combines all Tilt events for a single device into a single message.
+        Raw values of valid events are aggregated using the configured reducer.
+
+        Returns None if none of the events are valid.
+        """
+        sg_cal = calibration.SG_CAL.get()
+        temp_cal = calibration.TEMP_CAL.get()
+
+        samples = [decoded
+                   for decoded in (self._decode_event_data(evt) for evt in events)
+                   if decoded is not None]
+        if not samples:
+            return None
+
+        latest = samples[-1]
+        color = latest['color']
+        name = self._lookup_name(mac, color)
+
+        is_pro = latest['is_pro']
+        temp_digits = 1 if is_pro else 0
+        sg_digits = 4 if is_pro else 3
+
+        # Aggregated values can be more precise than a single sample
+        raw_temp_f = utils.round_scaled(self.reducer([v['temp_f'] for v in samples]), temp_digits + 1)
+        raw_sg = utils.round_scaled(self.reducer([v['sg'] for v in samples]), sg_digits + 1)
+        rssi = round(self.reducer([v['rssi'] for v in samples]))
+
+        cal_temp_f = temp_cal.calibrated_value((mac, name),
+                                               raw_temp_f,
+                                               temp_digits)
+        cal_sg = sg_cal.calibrated_value((mac, name),
+                                         raw_sg,
+                                         sg_digits)
+
+        return self._message(mac=mac,
+                             name=name,
+                             color=color,
+                             samples=len(samples),
+                             rssi=rssi,
+                             raw_temp_f=whole_degrees(raw_temp_f, is_pro),
+                             raw_temp_c=deg_f_to_c(raw_temp_f),
+                             cal_temp_f=cal_temp_f,
+                             cal_temp_c=deg_f_to_c(cal_temp_f),
+                             raw_sg=raw_sg,
+                             cal_sg=cal_sg,
+                             raw_plato=sg_to_plato(raw_sg),
+                             cal_plato=sg_to_plato(cal_sg))
 
     def parse(self, events: list[TiltEvent]) -> list[TiltMessage]:
         """
-        Converts a list of Tilt events into a list of Tilt message.
+        Converts a list of Tilt events into a list of Tilt messages.
+        Events are grouped by device, and each device yields a single message.
         Invalid events are excluded.
+
+        Array operations have a fixed overhead, and are only used for larger batches.
+        Both implementations yield identical messages.
+        Values are rounded with utils.round_scaled() and np.round(), which give identical results.
+        """
+        if len({evt.mac for evt in events}) < BATCH_MIN_DEVICES:
+            return self.parse_scalar(events)
+        return self.parse_batch(events)
+
+    def parse_scalar(self, events: list[TiltEvent]) -> list[TiltMessage]:
+        """
+        Implementation of `parse()` that handles one device at a time.
         """
+        grouped: dict[str, list[TiltEvent]] = {}
+        for evt in events:
+            mac = utils.normalize_mac(evt.mac)
+            grouped.setdefault(mac, []).append(evt)
+
         with devices.CV.get().autocommit():
-            messages = [self._parse_event(evt) for evt in events]
+            messages = [self._parse_device(mac, evts) for mac, evts in grouped.items()]
         return [msg for msg in messages if msg is not None]
 
+    def parse_batch(self, events: list[TiltEvent]) -> list[TiltMessage]:
+        """
+        Implementation of `parse()` that handles all devices at once.
+        Events are loaded into columns, and converted using array operations.
+        Messages are only created after all values are known.
+        """
+        import numpy as np
+
+        if not events:
+            return []
+
+        # Load events into columns
+        mac_col, uuid_col, major_col, minor_col, _, rssi_col = zip(*events)
+        raw_macs, raw_mac_col = index_strings(mac_col)
+        uuids, uuid_col = index_strings(uuid_col)
+        major_col = np.array(major_col, dtype=float)
+        minor_col = np.array(minor_col, dtype=float)
+        rssi_col = np.array(rssi_col, dtype=float)
+
+        # Different notations of the same MAC address share an index
+        mac_index: dict[str, int] = {}
+        mac_remap = np.array([mac_index.setdefault(utils.normalize_mac(mac), len(mac_index))
+                              for mac in raw_macs])
+        mac_col = mac_remap[raw_mac_col]
+        macs = list(mac_index)
+
+        color_remap = np.array([self.uuid_index.get(uuid, -1) for uuid in uuids])
+        color_col = color_remap[uuid_col]
+
+        # The Tilt color is identified by the UUID field in the iBeacon packet
+        valid = color_col >= 0
+
+        # The Tilt Pro has an extra decimal for both temp and SG
+        # We can do a boundary check to find out
+        is_pro = minor_col > 5000
+        sg_col = np.where(is_pro, minor_col / 10000, minor_col / 1000)
+        temp_f_col = np.where(is_pro, major_col / 10, major_col)
+
+        # The Tilt sometimes broadcasts SG values in the millions
+        # Prevent data pollution by discarding values that are physically impossible
+        in_bounds = (sg_col >= self.lower_bound) & (sg_col <= self.upper_bound)
+        for idx in np.flatnonzero(valid & ~in_bounds):
+            self._warn_out_of_bounds(self.colors[color_col[idx]], events[idx].mac, sg_col[idx])
+
+        valid &= in_bounds
+        if not valid.any():
+            return []
+
+        # Group valid samples by device
+        # Devices keep their order of appearance
+        device_macs, groups = np.unique(mac_col[valid], return_inverse=True)
+        latest = aggregation.group_last_index(groups)
+        num_samples = np.bincount(groups)
+        dev_pro = is_pro[valid][latest]
+        dev_color = color_col[valid][latest]
+
+        # Aggregated values can be more precise than a single sample
+        raw_temp_f = round_pro(aggregation.reduce_groups(self.aggregation, groups, temp_f_col[valid]),
+                               dev_pro, 1, 2)
+        raw_sg = round_pro(aggregation.reduce_groups(self.aggregation, groups, sg_col[valid]),
+                           dev_pro, 4, 5)
+        rssi = np.round(aggregation.reduce_groups(self.aggregation, groups, rssi_col[valid])).astype(int)
+
+        with devices.CV.get().autocommit():
+            names = [self._lookup_name(macs[mac_idx], self.colors[color_idx])
+                     for mac_idx, color_idx in zip(device_macs.tolist(), dev_color.tolist())]
+
+        keys = [(macs[mac_idx], name)
+                for mac_idx, name in zip(device_macs.tolist(), names)]
+        cal_temp_f = round_pro(calibration.TEMP_CAL.get().calibrated_values(keys, raw_temp_f),
+                               dev_pro, 0, 1)
+        cal_sg = round_pro(calibration.SG_CAL.get().calibrated_values(keys, raw_sg),
+                           dev_pro, 3, 4)
+
+        columns = zip(device_macs.tolist(),
+                      names,
+                      dev_color.tolist(),
+                      num_samples.tolist(),
+                      rssi.tolist(),
+                      whole_degrees_array(raw_temp_f, dev_pro),
+                      deg_f_to_c_array(raw_temp_f).tolist(),
+                      nan_to_none(cal_temp_f),
+                      nan_to_none(deg_f_to_c_array(cal_temp_f)),
+                      raw_sg.tolist(),
+                      nan_to_none(cal_sg),
+                      sg_to_plato_array(raw_sg).tolist(),
+                      nan_to_none(sg_to_plato_array(cal_sg)))
+
+        return [
+            self._message(mac=macs[mac_idx],
+                          name=name,
+                          color=self.colors[color_idx],
+                          samples=samples,
+                          rssi=dev_rssi,
+                          raw_temp_f=dev_raw_temp_f,
+                          raw_temp_c=dev_raw_temp_c,
+                          cal_temp_f=dev_cal_temp_f,
+                          cal_temp_c=dev_cal_temp_c,
+                          raw_sg=dev_raw_sg,
+                          cal_sg=dev_cal_sg,
+                          raw_plato=dev_raw_plato,
+                          cal_plato=dev_cal_plato)
+            for (mac_idx,
+                 name,
+                 color_idx,
+                 samples,
+                 dev_rssi,
+                 dev_raw_temp_f,
+                 dev_raw_temp_c,
+                 dev_cal_temp_f,
+                 dev_cal_temp_c,
+                 dev_raw_sg,
+                 dev_cal_sg,
+                 dev_raw_plato,
+                 dev_cal_plato) in columns
+        ]
+
 
 def setup():
-    _UREG.set(UnitRegistry())
     CV.set(EventDataParser())
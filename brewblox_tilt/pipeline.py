@@ -0,0 +1,92 @@
+"""
+Building blocks for running scanning, parsing, and publishing as separate tasks.
+
+Stages are joined by bounded queues.
+If a stage falls behind, the oldest pending readings for each device are dropped.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Generic, TypeVar
+
+from . import utils
+
+LOGGER = logging.getLogger(__name__)
+
+# Stages that raise an exception are retried with exponential backoff
+STAGE_BACKOFF_MIN_S = 1
+STAGE_BACKOFF_MAX_S = 30
+
+T = TypeVar('T')
+
+
+class ReadingQueue(Generic[T]):
+    """
+    Bounded queue of readings, grouped by device.
+
+    At most `size` readings are kept for every device.
+    If more are added, the oldest readings for that device are dropped.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = max(size, 1)
+        self.dropped = 0
+        self._pending: dict[str, deque[T]] = {}
+        self._available = asyncio.Event()
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._pending.values())
+
+    def put(self, key: str, item: T):
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = deque(maxlen=self.size)
+            self._pending[key] = pending
+        if len(pending) == self.size:
+            self.dropped += 1
+        pending.append(item)
+        self._available.set()
+
+    def get_nowait(self) -> list[T]:
+        """
+        Returns the oldest pending reading for every device.
+        Returns an empty list if nothing is pending.
+        """
+        batch = [v.popleft() for v in self._pending.values()]
+        self._pending = {k: v for k, v in self._pending.items() if v}
+        if not self._pending:
+            self._available.clear()
+        return batch
+
+    async def get(self, timeout: float | None = None) -> list[T]:
+        """
+        Waits until readings are available, and then returns the oldest reading for every device.
+        Returns an empty list if nothing was available before `timeout`.
+        """
+        try:
+            await asyncio.wait_for(self._available.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.get_nowait()
+
+
+async def run_stage(name: str, step: Callable[[], Awaitable]):
+    """
+    Calls `step` until cancelled.
+
+    Errors only affect the stage itself.
+    After an error, the stage sleeps for an exponentially increasing delay.
+    The delay is reset after a successful call.
+    """
+    config = utils.get_config()
+    backoff = 0
+
+    while True:
+        try:
+            await step()
+            backoff = 0
+        except Exception as ex:
+            backoff = min(max(backoff * 2, STAGE_BACKOFF_MIN_S), STAGE_BACKOFF_MAX_S)
+            LOGGER.error(f'{name} stage error: {utils.strex(ex)}, retrying in {backoff}s', exc_info=config.debug)
+            await asyncio.sleep(backoff)
@@ -1,80 +1,507 @@
 import asyncio
 import logging
+import math
+import os
+import struct
+import time
 from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
 from contextvars import ContextVar
-from random import uniform
+from functools import cache
+from random import Random, uniform
+from statistics import fmean
+from typing import TYPE_CHECKING
 from uuid import UUID
 
-from bleak import BleakScanner
-from bleak.backends.device import BLEDevice
-from bleak.backends.scanner import AdvertisementData
-from construct import Array, Byte, Const, Int8sl, Int16ub, Struct
-from construct.core import ConstError
-
 from . import const, parser, utils
+from .aggregation import SampleBuffer
+from .capture import CaptureRecord, CaptureWriter, read_capture
 from .models import TiltEvent, TiltMessage
 
-BEACON_STRUCT = Struct(
-    'type_length' / Const(b'\x02\x15'),
-    'uuid' / Array(16, Byte),
-    'major' / Int16ub,
-    'minor' / Int16ub,
-    'tx_power' / Int8sl,
-)
+# bleak and construct are imported when first used
+# Simulated scanners and the default decoder don't need them
+if TYPE_CHECKING:  # pragma: no cover
+    from bleak import BleakScanner
+    from bleak.backends.device import BLEDevice
+    from bleak.backends.scanner import AdvertisementData
+
+
+@cache
+def beacon_struct():
+    from construct import Array, Byte, Const, Int8sl, Int16ub, Struct
+
+    return Struct(
+        'type_length' / Const(b'\x02\x15'),
+        'uuid' / Array(16, Byte),
+        'major' / Int16ub,
+        'minor' / Int16ub,
+        'tx_power' / Int8sl,
+    )
+
+
+# Equivalent layout of beacon_struct(), decoded without construct
+# [0:2] type/length prefix, [2:18] UUID, [18:23] major/minor/tx_power
+# Like beacon_struct(), trailing bytes are ignored
+IBEACON_PREFIX = b'\x02\x15'
+IBEACON_LENGTH = 23
+IBEACON_VALUES = struct.Struct('>HHb')
+
+TILT_UUID_BYTES: dict[bytes, str] = {
+    UUID(uuid).bytes: uuid
+    for uuid in const.TILT_UUID_COLORS
+}
+
+# All Tilt UUIDs share a prefix.
+# Checking it in place lets us reject other frames without allocating a slice.
+TILT_FRAME_PREFIX = IBEACON_PREFIX + os.path.commonprefix(list(TILT_UUID_BYTES))
+
+# Reasons for discarding received advertisements
+REJECT_REASONS = ('non_apple', 'non_ibeacon', 'non_tilt_uuid')
+
+# Name of the source if no adapters are configured
+DEFAULT_ADAPTER = 'default'
+
+# Step size for generating simulated load during a scan
+LOAD_STEP_S = 0.1
+
+# Continuous discovery can fail to start, or silently stop if the adapter or bluetoothd is restarted
+# It is restarted if no advertisements were received for this many scans
+DISCOVERY_STALL_SCANS = 6
+
+# If discovery fails to start, it is retried after a delay
+# The delay is doubled after every failure
+DISCOVERY_RETRY_MIN_S = 5
+DISCOVERY_RETRY_MAX_S = 300
 
 CV: ContextVar['BaseScanner'] = ContextVar('scanner.BaseScanner')
 
 LOGGER = logging.getLogger(__name__)
 
 
+def decode_beacon(data: bytes) -> tuple[str, int, int, int] | None:
+    """
+    Decodes Apple manufacturer data as a Tilt iBeacon frame.
+
+    Returns a (uuid, major, minor, tx_power) tuple,
+    or None if `data` is not an iBeacon frame with a Tilt UUID.
+    """
+    if len(data) < IBEACON_LENGTH or not data.startswith(TILT_FRAME_PREFIX):
+        return None
+
+    uuid = TILT_UUID_BYTES.get(data[2:18])
+    if uuid is None:
+        return None
+
+    major, minor, tx_power = IBEACON_VALUES.unpack_from(data, 18)
+    return uuid, major, minor, tx_power
+
+
+def decode_beacon_construct(data: bytes) -> tuple[str, int, int, int] | None:
+    """
+    Reference implementation of `decode_beacon()` using beacon_struct().
+    This is considerably slower, and only kept to verify the fast path.
+    """
+    from construct.core import ConstructError
+
+    try:
+        packet = beacon_struct().parse(data)
+    except ConstructError:
+        return None  # Not an iBeacon
+
+    uuid = str(UUID(bytes=bytes(packet.uuid)))
+    if uuid not in const.TILT_UUID_COLORS:
+        return None
+
+    return uuid, packet.major, packet.minor, packet.tx_power
+
+
+def encode_beacon(uuid: str, major: int, minor: int, tx_power: int) -> bytes:
+    """
+    Inverse of `decode_beacon()`.
+    Used to generate advertisements for captures.
+    """
+    return IBEACON_PREFIX + UUID(uuid).bytes + IBEACON_VALUES.pack(major, minor, tx_power)
+
+
 class BaseScanner(ABC):
 
+    def __init__(self) -> None:
+        # Received and discarded advertisements
+        self.received = 0
+        self.rejected = dict.fromkeys(REJECT_REASONS, 0)
+
+    async def start(self):
+        """
+        Called once when the service starts.
+        Scanners that run in the background can start here.
+        """
+
+    async def stop(self):
+        """
+        Called once when the service shuts down.
+        """
+
     @abstractmethod
+    async def collect(self, duration: float) -> list[TiltEvent]:
+        """
+        Scans for given duration, and returns all received events.
+        """
+
     async def scan(self, duration: float) -> list[TiltMessage]:
         """
         Scans for given duration, and returns a single message
         for each detected device.
         """
+        events = await self.collect(duration)
+        return parser.CV.get().parse(events)
 
+    def adapter_stats(self) -> dict[str, dict]:
+        """
+        Returns capture statistics for every BLE adapter used by the scanner.
+        """
+        return {}
 
-class TiltScanner(BaseScanner):
 
-    def __init__(self) -> None:
-        self._scanner = BleakScanner(self._callback)
-        self._scan_interval = 1
-        self._prev_num_messages = 0
-        self._events: dict[str, parser.TiltEvent] = {}
+class AdapterSource:
+    """
+    Tilt samples received by a single BLE adapter, buffered per device.
+    Buffers of devices that were not received for `device_timeout` seconds are removed.
+    """
+
+    def __init__(self, name: str, buffer_size: int, device_timeout: float) -> None:
+        self.name = name
+        self.buffer_size = buffer_size
+        self.device_timeout = device_timeout
+        self.buffers: dict[str, SampleBuffer] = {}
+
+        # Monotonic time of the last sample, per device
+        self.last_seen: dict[str, float] = {}
+
+        # Capture statistics
+        self.received = 0
+        self.samples = 0
+        self.selected = 0
+
+    def append(self, mac: str, uuid: str, major: int, minor: int, tx_power: int, rssi: int):
+        buffer = self.buffers.get(mac)
+        if buffer is None:
+            buffer = SampleBuffer(mac, uuid, self.buffer_size)
+            self.buffers[mac] = buffer
+        buffer.append(uuid, major, minor, tx_power, rssi)
+        self.last_seen[mac] = time.monotonic()
+        self.samples += 1
+
+    def drain(self) -> dict[str, list[TiltEvent]]:
+        """
+        Returns buffered samples for every device with new samples,
+        and clears the buffers.
+        """
+        drained = {mac: buffer.drain()
+                   for mac, buffer in self.buffers.items()
+                   if buffer.count}
+
+        expired = time.monotonic() - self.device_timeout
+        for mac, last_seen in list(self.last_seen.items()):
+            if last_seen < expired:
+                del self.last_seen[mac]
+                del self.buffers[mac]
+
+        return drained
+
+    def stats(self) -> dict:
+        return {
+            'received': self.received,
+            'samples': self.samples,
+            'selected': self.selected,
+            'devices': len(self.buffers),
+        }
+
+
+def merge_sources(sources: list[AdapterSource], method: str) -> list[TiltEvent]:
+    """
+    Drains all sources, and combines their samples.
+
+    If a device was received by multiple adapters, only samples from a single adapter are used.
+    This prevents duplicate samples from biasing aggregated values.
+    If `method` is 'strongest', the adapter with the highest average RSSI is used.
+    If `method` is 'freshest', the adapter that most recently received the device is used.
+    """
+    if len(sources) == 1:
+        return [evt
+                for events in sources[0].drain().values()
+                for evt in events]
+
+    selected: dict[str, tuple[float, AdapterSource, list[TiltEvent]]] = {}
+    for source in sources:
+        for mac, events in source.drain().items():
+            if method == 'freshest':
+                score = source.last_seen[mac]
+            else:
+                score = fmean(evt.rssi for evt in events)
+
+            current = selected.get(mac)
+            if current is None or score > current[0]:
+                selected[mac] = (score, source, events)
+
+    merged = []
+    for _, source, events in selected.values():
+        source.selected += 1
+        merged.extend(events)
+    return merged
+
+
+class AdvertisementScanner(BaseScanner):
+    """
+    Base class for scanners that receive raw manufacturer data.
+    Tilt iBeacon frames are decoded, and buffered per device until the next scan.
+
+    Advertisements can be received from multiple sources.
+    Their samples are merged by `merge_sources()`.
+    """
+
+    def __init__(self, legacy_decoder: bool = False, adapters: list[str] | None = None) -> None:
+        super().__init__()
+        config = utils.get_config()
+        self._decode = decode_beacon_construct if legacy_decoder else decode_beacon
+        self._merge = config.adapter_merge
+        self._sources = [AdapterSource(name, config.sample_buffer_size, config.scan_device_timeout)
+                         for name in (adapters or [DEFAULT_ADAPTER])]
+
+    def _handle(self,
+                mac: str,
+                manufacturer_data: dict[int, bytes],
+                rssi: int,
+                source: AdapterSource | None = None):
+        source = source or self._sources[0]
+        source.received += 1
+        self.received += 1
+
+        apple_data = manufacturer_data.get(const.APPLE_VID)
+        if apple_data is None:
+            self.rejected['non_apple'] += 1
+            return  # Apple vendor ID not found
+
+        decoded = self._decode(apple_data)
+        if decoded is None:
+            # Not a Tilt iBeacon
+            if apple_data.startswith(IBEACON_PREFIX) and len(apple_data) >= IBEACON_LENGTH:
+                self.rejected['non_tilt_uuid'] += 1
+            else:
+                self.rejected['non_ibeacon'] += 1
+            return
+
+        uuid, major, minor, tx_power = decoded
+        source.append(mac, uuid, major, minor, tx_power, rssi)
+
+    def _drain(self) -> list[TiltEvent]:
+        return merge_sources(self._sources, self._merge)
+
+    def adapter_stats(self) -> dict[str, dict]:
+        return {source.name: source.stats() for source in self._sources}
+
+
+class AdapterDiscovery:
+    """
+    Continuous discovery on a single BLE adapter.
+
+    If discovery fails to start, it is retried by a later scan.
+    If no advertisements were received for DISCOVERY_STALL_SCANS scans, discovery is restarted.
+    """
 
-    def _callback(self, device: BLEDevice, advertisement_data: AdvertisementData):
+    def __init__(self, scanner: 'BleakScanner', source: AdapterSource) -> None:
+        self.scanner = scanner
+        self.source = source
+        self.discovering = False
+        self.idle_scans = 0
+        self.prev_received = 0
+        self.retry_delay = DISCOVERY_RETRY_MIN_S
+        self.retry_at = 0.0
+
+    async def start(self):
+        """
+        Starts discovery.
+        Errors are logged, and not raised.
+        """
         try:
-            mac = device.address
-            apple_data = advertisement_data.manufacturer_data[const.APPLE_VID]
-            packet = BEACON_STRUCT.parse(apple_data)
-            uuid = str(UUID(bytes=bytes(packet.uuid)))
-
-            if uuid not in const.TILT_UUID_COLORS.keys():
-                return
-
-            LOGGER.debug(f'Recv {mac=} {uuid=}, {packet.major=}, {packet.minor=}')
-            self._events[mac] = TiltEvent(mac=mac,
-                                          uuid=uuid,
-                                          major=packet.major,
-                                          minor=packet.minor,
-                                          txpower=packet.tx_power,
-                                          rssi=advertisement_data.rssi)
-
-        except KeyError:
-            pass  # Apple vendor ID not found
-        except ConstError:
-            pass  # Not an iBeacon
+            await self.scanner.start()
+        except Exception as ex:
+            LOGGER.error(f'Failed to start BLE scanning on {self.source.name}, ' +
+                         f'retrying in {self.retry_delay}s: {utils.strex(ex)}')
+            await self.stop()
+            self.retry_at = time.monotonic() + self.retry_delay
+            self.retry_delay = min(self.retry_delay * 2, DISCOVERY_RETRY_MAX_S)
+            return
 
-    async def scan(self, duration: float) -> list[TiltMessage]:
-        async with self._scanner:
+        self.discovering = True
+        self.idle_scans = 0
+        self.retry_delay = DISCOVERY_RETRY_MIN_S
+        LOGGER.info(f'Started continuous BLE scanning on {self.source.name}')
+
+    async def stop(self):
+        self.discovering = False
+        try:
+            await self.scanner.stop()
+        except Exception as ex:
+            LOGGER.debug(f'Failed to stop BLE scanning on {self.source.name}: {utils.strex(ex)}')
+
+    async def check(self):
+        """
+        Restarts discovery if it stalled.
+        Called after every scan. Advertisements received between scans are included.
+        """
+        if not self.discovering:
+            return
+
+        received = self.source.received
+        self.idle_scans = 0 if received > self.prev_received else self.idle_scans + 1
+        self.prev_received = received
+
+        if self.idle_scans >= DISCOVERY_STALL_SCANS:
+            LOGGER.warning(f'No BLE advertisements received on {self.source.name} in {self.idle_scans} scans. ' +
+                           'Restarting BLE scanning.')
+            await self.stop()
+            await self.start()
+
+
+class TiltScanner(AdvertisementScanner):
+
+    def __init__(self, legacy_decoder: bool = False) -> None:
+        config = utils.get_config()
+        super().__init__(legacy_decoder, config.adapters)
+        from bleak import BleakScanner
+
+        self._continuous = config.scan_mode == 'continuous'
+
+        # One scanner per adapter
+        # Without configured adapters, the default adapter is used
+        self._scanners = [
+            BleakScanner(self._source_callback(source), adapter=source.name)
+            if config.adapters else
+            BleakScanner(self._source_callback(source))
+            for source in self._sources
+        ]
+
+        # Adapters are started and restarted independently
+        # If an adapter fails, scanning continues on the others
+        self._discovery = [AdapterDiscovery(scanner, source)
+                           for scanner, source in zip(self._scanners, self._sources)]
+
+        # If set, all received advertisements are recorded
+        self._recorder: CaptureWriter | None = None
+        if config.record:
+            self._recorder = CaptureWriter(config.record)
+
+    def _callback(self,
+                  device: 'BLEDevice',
+                  advertisement_data: 'AdvertisementData',
+                  source: AdapterSource | None = None):
+        if self._recorder is not None:
+            self._recorder.write(CaptureRecord(timestamp=time.time(),
+                                               mac=device.address,
+                                               manufacturer_data=advertisement_data.manufacturer_data,
+                                               rssi=advertisement_data.rssi))
+
+        self._handle(device.address,
+                     advertisement_data.manufacturer_data,
+                     advertisement_data.rssi,
+                     source)
+
+    def _source_callback(self, source: AdapterSource):
+        # Bleak requires a plain function or coroutine as callback
+        def callback(device: 'BLEDevice', advertisement_data: 'AdvertisementData'):
+            self._callback(device, advertisement_data, source)
+        return callback
+
+    async def start(self):
+        if self._recorder is not None:
+            self._recorder.open()
+            LOGGER.info(f'Recording BLE advertisements to {self._recorder.path}')
+
+        # In continuous mode, discovery is started once, and kept active.
+        # Advertisements received between scans are kept until the next scan.
+        if self._continuous:
+            await asyncio.gather(*(discovery.start() for discovery in self._discovery))
+
+    async def stop(self):
+        if self._continuous:
+            await asyncio.gather(*(discovery.stop() for discovery in self._discovery if discovery.discovering))
+
+        if self._recorder is not None:
+            self._recorder.close()
+
+    async def collect(self, duration: float) -> list[TiltEvent]:
+        if self._continuous:
+            now = time.monotonic()
+            await asyncio.gather(*(discovery.start() for discovery in self._discovery
+                                   if not discovery.discovering and now >= discovery.retry_at))
             await asyncio.sleep(duration)
+            await asyncio.gather(*(discovery.check() for discovery in self._discovery))
+        else:
+            # Only discover devices during the scan window.
+            # This saves power, but misses advertisements sent between scans.
+            # Adapters that fail to start are skipped, and started again by the next scan.
+            results = await asyncio.gather(*(scanner.start() for scanner in self._scanners),
+                                           return_exceptions=True)
+            started = []
+            for scanner, source, result in zip(self._scanners, self._sources, results):
+                if isinstance(result, Exception):
+                    LOGGER.error(f'Failed to start BLE scanning on {source.name}: {utils.strex(result)}')
+                else:
+                    started.append(scanner)
+
+            if not started:
+                raise results[0]
+
+            try:
+                await asyncio.sleep(duration)
+            finally:
+                await asyncio.gather(*(scanner.stop() for scanner in started),
+                                     return_exceptions=True)
+
+        return self._drain()
+
+
+class ReplayScanner(AdvertisementScanner):
+    """
+    Plays back a capture recorded by TiltScanner.
+
+    Every scan replays the records from the next `duration * speed` seconds of the capture.
+    If `speed` is 0, records are replayed as fast as possible:
+    scans return immediately, and replay `duration` seconds of the capture.
+    """
+
+    def __init__(self, records: list[CaptureRecord], speed: float = 0) -> None:
+        super().__init__()
+        self.records = records
+        self.speed = max(speed, 0)
+        self._index = 0
+        self._time = records[0].timestamp if records else 0
 
-        messages = parser.CV.get().parse(list(self._events.values()))
-        self._events.clear()
-        return messages
+    @property
+    def done(self) -> bool:
+        return self._index >= len(self.records)
+
+    def feed(self, window: float):
+        """
+        Handles all records with a timestamp in the next `window` seconds.
+        """
+        self._time += window
+        records = self.records
+        idx = self._index
+        while idx < len(records) and records[idx].timestamp < self._time:
+            record = records[idx]
+            self._handle(record.mac, record.manufacturer_data, record.rssi)
+            idx += 1
+        self._index = idx
+
+    async def collect(self, duration: float) -> list[TiltEvent]:
+        if self.speed:
+            await asyncio.sleep(duration)
+            self.feed(duration * self.speed)
+        else:
+            await asyncio.sleep(0)
+            self.feed(duration)
+        return self._drain()
 
 
 class Simulation:
@@ -109,21 +536,159 @@ class Simulation:
 class SimulatedScanner(BaseScanner):
 
     def __init__(self) -> None:
+        super().__init__()
         config = utils.get_config()
         self._simulations = [Simulation(simulated)
                              for simulated in config.simulate]
 
-    async def scan(self, duration: float) -> list[TiltMessage]:
+    async def collect(self, duration: float) -> list[TiltEvent]:
         await asyncio.sleep(duration)
-        events = [sim.update() for sim in self._simulations]
-        messages = parser.CV.get().parse(events)
-        return messages
+        return [sim.update() for sim in self._simulations]
+
+
+class VirtualTilt:
+    """
+    Generates advertisements for a simulated Tilt during fermentation.
+
+    Specific gravity follows a logistic curve from original to final gravity.
+    Temperature drifts slowly around a setpoint.
+    Both include sensor noise.
+    """
+
+    def __init__(self, idx: int, is_pro: bool, rand: Random) -> None:
+        self.rand = rand
+        self.mac = ':'.join(f'{0xDD0000000000 + idx:012X}'[i:i+2] for i in range(0, 12, 2))
+        self.uuid = list(const.TILT_UUID_COLORS)[idx % len(const.TILT_UUID_COLORS)]
+        self.is_pro = is_pro
+        self.rssi = rand.randint(-95, -50)
+
+        self.og = rand.uniform(1.040, 1.090)
+        self.fg = self.og - (self.og - 1) * rand.uniform(0.65, 0.82)
+        self.midpoint_h = rand.uniform(24, 72)
+        self.width_h = rand.uniform(8, 16)
+        self.setpoint_f = rand.uniform(62, 72)
+
+        # Time of next advertisement, in seconds since start
+        self.next_advertisement = rand.uniform(0, 1)
+
+    def frame(self, elapsed_s: float) -> bytes:
+        elapsed_h = elapsed_s / 3600
+        sg = self.fg + (self.og - self.fg) / (1 + math.exp((elapsed_h - self.midpoint_h) / self.width_h))
+        temp_f = self.setpoint_f + math.sin(elapsed_h / 6) + self.rand.gauss(0, 0.1)
+        sg += self.rand.gauss(0, 0.0003)
+
+        if self.is_pro:
+            return encode_beacon(self.uuid, round(temp_f * 10), round(sg * 10000), -59)
+        else:
+            return encode_beacon(self.uuid, round(temp_f), round(sg * 1000), -59)
+
+
+class LoadScanner(AdvertisementScanner):
+    """
+    Simulates a large number of Tilts, mixed with non-Tilt BLE traffic.
+
+    Generated advertisements are handled like those received by TiltScanner,
+    so decoding and buffering are included in the load.
+
+    `rate` is the number of advertisements per second for each Tilt.
+    `ibeacon_rate` and `malformed_rate` are the total number of non-Tilt iBeacon
+    and invalid Apple frames per second.
+    Fermentation curves progress `time_scale` times faster than real time.
+    """
+
+    def __init__(self,
+                 num_tilts: int,
+                 rate: float = 1,
+                 ibeacon_rate: float = 0,
+                 malformed_rate: float = 0,
+                 time_scale: float = 1,
+                 seed: int | None = None,
+                 ) -> None:
+        super().__init__()
+        self.rand = Random(seed)
+        self.tilts = [VirtualTilt(idx, idx % 2 == 1, self.rand) for idx in range(num_tilts)]
+        self.interval = 1 / max(rate, 0.001)
+        self.ibeacon_rate = max(ibeacon_rate, 0)
+        self.malformed_rate = max(malformed_rate, 0)
+        self.time_scale = max(time_scale, 0)
+
+        # Seconds since start
+        self.elapsed = 0
+        LOGGER.info(f'Load simulation: {num_tilts} Tilts, {rate} advertisements/s per Tilt')
+
+    def _random_mac(self) -> str:
+        return ':'.join(f'{self.rand.getrandbits(8):02X}' for _ in range(6))
+
+    def _count(self, rate: float, window: float) -> int:
+        """
+        Number of advertisements in a window, rounded randomly to preserve the average rate.
+        """
+        expected = rate * window
+        return int(expected + self.rand.random())
+
+    def feed(self, window: float):
+        """
+        Generates and handles all advertisements for the next `window` seconds.
+        """
+        rand = self.rand
+        end = self.elapsed + window
+
+        for tilt in self.tilts:
+            while tilt.next_advertisement < end:
+                frame = tilt.frame(tilt.next_advertisement * self.time_scale)
+                rssi = tilt.rssi + round(rand.gauss(0, 3))
+                self._handle(tilt.mac, {const.APPLE_VID: frame}, rssi)
+                tilt.next_advertisement += self.interval * rand.uniform(0.8, 1.2)
+
+        for _ in range(self._count(self.ibeacon_rate, window)):
+            frame = encode_beacon(str(UUID(int=rand.getrandbits(128))),
+                                  rand.getrandbits(16),
+                                  rand.getrandbits(16),
+                                  -59)
+            self._handle(self._random_mac(), {const.APPLE_VID: frame}, rand.randint(-100, -40))
+
+        for _ in range(self._count(self.malformed_rate, window)):
+            if rand.random() < 0.5:
+                # Truncated Tilt frame
+                frame = encode_beacon(rand.choice(list(const.TILT_UUID_COLORS)), 68, 1050, -59)
+                frame = frame[:rand.randint(0, IBEACON_LENGTH - 1)]
+            else:
+                frame = rand.randbytes(rand.randint(0, 30))
+            self._handle(self._random_mac(), {const.APPLE_VID: frame}, rand.randint(-100, -40))
+
+        self.elapsed = end
+
+    async def collect(self, duration: float) -> list[TiltEvent]:
+        # Advertisements are generated in small steps, to spread the load over the scan
+        num_steps = max(math.ceil(duration / LOAD_STEP_S), 1)
+        for _ in range(num_steps):
+            await asyncio.sleep(duration / num_steps)
+            self.feed(duration / num_steps)
+        return self._drain()
+
+
+@asynccontextmanager
+async def lifespan():
+    scanner = CV.get()
+    await scanner.start()
+    try:
+        yield
+    finally:
+        await scanner.stop()
 
 
 def setup():
     config = utils.get_config()
 
-    if config.simulate:
+    if config.replay:
+        CV.set(ReplayScanner(read_capture(config.replay), config.replay_speed))
+    elif config.simulate_load:
+        CV.set(LoadScanner(num_tilts=config.simulate_load,
+                           rate=config.simulate_load_rate,
+                           ibeacon_rate=config.simulate_load_ibeacon_rate,
+                           malformed_rate=config.simulate_load_malformed_rate,
+                           time_scale=config.simulate_load_time_scale))
+    elif config.simulate:
         CV.set(SimulatedScanner())
     else:
         CV.set(TiltScanner())
@@ -0,0 +1,120 @@
+"""
+Decides when to scan, and for how long.
+
+Tilts advertise at a fixed interval, but advertisements are lost at random.
+The scheduler tracks the advertisement rate of every device,
+and sizes scan windows so that all known devices are received with the target probability.
+If no devices are in range, the interval between scans is increased exponentially.
+"""
+
+import math
+
+from . import utils
+
+# Weight of the most recent scan in the advertisement rate estimate
+RATE_SMOOTHING = 0.3
+
+# Scans required before the advertisement rate of a device is used to size windows
+MIN_OBSERVATIONS = 3
+
+# Limits growth of the backoff multiplier while nothing is in range
+MAX_BACKOFF_EXPONENT = 16
+
+
+class DeviceCadence:
+    """
+    Advertisement rate estimate for a single device.
+    """
+
+    __slots__ = ('rate', 'last_seen', 'observations')
+
+    def __init__(self, last_seen: float) -> None:
+        self.rate = 0.0
+        self.last_seen = last_seen
+        self.observations = 0
+
+    def observe(self, count: int, duration: float):
+        rate = count / duration if duration > 0 else 0
+        if self.observations == 0:
+            self.rate = rate
+        else:
+            self.rate += RATE_SMOOTHING * (rate - self.rate)
+        self.observations += 1
+
+
+class ScanScheduler:
+    def __init__(self) -> None:
+        config = utils.get_config()
+        self.continuous = config.scan_mode == 'continuous'
+        self.max_window = max(config.scan_duration, 0.1)
+        self.min_window = min(max(config.scan_window_min, 0.1), self.max_window)
+        self.probability = min(max(config.scan_capture_probability, 0), 0.999)
+        self.active_interval = max(config.active_scan_interval, 0)
+        self.inactive_interval = max(config.inactive_scan_interval, 0)
+        self.max_backoff = max(config.scan_backoff_max, self.inactive_interval)
+        self.device_timeout = max(config.scan_device_timeout, 0)
+
+        # Current schedule
+        self.window = self.max_window
+        self.interval = 0.0
+        self.misses = 0
+
+        self.devices: dict[str, DeviceCadence] = {}
+        self._prev_timestamp: float | None = None
+
+    def update(self, counts: dict[str, int], window: float, now: float):
+        """
+        Updates the schedule after a scan of `window` seconds.
+        `counts` is the number of received advertisements, per device.
+        `now` is a monotonic timestamp in seconds.
+        """
+        # In continuous mode, advertisements received between scans are included
+        if self.continuous and self._prev_timestamp is not None:
+            duration = max(now - self._prev_timestamp, window)
+        else:
+            duration = window
+        self._prev_timestamp = now
+
+        for mac in counts:
+            device = self.devices.get(mac)
+            if device is None:
+                device = DeviceCadence(now)
+                self.devices[mac] = device
+            device.last_seen = now
+
+        # Devices that were missed lower their rate estimate, and increase the window
+        for mac, device in list(self.devices.items()):
+            if now - device.last_seen > self.device_timeout:
+                del self.devices[mac]
+            else:
+                device.observe(counts.get(mac, 0), duration)
+
+        self.window = self._window()
+
+        if counts or self.devices:
+            self.misses = 0
+            self.interval = self.active_interval
+        else:
+            self.misses += 1
+            backoff = self.inactive_interval * 2 ** min(self.misses - 1, MAX_BACKOFF_EXPONENT)
+            self.interval = min(backoff, self.max_backoff)
+
+    def _window(self) -> float:
+        """
+        Returns the shortest window in which all known devices are received with the target probability.
+        Advertisements are assumed to arrive as a Poisson process.
+        """
+        if not self.devices:
+            return self.max_window
+
+        # Each device must be received with probability p^(1/n) for all to be received with probability p
+        device_probability = self.probability ** (1 / len(self.devices))
+        required = -math.log(1 - device_probability)
+
+        window = self.min_window
+        for device in self.devices.values():
+            if device.observations < MIN_OBSERVATIONS or device.rate <= 0:
+                return self.max_window
+            window = max(window, required / device.rate)
+
+        return min(window, self.max_window)
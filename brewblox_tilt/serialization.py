@@ -0,0 +1,93 @@
+"""
+JSON encoding of published MQTT payloads.
+
+Payloads are published as pre-encoded bytes.
+Parts of payloads that do not change between publishes are encoded once, and cached.
+"""
+
+from .models import TiltMessage, TiltTemperatureSync
+
+try:
+    import orjson
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+except ImportError:  # pragma: no cover
+    import json
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def _open_object(obj: dict) -> bytes:
+    """
+    Encodes `obj`, but leaves out the closing brace.
+    More fields can be appended to the result.
+    """
+    return dumps(obj)[:-1]
+
+
+class StateEncoder:
+    """
+    Renders topics and payloads for Tilt.state messages.
+
+    The topic and static fields (key, type, color, mac, name)
+    are encoded once for each combination of device and name.
+    """
+
+    def __init__(self, name: str, state_topic: str) -> None:
+        self.name = name
+        self.state_topic = state_topic
+        self._cache: dict[tuple[str, str, str], tuple[str, bytes]] = {}
+
+    def encode(self, msg: TiltMessage, timestamp: int, extra: dict | None = None) -> tuple[str, bytes]:
+        """
+        Renders the topic and payload for `msg`.
+        Fields in `extra` are added to the payload data.
+        """
+        key = (msg.mac, msg.color, msg.name)
+        try:
+            topic, prefix = self._cache[key]
+        except KeyError:
+            topic = f'{self.state_topic}/{msg.color}/{msg.mac}'
+            prefix = _open_object({
+                'key': self.name,
+                'type': 'Tilt.state',
+                'color': msg.color,
+                'mac': msg.mac,
+                'name': msg.name,
+            })
+            self._cache[key] = (topic, prefix)
+
+        payload = b''.join([
+            prefix,
+            b',"timestamp":', b'%d' % timestamp,
+            b',"samples":', b'%d' % msg.samples,
+            b',"data":', dumps(msg.data | extra if extra else msg.data),
+            b'}',
+        ])
+        return topic, payload
+
+
+class SyncEncoder:
+    """
+    Renders payloads for Spark block patches.
+    Everything except the value is encoded once for each sync target.
+    """
+
+    def __init__(self) -> None:
+        self._cache: dict[TiltTemperatureSync, bytes] = {}
+
+    def encode(self, sync: TiltTemperatureSync, value: float) -> bytes:
+        try:
+            prefix = self._cache[sync]
+        except KeyError:
+            prefix = _open_object({
+                'id': sync.block,
+                'serviceId': sync.service,
+                'type': sync.type,
+            }) + b',"data":{"setting[degC]":'
+            self._cache[sync] = prefix
+
+        return b''.join([prefix, dumps(value), b'}}'])
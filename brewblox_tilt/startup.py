@@ -0,0 +1,50 @@
+"""
+Timing of service startup.
+
+Setup and lifespan phases are timed, and reported when startup is done.
+The delay until the first device state is published is logged separately.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LOGGER = logging.getLogger(__name__)
+
+CV: ContextVar['StartupTimer'] = ContextVar('startup.StartupTimer')
+
+
+class StartupTimer:
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+        self.first_publish: float | None = None
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def report(self) -> str:
+        phases = ', '.join(f'{name}={seconds * 1000:.0f}ms' for name, seconds in self.phases)
+        return f'Startup done in {self.elapsed() * 1000:.0f}ms: {phases}'
+
+    def published(self):
+        """
+        Called after every publish of device state.
+        Only the first call is recorded.
+        """
+        if self.first_publish is None:
+            self.first_publish = self.elapsed()
+            LOGGER.info(f'First device state published {self.first_publish:.2f}s after startup')
+
+
+def setup():
+    CV.set(StartupTimer())
@@ -1,6 +1,14 @@
-from . import calibration, devices
+from contextlib import asynccontextmanager
+
+from . import calibration, devices, watcher
 
 
 def setup():
     calibration.setup()
     devices.setup()
+
+
+@asynccontextmanager
+async def lifespan():
+    async with devices.lifespan(), watcher.lifespan():
+        yield
@@ -1,31 +1,76 @@
+from __future__ import annotations
+
+import asyncio
 import csv
 import logging
 from contextvars import ContextVar
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Sequence, TypeVar
 
-import numpy as np
+from .. import const, utils
 
-from .. import const
+# NumPy is imported when first used
+# It is only needed if calibration data is present, or values are calibrated in batches
+if TYPE_CHECKING:  # pragma: no cover
+    import numpy as np
 
 LOGGER = logging.getLogger(__name__)
 
 SG_CAL: ContextVar['Calibrator'] = ContextVar('calibration.Calibrator.sg')
 TEMP_CAL: ContextVar['Calibrator'] = ContextVar('calibration.Calibrator.temp')
 
+# Resolved key candidates are cached.
+# The cache is cleared if it grows beyond this size.
+RESOLVE_CACHE_SIZE = 1024
+
+Value = TypeVar('Value', float, 'np.ndarray')
+Evaluator = Callable[[Value], Value]
+
+
+def compile_poly(coefficients: Sequence[float]) -> Evaluator:
+    """
+    Creates a function that evaluates the polynomial with given coefficients.
+    Coefficients are ordered from highest to lowest power, as returned by np.polyfit().
+
+    The polynomial is evaluated in Horner form, using plain float arithmetic.
+    This is much faster than np.poly1d for scalar values,
+    and also works for NumPy arrays.
+    """
+    coefs = [float(c) for c in coefficients]
+
+    if len(coefs) == 4:
+        a, b, c, d = coefs
+
+        def evaluate_cubic(x):
+            return ((a * x + b) * x + c) * x + d
+
+        return evaluate_cubic
+
+    def evaluate(x):
+        result = 0.0
+        for c in coefs:
+            result = result * x + c
+        return result
+
+    return evaluate
+
 
 class Calibrator:
     def __init__(self, file: Path | str) -> None:
-        self.cal_polys: dict[str, np.poly1d] = {}
-        self.keys: set[str] = set()
         self.path = Path(file)
         self.path.parent.mkdir(parents=True, exist_ok=True)
         self.path.touch()
         self.path.chmod(0o666)
+        self._apply(*self._read(self.path))
 
+    @staticmethod
+    def _read(path: Path) -> tuple[dict[str, Evaluator], set[str]]:
+        evaluators: dict[str, Evaluator] = {}
+        keys: set[str] = set()
         cal_tables = {}
 
         # Load calibration CSV
-        with open(self.path, newline='') as f:
+        with open(path, newline='') as f:
             reader = csv.reader(f, delimiter=',')
             for line in reader:
                 key = None  # MAC or name
@@ -46,7 +91,7 @@ class Calibrator:
                     LOGGER.warning(f'Calibrated value `{line[2]}` not a float. Ignoring line.')
                     continue
 
-                self.keys.add(key)
+                keys.add(key)
                 data = cal_tables.setdefault(key, {
                     'uncal': [],
                     'cal': [],
@@ -56,22 +101,82 @@ class Calibrator:
 
         # Use polyfit to fit a cubic polynomial curve to calibration values
         # Then create a polynomical from the values produced by polyfit
+        if cal_tables:
+            import numpy as np
+
         for key, data in cal_tables.items():
             x = np.array(data['uncal'])
             y = np.array(data['cal'])
             z = np.polyfit(x, y, 3)
-            self.cal_polys[key] = np.poly1d(z)
-
-        LOGGER.info(f'Calibration values loaded from `{self.path}`: keys={*self.cal_polys.keys(),}')
-
-    def calibrated_value(self, key_candidates: list[str], value: float, ndigits=0) -> float | None:
-        # Use polynomials calculated above to calibrate values
+            evaluators[key] = compile_poly(z)
+
+        return evaluators, keys
+
+    def _apply(self, evaluators: dict[str, Evaluator], keys: set[str]):
+        # All fields are replaced without yielding to the event loop.
+        # Callers will never see a mix of old and new calibration data.
+        self.evaluators = evaluators
+        self.keys = keys
+        self._resolved: dict[tuple[str, ...], str | None] = {}
+        LOGGER.info(f'Calibration values loaded from `{self.path}`: keys={*self.evaluators.keys(),}')
+
+    async def reload(self):
+        """
+        Reads and fits calibration data in a worker thread,
+        and then replaces the current calibration curves.
+        """
+        self._apply(*await asyncio.to_thread(self._read, self.path))
+
+    def calibration_key(self, key_candidates: Sequence[str]) -> str | None:
         # Both MAC and device name are valid keys in calibration files
         # Check whether any of the given keys is present
-        for key in [k.lower() for k in key_candidates]:
-            if key in self.cal_polys:
-                return round(self.cal_polys[key](value), ndigits)
-        return None
+        # Candidates include the device name, so renamed devices are resolved again
+        candidates = tuple(key_candidates)
+        try:
+            return self._resolved[candidates]
+        except KeyError:
+            pass
+
+        key = next((k for k in (c.lower() for c in candidates)
+                    if k in self.evaluators),
+                   None)
+
+        if len(self._resolved) >= RESOLVE_CACHE_SIZE:
+            self._resolved.clear()
+        self._resolved[candidates] = key
+        return key
+
+    def calibrated_value(self, key_candidates: Sequence[str], value: float, ndigits=0) -> float | None:
+        # Use polynomials calculated above to calibrate values
+        key = self.calibration_key(key_candidates)
+        if key is None:
+            return None
+        return utils.round_scaled(self.evaluators[key](value), ndigits)
+
+    def calibrated_values(self, keys: Sequence[Sequence[str]], values: np.ndarray) -> np.ndarray:
+        """
+        Calibrates multiple values at once.
+        `keys` contains the key candidates for each element in `values`.
+
+        All values that share a calibration curve are evaluated in a single call.
+        Values without calibration data are set to NaN.
+        Calibrated values are not rounded.
+        """
+        import numpy as np
+
+        values = np.asarray(values, dtype=float)
+        calibrated = np.full(len(values), np.nan)
+        grouped: dict[str, list[int]] = {}
+
+        for idx, candidates in enumerate(keys):
+            key = self.calibration_key(candidates)
+            if key is not None:
+                grouped.setdefault(key, []).append(idx)
+
+        for key, indices in grouped.items():
+            calibrated[indices] = self.evaluators[key](values[indices])
+
+        return calibrated
 
 
 def setup():
@@ -1,19 +1,26 @@
+import asyncio
 import json
 import logging
 import re
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
 from contextvars import ContextVar
+from copy import deepcopy
+from io import StringIO
 from pathlib import Path
 
 from ruamel.yaml import YAML
 from ruamel.yaml.comments import CommentedMap, CommentedSeq
 
 from .. import const, mqtt, utils
+from ..models import TiltFilterSettings, TiltTemperatureSync
 
 LOGGER = logging.getLogger(__name__)
 
 CV: ContextVar['DeviceConfig'] = ContextVar('metadata.DeviceConfig')
 
+# Changes made within this period are combined in a single write
+COMMIT_DELAY_S = 1
+
 
 class DeviceConfig:
     def __init__(self, file: Path) -> None:
@@ -21,11 +28,28 @@ class DeviceConfig:
         self.yaml = YAML()
         self.changed = False
 
+        # Last content read from file, or written by autocommit()
+        # File watchers can use this to ignore our own changes
+        self.written: str | None = None
+
+        # Names changed since the last write
+        # These are kept if the file is edited before they are written
+        self._pending: dict[str, str] = {}
+
+        # Write-behind state
+        self._dirty = False
+        self._commit_lock = asyncio.Lock()
+        self._commit_handle: asyncio.TimerHandle | None = None
+        self._commit_task: asyncio.Task | None = None
+
         self.path.parent.mkdir(parents=True, exist_ok=True)
         self.path.touch()
         self.path.chmod(0o666)
+        self.written = self.path.read_text()
+        self._apply(self.yaml.load(self.written))
 
-        self.device_config: CommentedMap = self.yaml.load(self.path) or CommentedMap()
+    def _apply(self, loaded: CommentedMap | None):
+        self.device_config: CommentedMap = loaded or CommentedMap()
         self.device_config.setdefault('names', CommentedMap())
         self.device_config.setdefault('sync', CommentedSeq())
 
@@ -46,23 +70,140 @@ class DeviceConfig:
                     self.names[mac] = sanitized
                     self.changed = True
 
+        self._index_names()
+        self._index_sync()
+        self._index_filters()
         LOGGER.info(f'Device config loaded from `{self.path}`: {str(dict(self.names))}')
 
+    def _index_names(self):
+        """
+        Builds lookup tables for device names.
+        After this, they are kept up to date by _set_name().
+        """
+        # Reverse index: multiple devices may share a custom name
+        self._macs_by_name: dict[str, set[str]] = {}
+        for mac, name in self.names.items():
+            self._macs_by_name.setdefault(name, set()).add(mac)
+
+        # Next suffix to try when assigning a name derived from a base name
+        self._next_suffix: dict[str, int] = {}
+
+        # Names of devices with a validated MAC address
+        self._known: dict[str, str] = {}
+
+    def _set_name(self, mac: str, name: str):
+        prev = self.names.get(mac)
+        if prev is not None:
+            macs = self._macs_by_name[prev]
+            macs.discard(mac)
+            if not macs:
+                del self._macs_by_name[prev]
+
+        self.names[mac] = name
+        self._macs_by_name.setdefault(name, set()).add(mac)
+        self._known[mac] = name
+        self._pending[mac] = name
+        self.changed = True
+
+    def _index_sync(self):
+        """
+        Validates sync entries, and groups them by Tilt name.
+        The sync section is only changed when the config file is loaded.
+        """
+        index: dict[str, list[TiltTemperatureSync]] = {}
+
+        for src in self.sync:
+            sync_tilt = src.get('tilt')
+            sync_type = src.get('type')
+            sync_service = src.get('service')
+            sync_block = src.get('block')
+
+            if not sync_tilt \
+                    or not sync_type \
+                    or not sync_service \
+                    or not sync_block:
+                continue
+
+            index.setdefault(str(sync_tilt), []).append(TiltTemperatureSync(
+                type=str(sync_type),
+                service=str(sync_service),
+                block=str(sync_block),
+            ))
+
+        self._sync_index: dict[str, tuple[TiltTemperatureSync, ...]] = {
+            k: tuple(v) for k, v in index.items()
+        }
+
+    def sync_targets(self, name: str) -> tuple[TiltTemperatureSync, ...]:
+        """
+        Returns all valid sync entries for given Tilt name.
+        Returned objects are immutable, and shared between calls.
+        """
+        return self._sync_index.get(name, ())
+
+    def _index_filters(self):
+        """
+        Validates filter entries, and groups them by Tilt name.
+        Like sync entries, filters are only changed when the config file is loaded.
+        """
+        index: dict[str, list[TiltFilterSettings]] = {}
+
+        for src in self.filters:
+            filter_tilt = src.get('tilt')
+            filter_field = src.get('field')
+            filter_type = src.get('type')
+
+            if not filter_tilt \
+                    or filter_field not in const.FILTER_FIELDS \
+                    or filter_type not in ['ema', 'kalman']:
+                LOGGER.warning(f'Ignoring invalid filter: {dict(src)}')
+                continue
+
+            try:
+                if filter_type == 'ema':
+                    settings = TiltFilterSettings(field=filter_field,
+                                                  type=filter_type,
+                                                  alpha=float(src.get('alpha', const.FILTER_DEFAULT_ALPHA)))
+                    valid = 0 < settings.alpha <= 1
+                else:
+                    process_noise, measurement_noise = const.FILTER_DEFAULT_NOISE[filter_field]
+                    settings = TiltFilterSettings(field=filter_field,
+                                                  type=filter_type,
+                                                  process_noise=float(src.get('process_noise', process_noise)),
+                                                  measurement_noise=float(src.get('measurement_noise',
+                                                                                  measurement_noise)))
+                    valid = settings.process_noise >= 0 and settings.measurement_noise > 0
+            except (TypeError, ValueError):
+                valid = False
+
+            if not valid:
+                LOGGER.warning(f'Ignoring filter with invalid settings: {dict(src)}')
+                continue
+
+            index.setdefault(str(filter_tilt), []).append(settings)
+
+        self._filter_index: dict[str, tuple[TiltFilterSettings, ...]] = {
+            k: tuple(v) for k, v in index.items()
+        }
+
+    def filter_targets(self, name: str) -> tuple[TiltFilterSettings, ...]:
+        """
+        Returns all valid filter entries for given Tilt name.
+        Returned objects are immutable, and shared between calls.
+        """
+        return self._filter_index.get(name, ())
+
     def _assign(self, base_name: str) -> str:
-        used: set[str] = set(self.names.values())
+        used = self._macs_by_name
         if base_name not in used:
             return base_name
 
-        idx = 1
-        while idx < 1000:
+        # Suffixes are never reused, so we can continue where we left off
+        idx = self._next_suffix.get(base_name, 2)
+        while f'{base_name}-{idx}' in used:
             idx += 1
-            name = f'{base_name}-{idx}'
-            if name not in used:
-                return name
-
-        # Escape hatch for bugs
-        # If we have >1000 entries for a given base name, something went wrong
-        raise RuntimeError('Name increment attempts exhausted')  # pragma: no cover
+        self._next_suffix[base_name] = idx + 1
+        return f'{base_name}-{idx}'
 
     @property
     def names(self) -> dict[str, str]:
@@ -72,26 +213,141 @@ class DeviceConfig:
     def sync(self) -> list[dict[str, str]]:
         return self.device_config['sync']
 
+    @property
+    def filters(self) -> list[dict]:
+        # Filters are optional, and not added to the config file by default
+        return self.device_config.get('filters') or []
+
+    def _serialize(self, device_config: CommentedMap) -> str:
+        stream = StringIO()
+        self.yaml.dump(device_config, stream)
+        return stream.getvalue()
+
+    def _write(self, text: str):
+        # The replaced file keeps the permissions of the temporary file
+        utils.write_atomic(self.path, text)
+        self.path.chmod(0o666)
+
     @contextmanager
     def autocommit(self):
+        """
+        Schedules a write to file if the config changed.
+
+        If an event loop is running, changes are written after COMMIT_DELAY_S.
+        Serialization and writing are done in a worker thread.
+        Otherwise, the changes are written immediately.
+        """
         try:
             yield
         finally:
             if self.changed:
-                self.yaml.dump(self.device_config, self.path)
                 self.changed = False
+                self._dirty = True
+                self._schedule_commit()
+
+    def _schedule_commit(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._dirty = False
+            self._pending = {}
+            self.written = self._serialize(self.device_config)
+            self._write(self.written)
+            return
+
+        if self._commit_handle is None:
+            self._commit_handle = loop.call_later(COMMIT_DELAY_S, self._start_commit)
+
+    def _start_commit(self):
+        self._commit_handle = None
+        self._commit_task = asyncio.create_task(self._commit())
+
+    async def _commit(self):
+        try:
+            await self.flush()
+        except Exception as ex:
+            LOGGER.error(f'Failed to write device config: {utils.strex(ex)}')
+
+    async def flush(self):
+        """
+        Immediately writes pending changes.
+        If a write is already in progress, this waits for it to finish.
+        """
+        if self._commit_handle is not None:
+            self._commit_handle.cancel()
+            self._commit_handle = None
+
+        async with self._commit_lock:
+            while self._dirty:
+                # The file may have been edited before the file watcher reloaded it
+                # Pending changes are applied to the edited config, instead of overwriting it
+                text = await asyncio.to_thread(self.path.read_text)
+                if text != self.written:
+                    LOGGER.warning(f'`{self.path}` was edited while changes were pending. Reloading before writing.')
+                    self._reload(text, await asyncio.to_thread(YAML().load, text))
+
+                # Serialize a copy: the config may change while we're writing
+                self._dirty = False
+                snapshot = deepcopy(self.device_config)
+                text = await asyncio.to_thread(self._serialize, snapshot)
+
+                # The file may have been edited while we were serializing
+                if await asyncio.to_thread(self.path.read_text) != self.written:
+                    self._dirty = True
+                    continue
+
+                self._pending = {}
+                self.written = text
+                await asyncio.to_thread(self._write, text)
+
+    async def reload(self) -> bool:
+        """
+        Reads and parses the config file in a worker thread,
+        and then replaces the current config.
+
+        Changes written by autocommit() are ignored.
+        If a write is in progress, this waits for it to finish.
+        Returns whether the config was replaced.
+        """
+        async with self._commit_lock:
+            text = await asyncio.to_thread(self.path.read_text)
+            if text == self.written:
+                return False
+
+            # The YAML object is not thread-safe: use a new one
+            loaded = await asyncio.to_thread(YAML().load, text)
+            self._reload(text, loaded)
+            return True
+
+    def _reload(self, text: str, loaded: CommentedMap | None):
+        """
+        Replaces the current config with `loaded`.
+        Names that were changed, but not yet written, are applied again.
+        """
+        pending = self._pending
+        self._pending = {}
+        self.written = text
+        self._apply(loaded)
+
+        with self.autocommit():
+            for mac, name in pending.items():
+                self._set_name(mac, name)
 
     def lookup(self, mac: str, base_name: str) -> str:
+        name = self._known.get(mac)
+        if name is not None:
+            return name
+
         if not re.match(const.NORMALIZED_MAC_PATTERN, mac):
             raise ValueError(f'{mac} is not a normalized device MAC address.')
 
         name = self.names.get(mac)
         if name:
+            self._known[mac] = name
             return name
         else:
             name = self._assign(base_name)
-            self.names[mac] = name
-            self.changed = True
+            self._set_name(mac, name)
             LOGGER.info(f'New Tilt added: {mac}={name}')
             return name
 
@@ -104,8 +360,13 @@ class DeviceConfig:
                 LOGGER.error(f'Failed to set {mac}={name}: {name} is not a valid device name.')
             else:
                 LOGGER.info(f'Device name set: {mac}={name}')
-                self.names[mac] = name
-                self.changed = True
+                self._set_name(mac, name)
+
+
+@asynccontextmanager
+async def lifespan():
+    yield
+    await CV.get().flush()
 
 
 def setup():
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
+from pathlib import Path
+
+from .. import const, utils
+from . import calibration, devices
+
+LOGGER = logging.getLogger(__name__)
+
+# Editors often write a file in multiple steps
+# Changes are grouped until no new changes happened for this duration
+WATCH_DEBOUNCE_MS = 1000
+
+
+def watched_paths() -> set[Path]:
+    return {
+        const.SG_CAL_FILE_PATH.resolve(),
+        const.TEMP_CAL_FILE_PATH.resolve(),
+        const.DEVICES_FILE_PATH.resolve(),
+    }
+
+
+async def reload(changed: set[Path]):
+    """
+    Reloads all config files in `changed`.
+    Files are parsed in worker threads.
+    Contextvars are copied when tasks are created,
+    so we replace the content of the current objects instead of setting new ones.
+    """
+    if const.SG_CAL_FILE_PATH.resolve() in changed:
+        await calibration.SG_CAL.get().reload()
+
+    if const.TEMP_CAL_FILE_PATH.resolve() in changed:
+        await calibration.TEMP_CAL.get().reload()
+
+    if const.DEVICES_FILE_PATH.resolve() in changed:
+        if not await devices.CV.get().reload():
+            LOGGER.debug('Ignored device config change written by service')
+
+
+async def watch():
+    # Imported here to keep it out of service startup
+    from watchfiles import Change, awatch
+
+    config = utils.get_config()
+    paths = watched_paths()
+    force_polling = False
+
+    def watch_filter(change: 'Change', path: str) -> bool:
+        return change != Change.deleted and Path(path) in paths
+
+    while True:
+        try:
+            async for changes in awatch(*{p.parent for p in paths},
+                                        watch_filter=watch_filter,
+                                        debounce=WATCH_DEBOUNCE_MS,
+                                        force_polling=force_polling,
+                                        recursive=False):
+                try:
+                    await reload({Path(path) for _, path in changes})
+                except Exception as ex:
+                    LOGGER.error(f'Failed to reload config files: {utils.strex(ex)}', exc_info=config.debug)
+
+        except OSError as ex:
+            # inotify is not always available, or the number of watches may be exhausted
+            if force_polling:
+                raise
+            LOGGER.warning(f'File watcher failed: {utils.strex(ex)}. Falling back to polling.')
+            force_polling = True
+
+
+@asynccontextmanager
+async def lifespan():
+    task = asyncio.create_task(watch())
+    yield
+    task.cancel()
+    with suppress(asyncio.CancelledError):
+        await task
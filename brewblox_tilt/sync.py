@@ -0,0 +1,76 @@
+"""
+Publishes Tilt temperatures to Spark TempSensorExternal blocks.
+
+Every block patch results in a controller write by the Spark service.
+Patches are only published if the value changed, and the block was not patched recently.
+"""
+
+import logging
+from statistics import fmean
+from typing import Iterable
+
+from fastapi_mqtt import FastMQTT
+
+from . import utils
+from .models import TiltMessage, TiltTemperatureSync
+from .serialization import SyncEncoder
+
+LOGGER = logging.getLogger(__name__)
+
+SYNC_TOPIC = 'brewcast/spark/blocks/patch'
+
+
+class SyncPublisher:
+    def __init__(self) -> None:
+        config = utils.get_config()
+        self.topic = SYNC_TOPIC
+        self.deadband = max(config.sync_deadband, 0)
+        self.min_interval = max(config.sync_min_interval, 0)
+        self.refresh_interval = max(config.sync_refresh_interval, self.min_interval)
+        self.encoder = SyncEncoder()
+
+        self.sent = 0
+        self.suppressed = 0
+
+        # Last written value and timestamp, per (service, block)
+        self._last: dict[tuple[str, str], tuple[float, float]] = {}
+
+    def targets(self, messages: Iterable[TiltMessage]) -> dict[TiltTemperatureSync, float]:
+        """
+        Collects sync values for all targets in `messages`.
+        If multiple Tilts sync to the same block, their temperatures are averaged.
+        """
+        values: dict[TiltTemperatureSync, list[float]] = {}
+        for msg in messages:
+            for sync in msg.sync:
+                if sync.type == 'TempSensorExternal':
+                    values.setdefault(sync, []).append(msg.data['temperature[degC]'])
+        return {k: round(fmean(v), 2) for k, v in values.items()}
+
+    def check(self, sync: TiltTemperatureSync, value: float, now: float) -> bool:
+        """
+        Returns whether `sync` should be patched with `value`.
+        If so, `value` is recorded as last written value.
+        `now` is a monotonic timestamp in seconds.
+        """
+        key = (sync.service, sync.block)
+        last = self._last.get(key)
+
+        if last is not None:
+            last_value, timestamp = last
+            elapsed = now - timestamp
+            if elapsed < self.min_interval:
+                return False
+            if elapsed < self.refresh_interval and abs(value - last_value) <= self.deadband:
+                return False
+
+        self._last[key] = (value, now)
+        return True
+
+    def publish(self, mqtt_client: FastMQTT, messages: Iterable[TiltMessage], now: float):
+        for sync, value in self.targets(messages).items():
+            if self.check(sync, value, now):
+                self.sent += 1
+                mqtt_client.publish(self.topic, self.encoder.encode(sync, value))
+            else:
+                self.suppressed += 1
@@ -1,6 +1,8 @@
+import os
 import time
 import traceback
 from functools import lru_cache
+from pathlib import Path
 
 from .models import ServiceConfig
 
@@ -25,3 +27,36 @@ def strex(ex: Exception, tb=False):
         return f'{msg}\n\n{trace}'
     else:
         return msg
+
+
+def write_atomic(path: Path, text: str):
+    """
+    Writes to a temporary file, and then replaces `path`.
+    The file is never left half-written.
+    """
+    tmp = path.with_name(f'.{path.name}.tmp')
+    with open(tmp, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def normalize_mac(mac: str) -> str:
+    """
+    Converts a MAC address to the notation used as device key.
+    `AA:7F:97:FC:14:1E` becomes `AA7F97FC141E`.
+    """
+    return mac.strip().replace(':', '').upper()
+
+
+def round_scaled(value: float, ndigits: int) -> float:
+    """
+    Rounds `value` in the same way as np.round():
+    the value is scaled by 10**ndigits, rounded to an integer, and scaled back.
+
+    This can differ from round() for values close to halfway,
+    but gives identical results for scalar values and NumPy arrays.
+    """
+    scale = 10.0 ** ndigits
+    return round(value * scale) / scale
@@ -5,7 +5,17 @@ python3 ./parse_appenv.py "$@" >.appenv
 
 # This service does not have a REST API
 # We use the scaffolding for convenience,
-# but don't bind to a port
+# and only bind to a port if metrics are enabled
+metrics_port=$(sed -n 's/^brewblox_tilt_metrics_port=//p' .appenv)
+
+if [[ -n "${metrics_port}" && "${metrics_port}" != "0" ]]; then
+    exec uvicorn \
+        --host 0.0.0.0 \
+        --port "${metrics_port}" \
+        --factory \
+        brewblox_tilt.app_factory:create_app
+fi
+
 exec uvicorn \
     --uds /run/tilt_dummy.sock \
     --factory \
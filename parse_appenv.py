@@ -18,10 +18,44 @@ def parse_cmd_args(raw_args: list[str]) -> tuple[argparse.Namespace, list[str]]:
 
     parser.add_argument('--lower-bound')
     parser.add_argument('--upper-bound')
+    parser.add_argument('--scan-mode', choices=['continuous', 'interval'])
+    parser.add_argument('--adapters')
+    parser.add_argument('--adapter-merge', choices=['strongest', 'freshest'])
     parser.add_argument('--scan-duration')
     parser.add_argument('--active-scan-interval')
     parser.add_argument('--inactive-scan-interval')
+    parser.add_argument('--scan-window-min')
+    parser.add_argument('--scan-capture-probability')
+    parser.add_argument('--scan-backoff-max')
+    parser.add_argument('--scan-device-timeout')
+    parser.add_argument('--aggregation', choices=['last', 'mean', 'median', 'trimmed_mean'])
+    parser.add_argument('--sample-buffer-size')
+    parser.add_argument('--sg-deadband')
+    parser.add_argument('--temp-deadband')
+    parser.add_argument('--state-heartbeat-interval')
+    parser.add_argument('--sync-deadband')
+    parser.add_argument('--sync-min-interval')
+    parser.add_argument('--sync-refresh-interval')
+    parser.add_argument('--pipeline-queue-size')
+    parser.add_argument('--history-buffer-size')
+    parser.add_argument('--history-replay-batch-size')
+    parser.add_argument('--filter-checkpoint-interval')
+    parser.add_argument('--analytics-slope-window')
+    parser.add_argument('--analytics-checkpoint-interval')
+    parser.add_argument('--metrics-port')
+    parser.add_argument('--cluster', action='store_true')
+    parser.add_argument('--cluster-node')
+    parser.add_argument('--cluster-hysteresis')
+    parser.add_argument('--cluster-timeout')
     parser.add_argument('--simulate', nargs='*')
+    parser.add_argument('--simulate-load')
+    parser.add_argument('--simulate-load-rate')
+    parser.add_argument('--simulate-load-ibeacon-rate')
+    parser.add_argument('--simulate-load-malformed-rate')
+    parser.add_argument('--simulate-load-time-scale')
+    parser.add_argument('--record')
+    parser.add_argument('--replay')
+    parser.add_argument('--replay-speed')
 
     return parser.parse_known_args(raw_args)
 
@@ -34,10 +68,14 @@ if __name__ == '__main__':
               for k, v in vars(args).items()
               if v is not None
               and v is not False
-              and k != 'simulate']
+              and k not in ['simulate', 'adapters']]
     print(*output, sep='\n')
 
     # Special exception for list variables
     if args.simulate:
         sim_names = json.dumps(list(args.simulate))
         print(f"brewblox_tilt_simulate='{sim_names}'")
+
+    if args.adapters:
+        adapter_names = json.dumps([name.strip() for name in args.adapters.split(',') if name.strip()])
+        print(f"brewblox_tilt_adapters='{adapter_names}'")
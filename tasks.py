@@ -18,6 +18,16 @@ def testclean(ctx: Context):
         ctx.run(f'docker rm -f {containers}')
 
 
+@task
+def bench(ctx: Context):
+    """
+    Runs all benchmarks in the benchmarks/ directory.
+    """
+    with ctx.cd(ROOT):
+        for f in sorted(ROOT.glob('benchmarks/bench_*.py')):
+            ctx.run(f'python -m benchmarks.{f.stem}')
+
+
 @task
 def build(ctx: Context):
     with ctx.cd(ROOT):
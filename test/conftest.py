@@ -18,7 +18,7 @@ from pytest_docker.plugin import Services as DockerServices
 from starlette.testclient import TestClient
 
 from brewblox_tilt import app_factory, const, utils
-from brewblox_tilt.models import ServiceConfig
+from brewblox_tilt.models import ServiceConfig, TiltMessage, TiltTemperatureSync
 
 LOGGER = logging.getLogger(__name__)
 
@@ -44,6 +44,21 @@ class TestConfig(ServiceConfig):
         return (init_settings,)
 
 
+def tilt_message(data: dict,
+                 mac: str = 'AA7F97FC141E',
+                 name: str = 'Red',
+                 sync: tuple[TiltTemperatureSync, ...] = (),
+                 ) -> TiltMessage:
+    """
+    Creates a parsed message with given data.
+    """
+    return TiltMessage(name=name,
+                       mac=mac,
+                       color='Red',
+                       data=data,
+                       sync=sync)
+
+
 @pytest.fixture(autouse=True)
 def config(monkeypatch: pytest.MonkeyPatch,
            docker_services: DockerServices,
@@ -160,10 +175,34 @@ def tempcal_file(monkeypatch: pytest.MonkeyPatch) -> FileIO:
     yield f
 
 
+@pytest.fixture
+def history_buffer_file(monkeypatch: pytest.MonkeyPatch, config_dir: TemporaryDirectory) -> Path:
+    path = Path(config_dir.name, 'history_buffer.sqlite')
+    monkeypatch.setattr(const, 'HISTORY_BUFFER_PATH', path)
+    yield path
+
+
+@pytest.fixture
+def filter_state_file(monkeypatch: pytest.MonkeyPatch, config_dir: TemporaryDirectory) -> Path:
+    path = Path(config_dir.name, 'filter_state.json')
+    monkeypatch.setattr(const, 'FILTER_STATE_PATH', path)
+    yield path
+
+
+@pytest.fixture
+def analytics_state_file(monkeypatch: pytest.MonkeyPatch, config_dir: TemporaryDirectory) -> Path:
+    path = Path(config_dir.name, 'analytics_state.json')
+    monkeypatch.setattr(const, 'ANALYTICS_STATE_PATH', path)
+    yield path
+
+
 @pytest.fixture
 def tempfiles(monkeypatch: pytest.MonkeyPatch,
               sgcal_file: FileIO,
               tempcal_file: FileIO,
               devices_file: FileIO,
+              history_buffer_file: Path,
+              filter_state_file: Path,
+              analytics_state_file: Path,
               config_dir: TemporaryDirectory):
     return
@@ -0,0 +1,43 @@
+"""
+Tests brewblox_tilt.aggregation
+"""
+
+import pytest
+
+from brewblox_tilt import aggregation
+
+TESTED = aggregation.__name__
+
+
+def test_reducers():
+    values = [1.0, 1.1, 1.2, 1.3, 10.0]
+    assert aggregation.reduce_last(values) == 10.0
+    assert aggregation.reduce_mean(values) == pytest.approx(2.92)
+    assert aggregation.reduce_median(values) == 1.2
+    assert aggregation.reduce_trimmed_mean(values) == pytest.approx(1.2)
+
+    for reducer in aggregation.REDUCERS.values():
+        assert reducer([5.0]) == 5.0
+
+
+def test_sample_buffer():
+    buffer = aggregation.SampleBuffer('AA7F97FC141E', 'uuid-1', 3)
+    assert buffer.drain() == []
+
+    buffer.append('uuid-1', 68, 1050, 0, -80)
+    buffer.append('uuid-1', 69, 1051, -1, -81)
+    [evt1, evt2] = buffer.drain()
+    assert (evt1.major, evt1.minor, evt1.txpower, evt1.rssi) == (68, 1050, 0, -80)
+    assert (evt2.major, evt2.minor, evt2.txpower, evt2.rssi) == (69, 1051, -1, -81)
+    assert buffer.count == 0
+
+    # Oldest samples are overwritten
+    major = buffer.major
+    for i in range(5):
+        buffer.append('uuid-2', 60 + i, 1000 + i, 0, -80)
+    events = buffer.drain()
+    assert [evt.major for evt in events] == [62, 63, 64]
+    assert [evt.uuid for evt in events] == ['uuid-2'] * 3
+
+    # Storage is reused
+    assert buffer.major is major
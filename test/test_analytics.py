@@ -0,0 +1,147 @@
+"""
+Tests brewblox_tilt.analytics
+"""
+
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from brewblox_tilt import analytics, mqtt
+from brewblox_tilt.models import ServiceConfig
+
+from .conftest import tilt_message
+
+TESTED = analytics.__name__
+
+DAY = analytics.SECONDS_PER_DAY
+
+
+@pytest.fixture
+def app(tempfiles, config: ServiceConfig) -> FastAPI:
+    config.analytics_slope_window = 2 * DAY
+    mqtt.setup()
+    analytics.setup()
+    return FastAPI(lifespan=lambda app: mqtt.lifespan())
+
+
+def test_slope():
+    device = analytics.DeviceAnalytics()
+    assert device.slope() is None
+
+    device.add(0, 1.050, DAY)
+    assert device.slope() is None
+
+    device.add(DAY / 2, 1.045, DAY)
+    device.add(DAY, 1.040, DAY)
+    assert device.slope() == pytest.approx(-0.01)
+
+    # Old measurements leave the window
+    device.add(2 * DAY, 1.038, DAY)
+    assert len(device.window) == 2
+    assert device.slope() == pytest.approx(-0.002)
+
+    # Running sums match a fresh computation
+    fresh = analytics.DeviceAnalytics()
+    fresh.epoch = device.epoch
+    for t, sg in device.window:
+        fresh.add(t * DAY, sg, DAY)
+    assert device.slope() == pytest.approx(fresh.slope())
+
+
+def test_update(app: FastAPI):
+    state = analytics.CV.get()
+
+    assert state.update([tilt_message({'specificGravity': 1.050})], 0) == {
+        'AA7F97FC141E': {
+            'originalGravity': 1.050,
+            'apparentAttenuation[%]': 0,
+            'abv[%]': 0,
+        },
+    }
+    assert state.dirty
+
+    # Original gravity is the highest median of recent measurements
+    state.update([tilt_message({'specificGravity': 1.052})], DAY / 4)
+    fields = state.update([tilt_message({'specificGravity': 1.052})], DAY / 2)
+    assert fields['AA7F97FC141E']['originalGravity'] == 1.052
+    fields = state.update([tilt_message({'specificGravity': 1.026})], DAY)
+    assert fields['AA7F97FC141E'] == {
+        'originalGravity': 1.052,
+        'apparentAttenuation[%]': 50.0,
+        'abv[%]': 3.41,
+        'specificGravityRate[1/day]': pytest.approx(-0.024, abs=0.005),
+    }
+
+    # Filtered gravity is used if available
+    fields = state.update([tilt_message({'specificGravity': 1.020, 'filteredSpecificGravity': 1.026})], DAY * 1.5)
+    assert fields['AA7F97FC141E']['abv[%]'] == 3.41
+
+    # Reset: the next measurement becomes the original gravity
+    state.set_original_gravity({'AA7F97FC141E': None, 'invalid': 1.050})
+    fields = state.update([tilt_message({'specificGravity': 1.020})], DAY * 2)
+    assert fields['AA7F97FC141E']['originalGravity'] == 1.020
+
+    state.set_original_gravity({'AA7F97FC141E': 1.060})
+    fields = state.update([tilt_message({'specificGravity': 1.030})], DAY * 2.5)
+    assert fields['AA7F97FC141E']['apparentAttenuation[%]'] == 50.0
+
+
+def test_original_gravity_outliers(app: FastAPI):
+    state = analytics.CV.get()
+
+    for idx, sg in enumerate([1.050, 1.051, 1.050]):
+        state.update([tilt_message({'specificGravity': sg})], idx * 60)
+    assert state.devices['AA7F97FC141E'].og == 1.050
+
+    # A single outlier does not raise original gravity
+    fields = state.update([tilt_message({'specificGravity': 1.120})], 180)
+    assert fields['AA7F97FC141E']['originalGravity'] == 1.050
+    fields = state.update([tilt_message({'specificGravity': 1.049})], 240)
+    assert fields['AA7F97FC141E']['originalGravity'] == 1.050
+
+    # A sustained rise does
+    for idx in range(3):
+        fields = state.update([tilt_message({'specificGravity': 1.055})], 300 + idx * 60)
+    assert fields['AA7F97FC141E']['originalGravity'] == 1.055
+
+
+async def test_checkpoint(app: FastAPI, analytics_state_file: Path):
+    state = analytics.CV.get()
+
+    async with analytics.lifespan():
+        state.update([tilt_message({'specificGravity': 1.050})], 0)
+        state.update([tilt_message({'specificGravity': 1.040}, mac='BB7F97FC141E')], 0)
+
+    assert not state.dirty
+    assert json.loads(analytics_state_file.read_text()) == {
+        'AA7F97FC141E': {'og': 1.050},
+        'BB7F97FC141E': {'og': 1.040},
+    }
+
+    restored = analytics.FermentationAnalytics(analytics_state_file, DAY, 60)
+    restored.read()
+    fields = restored.update([tilt_message({'specificGravity': 1.040})], DAY)
+    assert fields['AA7F97FC141E']['originalGravity'] == 1.050
+
+    analytics_state_file.write_text('invalid')
+    restored.read()
+    assert restored.devices == {}
+
+
+async def test_original_gravity_command(client: TestClient):
+    state = analytics.CV.get()
+    state.update([tilt_message({'specificGravity': 1.050})], 0)
+
+    mqtt.CV.get().publish('brewcast/tilt/tilt/original_gravity', json.dumps({'AA7F97FC141E': 1.060}))
+    mqtt.CV.get().publish('brewcast/tilt/tilt/original_gravity', 'invalid')
+
+    for _ in range(50):
+        if state.devices['AA7F97FC141E'].og == 1.060:
+            break
+        await asyncio.sleep(0.1)
+
+    assert state.devices['AA7F97FC141E'].og == 1.060
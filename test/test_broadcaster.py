@@ -2,15 +2,20 @@
 Tests brewblox_tilt.broadcaster
 """
 
+import asyncio
+import json
+import time
 from contextlib import AsyncExitStack, asynccontextmanager
-from unittest.mock import ANY, Mock
+from unittest.mock import ANY, Mock, PropertyMock, call
 
 import pytest
 from fastapi import FastAPI
 from pytest_mock import MockerFixture
 from starlette.testclient import TestClient
 
-from brewblox_tilt import broadcaster, mqtt, parser, scanner
+from brewblox_tilt import (analytics, broadcaster, cluster, const, filters, history_buffer, metrics, mqtt, parser,
+                           pipeline, scanner, startup)
+from brewblox_tilt.models import ServiceConfig, TiltEvent
 from brewblox_tilt.stored import calibration, devices
 
 
@@ -18,16 +23,23 @@ from brewblox_tilt.stored import calibration, devices
 async def lifespan(app: FastAPI):
     async with AsyncExitStack() as stack:
         await stack.enter_async_context(mqtt.lifespan())
+        await stack.enter_async_context(history_buffer.lifespan())
         yield
 
 
 @pytest.fixture
 def app(tempfiles) -> FastAPI:
     mqtt.setup()
+    history_buffer.setup()
+    cluster.setup()
     calibration.setup()
     devices.setup()
     parser.setup()
+    filters.setup()
+    analytics.setup()
     scanner.setup()
+    metrics.setup()
+    startup.setup()
     app = FastAPI(lifespan=lifespan)
     return app
 
@@ -38,74 +50,229 @@ def m_publish(app: FastAPI, mocker: MockerFixture) -> Mock:
     return m
 
 
+def assert_published(m: Mock, topic: str, payload: dict, **kwargs):
+    # Payloads are published as encoded JSON
+    calls = [call(c.args[0], json.loads(c.args[1]), **c.kwargs)
+             for c in m.call_args_list]
+    assert call(topic, payload, **kwargs) in calls
+
+
+def device_data() -> dict:
+    return {
+        'temperature[degF]': ANY,
+        'temperature[degC]': ANY,
+        'specificGravity': ANY,
+        'plato[degP]': ANY,
+        'rssi[dBm]': ANY,
+    }
+
+
+def state_data() -> dict:
+    # First measurement: gravity is the original gravity
+    return {
+        **device_data(),
+        'originalGravity': ANY,
+        'apparentAttenuation[%]': 0,
+        'abv[%]': 0,
+    }
+
+
 async def test_run(client: TestClient, m_publish: Mock):
     bc = broadcaster.Broadcaster()
     await bc.run()
 
     # Generic state, history, and two devices
     assert m_publish.call_count == 4
+    assert bc.scheduler.devices.keys() == {'A495BB80C5B1', 'A495BB50C5B1'}
+
+    assert_published(m_publish, 'brewcast/state/tilt',
+                     {
+                         'key': 'tilt',
+                         'type': 'Tilt.state.service',
+                         'timestamp': ANY,
+                     },
+                     retain=True)
+
+    assert_published(m_publish, 'brewcast/history/tilt',
+                     {
+                         'key': 'tilt',
+                         'data': {
+                             'Pink': device_data(),
+                             'Orange': device_data(),
+                         }
+                     })
+
+    assert_published(m_publish, 'brewcast/state/tilt/Pink/A495BB80C5B1',
+                     {
+                         'key': 'tilt',
+                         'type': 'Tilt.state',
+                         'timestamp': ANY,
+                         'color': 'Pink',
+                         'mac': 'A495BB80C5B1',
+                         'name': 'Pink',
+                         'samples': 1,
+                         'data': state_data(),
+                     },
+                     retain=True)
+
+    assert_published(m_publish, 'brewcast/state/tilt/Orange/A495BB50C5B1',
+                     {
+                         'key': 'tilt',
+                         'type': 'Tilt.state',
+                         'timestamp': ANY,
+                         'color': 'Orange',
+                         'mac': 'A495BB50C5B1',
+                         'name': 'Orange',
+                         'samples': 1,
+                         'data': state_data(),
+                     },
+                     retain=True)
+
+
+async def test_run_unchanged(client: TestClient, m_publish: Mock, mocker: MockerFixture):
+    bc = broadcaster.Broadcaster()
+    messages = await scanner.CV.get().scan(0)
+    mocker.patch.object(scanner.CV.get(), 'scan', autospec=True, return_value=messages)
+
+    await bc.run()
+    assert m_publish.call_count == 4
+
+    # Device state is not published again if values did not change
+    m_publish.reset_mock()
+    await bc.run()
+    assert m_publish.call_count == 2
+    assert bc.state_filter.suppressed == 2
+
+    # Heartbeat
+    m_publish.reset_mock()
+    bc.state_filter.heartbeat = 0
+    await bc.run()
+    assert m_publish.call_count == 4
+
+
+async def test_cluster(client: TestClient, m_publish: Mock, mocker: MockerFixture):
+    coordinator = cluster.CV.get()
+    mocker.patch.object(coordinator, 'enabled', True)
+    bc = broadcaster.Broadcaster()
+
+    # Pink is owned by another node, with a better signal
+    coordinator.receive({'node': 'remote', 'devices': {'A495BB80C5B1': 0}, 'owned': ['A495BB80C5B1']},
+                        time.monotonic())
+    await bc.run()
+
+    # Generic state, sightings, history, and a single device
+    assert m_publish.call_count == 4
+
+    assert_published(m_publish, coordinator.topic,
+                     {
+                         'node': coordinator.node,
+                         'devices': {'A495BB80C5B1': ANY, 'A495BB50C5B1': ANY},
+                         'owned': ['A495BB50C5B1'],
+                     })
+
+    assert_published(m_publish, 'brewcast/history/tilt',
+                     {
+                         'key': 'tilt',
+                         'data': {
+                             'Orange': device_data(),
+                         }
+                     })
+
+
+async def test_stages(client: TestClient, config: ServiceConfig, m_publish: Mock):
+    config.active_scan_interval = 0
+    bc = broadcaster.Broadcaster()
+
+    # Scanning continues if publishing falls behind
+    await bc.scan_step()
+    await bc.scan_step()
+    await bc.scan_step()
+    assert len(bc.events) == 6
+
+    await bc.parse_step()
+    assert len(bc.messages) == 2
+    await bc.parse_step()
+    await bc.parse_step()
+    assert len(bc.events) == 0
+    assert len(bc.messages) == 6
+
+    await bc.publish_step()
+    assert m_publish.call_count == 4
+    assert len(bc.messages) == 4
+
+    # Presence is published if no devices are detected
+    m_publish.reset_mock()
+    bc.messages.get_nowait()
+    bc.messages.get_nowait()
+    bc.presence_timeout = 0.01
+    await bc.publish_step()
+    assert m_publish.call_count == 1
+
+
+async def test_stages_mac(client: TestClient, config: ServiceConfig, mocker: MockerFixture):
+    config.active_scan_interval = 0
+    bc = broadcaster.Broadcaster()
+    uuid = next(iter(const.TILT_UUID_COLORS))
+    mocker.patch.object(scanner.CV.get(), 'collect', autospec=True, return_value=[
+        TiltEvent(mac='AA:7F:97:FC:14:1E', uuid=uuid, major=68, minor=1002, txpower=0, rssi=-80),
+        TiltEvent(mac='aa7f97fc141e', uuid=uuid, major=68, minor=1002, txpower=0, rssi=-80),
+    ])
+
+    # Devices are known by the same MAC in all stages
+    await bc.scan_step()
+    assert bc.scheduler.devices.keys() == {'AA7F97FC141E'}
+    assert bc.scheduler.devices['AA7F97FC141E'].observations == 1
+
+    await bc.parse_step()
+    messages = bc.messages.get_nowait()
+    assert [msg.mac for msg in messages] == ['AA7F97FC141E']
+    assert messages[0].samples == 2
+
+
+async def test_stage_errors(client: TestClient, config: ServiceConfig, mocker: MockerFixture):
+    config.active_scan_interval = 0
+    config.pipeline_queue_size = 2
+    bc = broadcaster.Broadcaster()
+    mocker.patch.object(mqtt.CV.get(), 'publish', side_effect=RuntimeError('broker down'))
+
+    tasks = [
+        asyncio.create_task(pipeline.run_stage('Scan', bc.scan_step)),
+        asyncio.create_task(pipeline.run_stage('Parse', bc.parse_step)),
+        asyncio.create_task(pipeline.run_stage('Publish', bc.publish_step)),
+    ]
+    await asyncio.sleep(0.5)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Publishing is backing off, but readings keep coming in
+    # The oldest readings are dropped
+    assert bc.messages.dropped > 0
+    assert len(bc.messages) == 2 * bc.messages.size
+
+
+async def test_history_buffer(client: TestClient, m_publish: Mock, mocker: MockerFixture):
+    bc = broadcaster.Broadcaster()
+    buffer = history_buffer.CV.get()
+    m_connected = mocker.patch.object(type(mqtt.CV.get().client), 'is_connected',
+                                      new_callable=PropertyMock, return_value=False)
+
+    # History is buffered while disconnected
+    await bc.run()
+    await bc.run()
+    assert buffer.count == 2
+    assert 'brewcast/history/tilt' not in [c.args[0] for c in m_publish.call_args_list]
+
+    # Buffered history is published after reconnecting
+    # Live history is buffered until replay is done
+    m_connected.return_value = True
+    m_publish.reset_mock()
+    await bc.run()
+    assert buffer.count == 0
 
-    m_publish.assert_any_call('brewcast/state/tilt',
-                              {
-                                  'key': 'tilt',
-                                  'type': 'Tilt.state.service',
-                                  'timestamp': ANY,
-                              },
-                              retain=True)
-
-    m_publish.assert_any_call('brewcast/history/tilt',
-                              {
-                                  'key': 'tilt',
-                                  'data': {
-                                      'Pink': {
-                                          'temperature[degF]': ANY,
-                                          'temperature[degC]': ANY,
-                                          'specificGravity': ANY,
-                                          'plato[degP]': ANY,
-                                          'rssi[dBm]': ANY,
-                                      },
-                                      'Orange': {
-                                          'temperature[degF]': ANY,
-                                          'temperature[degC]': ANY,
-                                          'specificGravity': ANY,
-                                          'plato[degP]': ANY,
-                                          'rssi[dBm]': ANY,
-                                      }
-                                  }
-                              })
-
-    m_publish.assert_any_call('brewcast/state/tilt/Pink/A495BB80C5B1',
-                              {
-                                  'key': 'tilt',
-                                  'type': 'Tilt.state',
-                                  'timestamp': ANY,
-                                  'color': 'Pink',
-                                  'mac': 'A495BB80C5B1',
-                                  'name': 'Pink',
-                                  'data': {
-                                      'temperature[degF]': ANY,
-                                      'temperature[degC]': ANY,
-                                      'specificGravity': ANY,
-                                          'plato[degP]': ANY,
-                                          'rssi[dBm]': ANY,
-                                  }
-                              },
-                              retain=True)
-
-    m_publish.assert_any_call('brewcast/state/tilt/Orange/A495BB50C5B1',
-                              {
-                                  'key': 'tilt',
-                                  'type': 'Tilt.state',
-                                  'timestamp': ANY,
-                                  'color': 'Orange',
-                                  'mac': 'A495BB50C5B1',
-                                  'name': 'Orange',
-                                  'data': {
-                                      'temperature[degF]': ANY,
-                                      'temperature[degC]': ANY,
-                                      'specificGravity': ANY,
-                                          'plato[degP]': ANY,
-                                          'rssi[dBm]': ANY,
-                                  }
-                              },
-                              retain=True)
+    history = [json.loads(c.args[1])
+               for c in m_publish.call_args_list
+               if c.args[0] == 'brewcast/history/tilt']
+    assert len(history) == 3
+    timestamps = [msg['timestamp'] for msg in history]
+    assert timestamps == sorted(timestamps)
@@ -2,6 +2,7 @@
 Tests brewblox_tilt.stored.calibration
 """
 
+import numpy as np
 import pytest
 
 from brewblox_tilt.stored import calibration
@@ -16,9 +17,9 @@ def setup(tempfiles):
 
 def test_calibrator():
     calibrator = calibration.SG_CAL.get()
-    assert 'black' in calibrator.cal_polys
-    assert 'ferment 1 red' in calibrator.cal_polys
-    assert calibrator.cal_polys['black'].order == 3
+    assert 'black' in calibrator.evaluators
+    assert 'ferment 1 red' in calibrator.evaluators
+    assert calibrator.calibration_key(['Dummy', 'Black']) == 'black'
 
     cal_black_v = calibrator.calibrated_value(['Dummy', 'Black'], 1.002, 3)
     assert cal_black_v == pytest.approx(2, 0.1)
@@ -27,3 +28,42 @@ def test_calibrator():
     assert cal_red_v == pytest.approx(3, 0.1)
 
     assert calibrator.calibrated_value(['Dummy'], 1.002, 3) is None
+
+
+def test_compile_poly():
+    for coefs in [[1.5, -2, 0.25, 3], [2, 1], [0.5, 0, 0, 0, 1]]:
+        poly = np.poly1d(coefs)
+        evaluate = calibration.compile_poly(coefs)
+        for x in [-2, 0, 1.002, 68, 1000]:
+            assert evaluate(x) == pytest.approx(poly(x))
+        assert evaluate(np.array([0, 1.002, 68])) == pytest.approx(poly(np.array([0, 1.002, 68])))
+
+
+def test_calibrated_values():
+    calibrator = calibration.SG_CAL.get()
+    values = np.array([1.002, 1.002, 1.002, 1.003])
+    keys = [
+        ['AA7F97FC141E', 'Black'],
+        ['AA7F97FC141E', 'Ferment 1 red'],
+        ['AA7F97FC141E', 'Dummy'],
+        ['BLACK'],
+    ]
+    calibrated = calibrator.calibrated_values(keys, values)
+    assert calibrated[0] == pytest.approx(calibrator.calibrated_value(keys[0], 1.002, 6))
+    assert calibrated[1] == pytest.approx(calibrator.calibrated_value(keys[1], 1.002, 6))
+    assert np.isnan(calibrated[2])
+    assert calibrated[3] == pytest.approx(calibrator.calibrated_value(keys[3], 1.003, 6))
+
+
+def test_resolve_cache(monkeypatch: pytest.MonkeyPatch):
+    calibrator = calibration.SG_CAL.get()
+    assert calibrator.calibration_key(('AA7F97FC141E', 'Black')) == 'black'
+    assert calibrator.calibration_key(('AA7F97FC141E', 'Renamed')) is None
+    assert calibrator._resolved == {
+        ('AA7F97FC141E', 'Black'): 'black',
+        ('AA7F97FC141E', 'Renamed'): None,
+    }
+
+    monkeypatch.setattr(calibration, 'RESOLVE_CACHE_SIZE', 2)
+    assert calibrator.calibration_key(['Ferment 1 red']) == 'ferment 1 red'
+    assert calibrator._resolved == {('Ferment 1 red',): 'ferment 1 red'}
@@ -0,0 +1,26 @@
+"""
+Tests brewblox_tilt.capture
+"""
+
+from pathlib import Path
+
+from brewblox_tilt import capture
+
+TESTED = capture.__name__
+
+
+def test_capture(tmp_path: Path):
+    path = tmp_path / 'sub' / 'capture.jsonl'
+    records = [
+        capture.CaptureRecord(2.5, 'AA:7F:97:FC:14:1E', {0x004C: b'\x02\x15\x01'}, -80),
+        capture.CaptureRecord(1.0, 'BB:7F:97:FC:14:1E', {}, -70),
+        capture.CaptureRecord(2.0, 'BB:7F:97:FC:14:1E', {0x0059: b'', 0x004C: b'\xff'}, -60),
+    ]
+
+    capture.write_capture(path, records[:2])
+    with capture.CaptureWriter(path) as writer:
+        writer.write(records[2])
+    assert writer.count == 1
+
+    # Records are sorted by timestamp
+    assert capture.read_capture(path) == [records[1], records[2], records[0]]
@@ -0,0 +1,114 @@
+"""
+Tests brewblox_tilt.cluster
+"""
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from unittest.mock import ANY, Mock
+
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from brewblox_tilt import cluster, mqtt
+from brewblox_tilt.models import ServiceConfig
+
+from .conftest import tilt_message
+
+TESTED = cluster.__name__
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with mqtt.lifespan():
+        yield
+
+
+@pytest.fixture
+def app(config: ServiceConfig) -> FastAPI:
+    config.cluster = True
+    config.cluster_node = 'local'
+    config.cluster_hysteresis = 5
+    config.cluster_timeout = 60
+    mqtt.setup()
+    cluster.setup()
+    return FastAPI(lifespan=lifespan)
+
+
+def sightings(node: str, devices: dict[str, float], owned: list[str] = []) -> dict:
+    return {'node': node, 'devices': devices, 'owned': owned}
+
+
+def test_elect(app: FastAPI):
+    coordinator = cluster.CV.get()
+    assert coordinator.elect('AA', 0) is None
+
+    # Best RSSI wins if nobody claims the device
+    coordinator.receive(sightings('remote1', {'AA': -70}), 0)
+    coordinator.receive(sightings('remote2', {'AA': -66}), 0)
+    assert coordinator.elect('AA', 0) == 'remote2'
+
+    # Claimed devices only change owner if RSSI is better by more than the hysteresis
+    coordinator.receive(sightings('remote1', {'AA': -70}, ['AA']), 0)
+    assert coordinator.elect('AA', 0) == 'remote1'
+    coordinator.receive(sightings('remote2', {'AA': -64}), 0)
+    assert coordinator.elect('AA', 0) == 'remote2'
+
+    # Conflicting claims are resolved the same way by all nodes
+    coordinator.receive(sightings('remote2', {'AA': -70}, ['AA']), 0)
+    assert coordinator.elect('AA', 0) == 'remote2'
+
+    # Sightings expire
+    coordinator.receive(sightings('remote1', {'AA': -70}, ['AA']), 30)
+    assert coordinator.elect('AA', 70) == 'remote1'
+    assert coordinator.elect('AA', 100) is None
+    assert coordinator.sightings['AA'] == {}
+
+
+def test_update(app: FastAPI):
+    coordinator = cluster.CV.get()
+    client = Mock()
+    messages = [tilt_message({'rssi[dBm]': -80}, mac='AA'),
+                tilt_message({'rssi[dBm]': -70}, mac='BB')]
+
+    coordinator.receive(sightings('remote', {'BB': -50}, ['BB']), 0)
+    owned = coordinator.update(client, messages, 0)
+    assert [msg.mac for msg in owned] == ['AA']
+    assert coordinator.owned == 1
+    assert coordinator.skipped == 1
+    assert json.loads(client.publish.call_args.args[1]) == sightings('local', {'AA': -80, 'BB': -70}, ['AA'])
+
+    # The local node keeps its claim until another node is better by more than the hysteresis
+    coordinator.receive(sightings('remote', {'AA': -76, 'BB': -50}), 1)
+    owned = coordinator.update(client, messages, 1)
+    assert [msg.mac for msg in owned] == ['AA']
+
+    coordinator.receive(sightings('remote', {'AA': -70, 'BB': -50}), 2)
+    owned = coordinator.update(client, messages, 2)
+    assert owned == []
+    assert json.loads(client.publish.call_args.args[1]) == sightings('local', {'AA': -80, 'BB': -70}, [])
+
+    # Sightings are not published if there are no messages
+    client.reset_mock()
+    assert coordinator.update(client, [], 3) == []
+    assert client.publish.call_count == 0
+
+
+async def test_sightings(client: TestClient):
+    coordinator = cluster.CV.get()
+    mqtt_client = mqtt.CV.get()
+
+    mqtt_client.publish(coordinator.topic, json.dumps(sightings('remote', {'AA': -60}, ['AA'])))
+    mqtt_client.publish(coordinator.topic, 'invalid')
+
+    # Own sightings are ignored
+    coordinator.update(mqtt_client, [tilt_message({'rssi[dBm]': -70}, mac='BB')], 0)
+
+    for _ in range(50):
+        if 'AA' in coordinator.sightings:
+            break
+        await asyncio.sleep(0.1)
+
+    assert coordinator.sightings['AA'] == {'remote': (-60, ANY, True)}
+    assert coordinator.sightings['BB'] == {'local': (-70, 0, True)}
@@ -0,0 +1,50 @@
+"""
+Tests brewblox_tilt.deadband
+"""
+
+from brewblox_tilt import deadband
+
+from .conftest import tilt_message
+
+TESTED = deadband.__name__
+
+DATA = {
+    'specificGravity': 1.05,
+    'temperature[degC]': 20.0,
+    'rssi[dBm]': -80,
+}
+
+
+def test_deadband():
+    fltr = deadband.DeadbandFilter({'specificGravity': 0.001, 'temperature[degC]': 0.1}, heartbeat=60)
+
+    assert fltr.check(tilt_message(DATA), 0)
+    assert not fltr.check(tilt_message(DATA), 1)
+    assert not fltr.check(tilt_message({**DATA, 'specificGravity': 1.0505, 'temperature[degC]': 20.05}), 2)
+
+    # Changes are compared to the last published value
+    assert fltr.check(tilt_message({**DATA, 'specificGravity': 1.0515}), 3)
+    assert not fltr.check(tilt_message({**DATA, 'specificGravity': 1.051}), 4)
+    assert fltr.check(tilt_message({**DATA, 'temperature[degC]': 20.2}), 5)
+
+    # Renamed devices are always published
+    assert fltr.check(tilt_message({**DATA, 'temperature[degC]': 20.2}, name='Pinky'), 6)
+
+    # Heartbeat
+    assert not fltr.check(tilt_message({**DATA, 'temperature[degC]': 20.2}, name='Pinky'), 65)
+    assert fltr.check(tilt_message({**DATA, 'temperature[degC]': 20.2}, name='Pinky'), 66)
+
+    # Devices are filtered separately
+    assert fltr.check(tilt_message({}, mac='BB7F97FC141E'), 66)
+
+    assert fltr.published == 6
+    assert fltr.suppressed == 4
+
+
+def test_deadband_disabled():
+    fltr = deadband.DeadbandFilter({'specificGravity': 0, 'temperature[degC]': 0}, heartbeat=60)
+    assert fltr.check(tilt_message(DATA), 0)
+    assert not fltr.check(tilt_message(DATA), 1)
+    assert fltr.check(tilt_message({**DATA, 'specificGravity': 1.0501}), 2)
+    assert fltr.check(tilt_message({**DATA, 'specificGravity': None}), 3)
+    assert not fltr.check(tilt_message({**DATA, 'specificGravity': None}), 4)
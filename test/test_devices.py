@@ -2,14 +2,19 @@
 Tests brewblox_tilt.stored.devices
 """
 
+import asyncio
 import json
+import threading
+from dataclasses import FrozenInstanceError
 from io import FileIO
+from pathlib import Path
 from tempfile import NamedTemporaryFile
 
 import pytest
 from pytest_mock import MockerFixture
 
 from brewblox_tilt import mqtt
+from brewblox_tilt.models import TiltFilterSettings, TiltTemperatureSync
 from brewblox_tilt.stored import devices
 
 TESTED = devices.__name__
@@ -118,3 +123,215 @@ def test_autocommit(devices_file: FileIO, mocker: MockerFixture):
         **default_names(),
         'FF7F97FC141E': 'Red 2',
     }
+
+
+async def test_autocommit_async(devices_file: FileIO, mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(devices, 'COMMIT_DELAY_S', 0.05)
+    registry = devices.DeviceConfig(devices_file.name)
+    mocker.patch.object(registry, 'yaml', wraps=registry.yaml)
+
+    # Multiple changes are combined in a single write
+    with registry.autocommit():
+        registry.lookup('FF7F97FC141E', 'Red 2')
+    with registry.autocommit():
+        registry.lookup('FE7F97FC141E', 'Red 3')
+
+    assert registry.yaml.dump.call_count == 0
+    assert devices.DeviceConfig(devices_file.name).names == default_names()
+
+    await asyncio.sleep(0.2)
+    assert registry.yaml.dump.call_count == 1
+    assert devices.DeviceConfig(devices_file.name).names == {
+        **default_names(),
+        'FF7F97FC141E': 'Red 2',
+        'FE7F97FC141E': 'Red 3',
+    }
+
+    # Pending changes are written on flush
+    with registry.autocommit():
+        registry.lookup('FD7F97FC141E', 'Red 4')
+    await registry.flush()
+    assert registry.yaml.dump.call_count == 2
+    assert 'FD7F97FC141E' in devices.DeviceConfig(devices_file.name).names
+
+    # Nothing pending
+    await registry.flush()
+    await asyncio.sleep(0.1)
+    assert registry.yaml.dump.call_count == 2
+
+    # No temporary files are left behind
+    assert not Path(devices_file.name).with_name(f'.{Path(devices_file.name).name}.tmp').exists()
+
+
+async def test_flush_edited(devices_file: FileIO, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(devices, 'COMMIT_DELAY_S', 10)
+    registry = devices.DeviceConfig(devices_file.name)
+    path = Path(devices_file.name)
+
+    with registry.autocommit():
+        registry.lookup('FF7F97FC141E', 'Red 2')
+
+    # The file is edited before pending changes are written
+    path.write_text(json.dumps({'names': {'AA7F97FC141E': 'Edited'}}))
+    await registry.flush()
+
+    expected = {
+        'AA7F97FC141E': 'Edited',
+        'FF7F97FC141E': 'Red 2',
+    }
+    assert registry.names == expected
+    assert devices.DeviceConfig(path).names == expected
+
+    # The file watcher reloads the file before pending changes are written
+    with registry.autocommit():
+        registry.lookup('FE7F97FC141E', 'Red 3')
+    path.write_text(json.dumps({'names': {'AA7F97FC141E': 'Edited again'}}))
+    assert await registry.reload()
+    await registry.flush()
+
+    expected = {
+        'AA7F97FC141E': 'Edited again',
+        'FE7F97FC141E': 'Red 3',
+    }
+    assert registry.names == expected
+    assert devices.DeviceConfig(path).names == expected
+
+    # Changes written by the service are not reloaded
+    assert not await registry.reload()
+
+
+async def test_reload_during_flush(devices_file: FileIO, mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(devices, 'COMMIT_DELAY_S', 10)
+    registry = devices.DeviceConfig(devices_file.name)
+    path = Path(devices_file.name)
+
+    # Serialization blocks until released
+    serializing = threading.Event()
+    release = threading.Event()
+    serialize = registry._serialize
+
+    def slow_serialize(device_config):
+        serializing.set()
+        release.wait(5)
+        return serialize(device_config)
+
+    mocker.patch.object(registry, '_serialize', slow_serialize)
+
+    with registry.autocommit():
+        registry.lookup('FF7F97FC141E', 'Red 2')
+
+    flush_task = asyncio.create_task(registry.flush())
+    await asyncio.to_thread(serializing.wait, 5)
+
+    # The file is edited and reloaded while the flush is in progress
+    path.write_text(json.dumps({'names': {'AA7F97FC141E': 'Edited'}}))
+    reload_task = asyncio.create_task(registry.reload())
+    await asyncio.sleep(0.05)
+    assert not reload_task.done()
+
+    release.set()
+    await flush_task
+    await reload_task
+
+    # Neither the edit nor the pending name is lost
+    expected = {
+        'AA7F97FC141E': 'Edited',
+        'FF7F97FC141E': 'Red 2',
+    }
+    assert registry.names == expected
+    assert devices.DeviceConfig(path).names == expected
+    assert not await registry.reload()
+
+
+async def test_sync_targets(devices_file: FileIO):
+    registry = devices.DeviceConfig(devices_file.name)
+    assert registry.sync_targets('ExampleTilt') == (
+        TiltTemperatureSync(type='TempSensorExternal',
+                            service='example-spark-service',
+                            block='Example Block Name'),
+    )
+    assert registry.sync_targets('Red') == ()
+
+    Path(devices_file.name).write_text(json.dumps({
+        'names': default_names(),
+        'sync': [
+            {'type': 'TempSensorExternal', 'tilt': 'Red', 'service': 'spark-one', 'block': 'Sensor 1'},
+            {'type': 'TempSensorExternal', 'tilt': 'Red', 'service': 'spark-two', 'block': 'Sensor 2'},
+            {'type': 'TempSensorExternal', 'tilt': 'Black', 'service': 'spark-one'},  # Invalid: no block
+            {'type': 'TempSensorExternal', 'service': 'spark-one', 'block': 'Sensor 3'},  # Invalid: no tilt
+        ],
+    }))
+    assert await registry.reload()
+
+    targets = registry.sync_targets('Red')
+    assert [(t.service, t.block) for t in targets] == [('spark-one', 'Sensor 1'), ('spark-two', 'Sensor 2')]
+    assert registry.sync_targets('Red') is targets
+    assert registry.sync_targets('Black') == ()
+    assert registry.sync_targets('ExampleTilt') == ()
+
+    with pytest.raises(FrozenInstanceError):
+        targets[0].block = 'Changed'
+
+
+async def test_filter_targets(devices_file: FileIO):
+    registry = devices.DeviceConfig(devices_file.name)
+    assert registry.filter_targets('Red') == ()
+    assert 'filters' not in registry.device_config
+
+    Path(devices_file.name).write_text(json.dumps({
+        'names': default_names(),
+        'filters': [
+            {'tilt': 'Red', 'field': 'specificGravity', 'type': 'ema', 'alpha': 0.1},
+            {'tilt': 'Red', 'field': 'temperature[degC]', 'type': 'kalman'},
+            {'tilt': 'Black', 'field': 'specificGravity', 'type': 'kalman', 'measurement_noise': 0.01},
+            {'tilt': 'Black', 'field': 'plato[degP]', 'type': 'ema'},  # Invalid: unsupported field
+            {'tilt': 'Black', 'field': 'specificGravity', 'type': 'ema', 'alpha': 2},  # Invalid: alpha > 1
+            {'tilt': 'Black', 'field': 'specificGravity', 'type': 'ema', 'alpha': 'high'},  # Invalid: not a float
+            {'field': 'specificGravity', 'type': 'ema'},  # Invalid: no tilt
+        ],
+    }))
+    assert await registry.reload()
+
+    assert registry.filter_targets('Red') == (
+        TiltFilterSettings('specificGravity', 'ema', alpha=0.1),
+        TiltFilterSettings('temperature[degC]', 'kalman', process_noise=1e-3, measurement_noise=1e-1),
+    )
+    assert registry.filter_targets('Black') == (
+        TiltFilterSettings('specificGravity', 'kalman', process_noise=1e-8, measurement_noise=0.01),
+    )
+    assert registry.filter_targets('Red') is registry.filter_targets('Red')
+
+
+def test_name_index():
+    registry = devices.CV.get()
+    assert registry.lookup('A17F97FC141E', 'Black') == 'Black-2'
+
+    # Rename a device: its name is available again
+    registry.apply_custom_names({'DD7F97FC141E': 'Renamed'})
+    assert registry.lookup('A27F97FC141E', 'Black') == 'Black'
+    assert registry.lookup('A37F97FC141E', 'Black') == 'Black-3'
+
+    # Suffixes are not reused
+    registry.apply_custom_names({'A17F97FC141E': 'Other'})
+    assert registry.lookup('A47F97FC141E', 'Black') == 'Black-4'
+
+    # Manually assigned names are skipped
+    registry.apply_custom_names({'A57F97FC141E': 'Black-5'})
+    assert registry.lookup('A67F97FC141E', 'Black') == 'Black-6'
+
+    # Validated MACs are cached
+    assert registry.lookup('A67F97FC141E', 'Dummy') == 'Black-6'
+    assert registry._known['A67F97FC141E'] == 'Black-6'
+
+    # Reverse index matches names
+    expected: dict[str, set[str]] = {}
+    for mac, name in registry.names.items():
+        expected.setdefault(name, set()).add(mac)
+    assert registry._macs_by_name == expected
+
+
+def test_name_index_many():
+    registry = devices.CV.get()
+    names = [registry.lookup(f'{idx:012X}', 'Red') for idx in range(2000)]
+    assert len(set(names)) == 2000
+    assert names[-1] == 'Red-2001'
@@ -0,0 +1,103 @@
+"""
+Tests brewblox_tilt.filters
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from brewblox_tilt import filters, mqtt, parser
+from brewblox_tilt.models import ServiceConfig, TiltFilterSettings
+from brewblox_tilt.stored import devices
+
+from .conftest import tilt_message
+
+TESTED = filters.__name__
+
+
+@pytest.fixture(autouse=True)
+def setup(tempfiles, config: ServiceConfig, devices_file):
+    Path(devices_file.name).write_text(json.dumps({
+        'names': {'AA7F97FC141E': 'Red'},
+        'filters': [
+            {'tilt': 'Red', 'field': 'specificGravity', 'type': 'ema', 'alpha': 0.5},
+            {'tilt': 'Red', 'field': 'temperature[degC]', 'type': 'kalman'},
+        ],
+    }))
+    mqtt.setup()
+    devices.setup()
+    filters.setup()
+
+
+def test_ema():
+    state = filters.FilterState(TiltFilterSettings('specificGravity', 'ema', alpha=0.5))
+    assert state.update(1.050) == 1.050
+    assert state.update(1.040) == pytest.approx(1.045)
+    assert state.update(1.040) == pytest.approx(1.0425)
+
+
+def test_kalman():
+    state = filters.FilterState(TiltFilterSettings('temperature[degC]', 'kalman',
+                                                   process_noise=0,
+                                                   measurement_noise=1))
+
+    # Without process noise, the Kalman filter is a cumulative average
+    assert state.update(20) == 20
+    assert state.update(22) == pytest.approx(21)
+    assert state.update(24) == pytest.approx(22)
+    assert state.variance == pytest.approx(1 / 3)
+
+
+def test_apply():
+    stage = filters.CV.get()
+    msg = tilt_message({'specificGravity': 1.050, 'temperature[degC]': 20})
+    stage.apply([msg, tilt_message({'specificGravity': 1.050, 'temperature[degC]': 20}, name='Other')])
+    assert stage.states.keys() == {'AA7F97FC141E'}
+    assert stage.dirty
+
+    msg = tilt_message({'specificGravity': 1.040, 'temperature[degC]': 21})
+    stage.apply([msg])
+    assert msg.data == {
+        'specificGravity': 1.040,
+        'temperature[degC]': 21,
+        'filteredSpecificGravity': 1.045,
+        'filteredPlato[degP]': parser.sg_to_plato(1.045),
+        'filteredTemperature[degC]': pytest.approx(20.5, abs=0.1),
+        'filteredTemperature[degF]': pytest.approx(68.9, abs=0.2),
+    }
+
+    # Filters are reset if their settings change
+    registry = devices.CV.get()
+    registry.device_config['filters'][0]['alpha'] = 1
+    registry._index_filters()
+    msg = tilt_message({'specificGravity': 1.030, 'temperature[degC]': 21})
+    stage.apply([msg])
+    assert msg.data['filteredSpecificGravity'] == 1.030
+
+
+async def test_checkpoint(filter_state_file: Path):
+    stage = filters.CV.get()
+
+    async with filters.lifespan():
+        stage.apply([tilt_message({'specificGravity': 1.050, 'temperature[degC]': 20})])
+        stage.apply([tilt_message({'specificGravity': 1.040, 'temperature[degC]': 22})])
+
+    assert filter_state_file.exists()
+    assert not stage.dirty
+
+    restored = filters.FilterStage(filter_state_file, 60)
+    restored.read()
+    assert restored.dump() == stage.dump()
+
+    # Filters continue where they left off
+    msg = tilt_message({'specificGravity': 1.040, 'temperature[degC]': 22})
+    restored.apply([msg])
+    assert msg.data['filteredSpecificGravity'] == 1.0425
+
+
+def test_invalid_checkpoint(filter_state_file: Path):
+    filter_state_file.write_text('{"AA7F97FC141E": {"specificGravity": {}}}')
+    stage = filters.CV.get()
+    stage.read()
+    assert stage.states == {}
@@ -0,0 +1,68 @@
+"""
+Tests brewblox_tilt.history_buffer
+"""
+
+from pathlib import Path
+from unittest.mock import Mock
+
+from brewblox_tilt import history_buffer
+
+TESTED = history_buffer.__name__
+
+
+def published(m: Mock) -> list[bytes]:
+    payloads = [c.args[1] for c in m.publish.call_args_list]
+    m.reset_mock()
+    return payloads
+
+
+async def test_buffer(history_buffer_file: Path):
+    buffer = history_buffer.HistoryBuffer(history_buffer_file, max_size=5, batch_size=2)
+    client = Mock()
+
+    # Not opened
+    buffer.append(1, 'topic', b'ignored')
+    assert buffer.count == 0
+
+    buffer.open()
+    for ts in [3, 1, 2, 4]:
+        buffer.append(ts, 'topic', b'%d' % ts)
+    assert buffer.count == 4
+
+    # Replayed in timestamp order
+    assert buffer.replay_batch(client) == 2
+    assert published(client) == [b'1', b'2']
+    assert buffer.count == 2
+
+    # Oldest messages are evicted if buffer is full
+    for ts in [5, 6, 7, 8]:
+        buffer.append(ts, 'topic', b'%d' % ts)
+    assert buffer.count == 5
+    assert buffer.evicted == 1
+
+    # Contents are preserved after a restart
+    buffer.close()
+    buffer = history_buffer.HistoryBuffer(history_buffer_file, max_size=5, batch_size=2)
+    buffer.open()
+    assert buffer.count == 5
+
+    # Replay stops if the client is disconnected
+    client.client.is_connected = False
+    await buffer.replay(client)
+    assert buffer.count == 5
+
+    client.client.is_connected = True
+    await buffer.replay(client)
+    assert published(client) == [b'4', b'5', b'6', b'7', b'8']
+    assert buffer.count == 0
+    assert buffer.replayed == 5
+    buffer.close()
+
+
+def test_open_error(tmp_path: Path):
+    path = tmp_path / 'file'
+    path.write_text('')
+    buffer = history_buffer.HistoryBuffer(path / 'history.sqlite', max_size=5, batch_size=2)
+    buffer.open()
+    buffer.append(1, 'topic', b'1')
+    assert buffer.count == 0
@@ -0,0 +1,79 @@
+"""
+Tests brewblox_tilt.metrics
+"""
+
+import pytest
+from fastapi import FastAPI
+from pytest_mock import MockerFixture
+from starlette.testclient import TestClient
+
+from brewblox_tilt import metrics, mqtt, parser, scanner, scheduler
+from brewblox_tilt.models import ServiceConfig
+from brewblox_tilt.stored import calibration, devices
+
+from .conftest import tilt_message
+
+TESTED = metrics.__name__
+
+
+@pytest.fixture
+def app(tempfiles, config: ServiceConfig) -> FastAPI:
+    config.metrics_port = 5000
+    mqtt.setup()
+    calibration.setup()
+    devices.setup()
+    parser.setup()
+    scanner.setup()
+    metrics.setup()
+    app = FastAPI()
+    app.include_router(metrics.router)
+    return app
+
+
+def test_metrics(client: TestClient, mocker: MockerFixture):
+    svc_metrics = metrics.CV.get()
+    scn = scanner.CV.get()
+    scn.received = 10
+    scn.rejected['non_apple'] = 4
+    mocker.patch.object(scn, 'adapter_stats', return_value={
+        'hci0': {'received': 10, 'samples': 8, 'selected': 3, 'devices': 1},
+    })
+    parser.CV.get().out_of_bounds = 2
+
+    svc_metrics.scan_duration.observe(5)
+    svc_metrics.observe_messages([tilt_message({'rssi[dBm]': -70}, mac='AA7F97FC141E')],
+                                 metrics.time.monotonic() - metrics.DEVICE_ACTIVE_TIMEOUT_S - 1)
+    svc_metrics.observe_messages([tilt_message({'rssi[dBm]': -80}, mac='BB7F97FC141E')], metrics.time.monotonic())
+
+    sched = scheduler.ScanScheduler()
+    sched.update({'AA7F97FC141E': 10}, 5, 0)
+    svc_metrics.observe_schedule(sched)
+
+    resp = client.get('/metrics')
+    assert resp.status_code == 200
+    lines = resp.text.splitlines()
+
+    assert 'tilt_scan_duration_seconds_count 1.0' in lines
+    assert 'tilt_advertisements_total 10.0' in lines
+    assert 'tilt_advertisements_rejected_total{reason="non_apple"} 4.0' in lines
+    assert 'tilt_advertisements_rejected_total{reason="out_of_bounds_sg"} 2.0' in lines
+    assert 'tilt_adapter_advertisements_total{adapter="hci0"} 10.0' in lines
+    assert 'tilt_adapter_selected_total{adapter="hci0"} 3.0' in lines
+    assert 'tilt_active_devices 1.0' in lines
+    assert 'tilt_scan_window_seconds 0.1' in lines
+    assert 'tilt_scan_interval_seconds 10.0' in lines
+    assert 'tilt_device_advertisement_rate_hz{mac="AA7F97FC141E"} 2.0' in lines
+    assert 'tilt_device_rssi_dbm{color="Red",mac="BB7F97FC141E",name="Red"} -80.0' in lines
+
+    # Inactive devices are no longer exported
+    assert not [line for line in lines if 'AA7F97FC141E' in line and line.startswith('tilt_device_rssi_dbm')]
+    assert svc_metrics.devices.keys() == {'BB7F97FC141E'}
+
+
+def test_disabled():
+    svc_metrics = metrics.ServiceMetrics(enabled=False)
+    with svc_metrics.scan_duration.time():
+        pass
+    svc_metrics.parse_duration.observe(1)
+    svc_metrics.observe_messages([tilt_message({'rssi[dBm]': -70}, mac='AA7F97FC141E')], 0)
+    assert svc_metrics.devices == {}
@@ -2,9 +2,13 @@
 Tests brewblox_tilt.parser
 """
 
+import numpy as np
 import pytest
+from pint import UnitRegistry
 
 from brewblox_tilt import const, mqtt, parser
+from brewblox_tilt.models import ServiceConfig
+from brewblox_tilt.serialization import dumps
 from brewblox_tilt.stored import calibration, devices
 
 TESTED = parser.__name__
@@ -120,3 +124,137 @@ def test_data_parser(tilt_macs: dict):
         'rssi[dBm]': -80,
         # No uncalibrated values
     }
+
+
+@pytest.mark.parametrize('aggregation, expected_sg, expected_temp_f, expected_rssi', [
+    ('last', 1.010, 70, -60),
+    ('mean', 1.0036, 68.2, -72),
+    ('median', 1.002, 68, -75),
+    ('trimmed_mean', 1.0023, 68, -73),
+])
+def test_aggregation(config: ServiceConfig,
+                     tilt_macs: dict,
+                     aggregation: str,
+                     expected_sg: float,
+                     expected_temp_f: float,
+                     expected_rssi: int):
+    config.aggregation = aggregation
+    data_parser = parser.EventDataParser()
+
+    purple_mac = tilt_macs['purple']
+    purple_uuid = next((k for k, v in const.TILT_UUID_COLORS.items() if v == 'Purple'))
+
+    samples = [
+        # (temp F, raw SG, RSSI)
+        (68, 1001, -80),
+        (67, 1002, -75),
+        (68, 1002, -70),
+        (70, 1000000, -50),  # Invalid: out of bounds SG
+        (68, 1003, -75),
+        (70, 1010, -60),
+    ]
+    messages = data_parser.parse([
+        parser.TiltEvent(mac=purple_mac,
+                         uuid=purple_uuid,
+                         major=temp_f,
+                         minor=sg,
+                         txpower=0,
+                         rssi=rssi)
+        for temp_f, sg, rssi in samples
+    ])
+    assert len(messages) == 1
+
+    msg = messages[0]
+    assert msg.samples == 5
+    assert msg.data['specificGravity'] == pytest.approx(expected_sg)
+    assert msg.data['temperature[degF]'] == pytest.approx(expected_temp_f)
+    assert msg.data['rssi[dBm]'] == expected_rssi
+
+
+def test_deg_f_to_c():
+    ureg = UnitRegistry()
+    values_f = [-40, 0, 32, 39, 50.5, 68, 68.4, 70.1, 98.6, 212, *np.arange(30, 90, 0.1)]
+    expected = [round(ureg.Quantity(v, ureg.degF).to('degC').magnitude, 2)
+                for v in values_f]
+
+    assert [parser.deg_f_to_c(v) for v in values_f] == pytest.approx(expected, abs=1e-9)
+    assert parser.deg_f_to_c_array(np.array(values_f)).tolist() == [parser.deg_f_to_c(v) for v in values_f]
+    assert parser.deg_f_to_c(None) is None
+    assert np.isnan(parser.deg_f_to_c_array(np.array([np.nan]))[0])
+
+
+def test_sg_to_plato():
+    values = [1.0, 1.012, 1.0505, 1.1, *np.arange(0.99, 1.15, 0.00005)]
+    assert parser.sg_to_plato(1.050) == pytest.approx(12.39, abs=0.01)
+    assert parser.sg_to_plato_array(np.array(values)).tolist() == [parser.sg_to_plato(v) for v in values]
+    assert parser.sg_to_plato(None) is None
+    assert np.isnan(parser.sg_to_plato_array(np.array([np.nan]))[0])
+
+
+@pytest.mark.parametrize('aggregation', ['last', 'mean', 'median', 'trimmed_mean'])
+def test_parse_batch(config: ServiceConfig, tilt_macs: dict, aggregation: str):
+    config.aggregation = aggregation
+    data_parser = parser.EventDataParser()
+    rng = np.random.default_rng(1234)
+
+    macs = [*tilt_macs.values(), 'AA:BB:CC:DD:EE:FF', '11:22:33:44:55:66']
+    uuids = [*const.TILT_UUID_COLORS.keys(), 'invalid']
+    events = []
+
+    for _ in range(200):
+        mac_idx = rng.integers(len(macs))
+        is_pro = mac_idx % 2 == 0
+        events.append(parser.TiltEvent(mac=macs[mac_idx],
+                                       uuid=str(rng.choice(uuids)),
+                                       major=rng.integers(600, 800) if is_pro else rng.integers(60, 80),
+                                       minor=rng.integers(9900, 10600) if is_pro else rng.integers(990, 1060),
+                                       txpower=0,
+                                       rssi=rng.integers(-100, -40)))
+
+    # Out of bounds SG
+    events.append(parser.TiltEvent(mac=macs[0], uuid=uuids[0], major=68, minor=60000, txpower=0, rssi=-80))
+
+    expected = data_parser.parse_scalar(events)
+    actual = data_parser.parse_batch(events)
+    assert len(actual) == len(expected) == len(macs)
+
+    for msg, expected_msg in zip(actual, expected):
+        assert msg.mac == expected_msg.mac
+        assert msg.name == expected_msg.name
+        assert msg.color == expected_msg.color
+        assert msg.samples == expected_msg.samples
+        assert msg.sync == expected_msg.sync
+
+        # Types must match as well: 69 and 69.0 are encoded differently
+        assert dumps(msg.data) == dumps(expected_msg.data)
+
+    # Whole degrees of regular Tilts are published as int
+    if aggregation == 'last':
+        assert any(isinstance(msg.data.get('uncalibratedTemperature[degF]', msg.data['temperature[degF]']), int)
+                   for msg in actual)
+
+
+def test_parse_empty():
+    data_parser = parser.CV.get()
+    assert data_parser.parse([]) == []
+    assert data_parser.parse_batch([]) == []
+    assert data_parser.parse([
+        parser.TiltEvent(mac='AA7F97FC141E', uuid='', major=68, minor=1002, txpower=0, rssi=-80),
+    ]) == []
+
+
+def test_parse_dispatch(mocker):
+    data_parser = parser.CV.get()
+    s_scalar = mocker.spy(data_parser, 'parse_scalar')
+    s_batch = mocker.spy(data_parser, 'parse_batch')
+
+    events = [parser.TiltEvent(mac=f'AA7F97FC{idx:04X}', uuid='', major=68, minor=1002, txpower=0, rssi=-80)
+              for idx in range(parser.BATCH_MIN_DEVICES)]
+
+    data_parser.parse(events[:-1])
+    assert s_scalar.call_count == 1
+    assert s_batch.call_count == 0
+
+    data_parser.parse(events)
+    assert s_scalar.call_count == 1
+    assert s_batch.call_count == 1
@@ -0,0 +1,57 @@
+"""
+Tests brewblox_tilt.pipeline
+"""
+
+import asyncio
+
+import pytest
+from pytest_mock import MockerFixture
+
+from brewblox_tilt import pipeline
+
+TESTED = pipeline.__name__
+
+
+async def test_reading_queue():
+    queue: pipeline.ReadingQueue[int] = pipeline.ReadingQueue(2)
+    assert await queue.get(0.01) == []
+
+    queue.put('a', 1)
+    queue.put('b', 10)
+    queue.put('a', 2)
+    assert len(queue) == 3
+
+    # Oldest readings for a device are dropped
+    queue.put('a', 3)
+    assert queue.dropped == 1
+    assert len(queue) == 3
+
+    assert await queue.get() == [2, 10]
+    assert await queue.get() == [3]
+    assert queue.get_nowait() == []
+
+    # get() returns when a reading is added
+    task = asyncio.create_task(queue.get())
+    await asyncio.sleep(0.01)
+    assert not task.done()
+    queue.put('b', 11)
+    assert await asyncio.wait_for(task, 1) == [11]
+
+
+async def test_run_stage(mocker: MockerFixture):
+    m_sleep = mocker.patch(TESTED + '.asyncio.sleep', autospec=True)
+    calls = 0
+
+    async def step():
+        nonlocal calls
+        calls += 1
+        if calls == 7:
+            raise asyncio.CancelledError()
+        if calls in [1, 2, 3, 5]:
+            raise RuntimeError('boom')
+
+    with pytest.raises(asyncio.CancelledError):
+        await pipeline.run_stage('Test', step)
+
+    # Backoff increases for consecutive errors, and resets after success
+    assert [c.args[0] for c in m_sleep.await_args_list] == [1, 2, 4, 1]
@@ -0,0 +1,394 @@
+"""
+Tests brewblox_tilt.scanner
+"""
+
+import random
+import time
+from pathlib import Path
+from uuid import UUID
+
+import pytest
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+from pytest_mock import MockerFixture
+
+from brewblox_tilt import capture, const, mqtt, parser, scanner
+from brewblox_tilt.models import ServiceConfig
+from brewblox_tilt.stored import calibration, devices
+
+TESTED = scanner.__name__
+
+
+@pytest.fixture
+def setup(tempfiles):
+    mqtt.setup()
+    calibration.setup()
+    devices.setup()
+    parser.setup()
+
+
+def beacon_frame(uuid: str, major: int, minor: int, tx_power: int) -> bytes:
+    return b''.join([
+        b'\x02\x15',
+        UUID(uuid).bytes,
+        major.to_bytes(2, 'big'),
+        minor.to_bytes(2, 'big'),
+        tx_power.to_bytes(1, 'big', signed=True),
+    ])
+
+
+def advertisement(mac: str, manufacturer_data: dict[int, bytes], rssi=-80) -> tuple[BLEDevice, AdvertisementData]:
+    device = BLEDevice(mac, None, None, rssi)
+    data = AdvertisementData(local_name=None,
+                             manufacturer_data=manufacturer_data,
+                             service_data={},
+                             service_uuids=[],
+                             tx_power=None,
+                             rssi=rssi,
+                             platform_data=())
+    return device, data
+
+
+def frames() -> list[bytes]:
+    rand = random.Random(1234)
+    tilt_frames = [
+        beacon_frame(uuid, rand.randint(0, 0xFFFF), rand.randint(0, 0xFFFF), rand.randint(-128, 127))
+        for uuid in const.TILT_UUID_COLORS
+    ]
+    return [
+        *tilt_frames,
+        beacon_frame('a495bb90-c5b1-4b44-b512-1370f02d74de', 68, 1050, 0),  # unknown color
+        beacon_frame('e2c56db5-dffb-48d2-b060-d0f5a71096e0', 68, 1050, 0),  # generic iBeacon
+        b'\x02\x16' + tilt_frames[0][2:],  # not an iBeacon
+        tilt_frames[0][:-1],  # too short
+        tilt_frames[0] + b'\x00',  # trailing data
+        b'',
+        *[rand.randbytes(rand.randint(0, 30)) for _ in range(100)],
+    ]
+
+
+@pytest.mark.parametrize('frame', frames())
+def test_decode_beacon(frame: bytes):
+    assert scanner.decode_beacon(frame) == scanner.decode_beacon_construct(frame)
+
+
+def test_decode_beacon_values():
+    uuid = next(iter(const.TILT_UUID_COLORS))
+    assert scanner.decode_beacon(beacon_frame(uuid, 68, 1050, -59)) == (uuid, 68, 1050, -59)
+    assert scanner.decode_beacon(beacon_frame(uuid, 685, 10502, 0)) == (uuid, 685, 10502, 0)
+    assert scanner.encode_beacon(uuid, 685, 10502, -59) == beacon_frame(uuid, 685, 10502, -59)
+
+
+@pytest.mark.parametrize('legacy_decoder', [False, True])
+def test_callback(legacy_decoder: bool):
+    scn = scanner.TiltScanner(legacy_decoder=legacy_decoder)
+    uuid = next(iter(const.TILT_UUID_COLORS))
+
+    scn._callback(*advertisement('AA:7F:97:FC:14:1E', {}))
+    scn._callback(*advertisement('AA:7F:97:FC:14:1E', {0x0059: beacon_frame(uuid, 68, 1050, 0)}))
+    scn._callback(*advertisement('AA:7F:97:FC:14:1E', {const.APPLE_VID: b'\x10\x05'}))
+    assert scn._sources[0].buffers == {}
+    assert scn.rejected == {'non_apple': 2, 'non_ibeacon': 1, 'non_tilt_uuid': 0}
+
+    scn._callback(*advertisement('AA:7F:97:FC:14:1E', {
+        const.APPLE_VID: beacon_frame('e2c56db5-dffb-48d2-b060-d0f5a71096e0', 68, 1050, 0),
+    }))
+    assert scn._sources[0].buffers == {}
+    assert scn.rejected['non_tilt_uuid'] == 1
+
+    scn._callback(*advertisement('AA:7F:97:FC:14:1E', {const.APPLE_VID: beacon_frame(uuid, 68, 1050, 0)}))
+    scn._callback(*advertisement('AA:7F:97:FC:14:1E', {const.APPLE_VID: beacon_frame(uuid, 69, 1051, 0)}, -70))
+    [evt1, evt2] = scn._sources[0].buffers['AA:7F:97:FC:14:1E'].drain()
+    assert scn.received == 6
+    assert scn.adapter_stats() == {'default': {'received': 6, 'samples': 2, 'selected': 0, 'devices': 1}}
+
+    assert evt1.uuid == uuid
+    assert evt1.major == 68
+    assert evt1.minor == 1050
+    assert evt1.rssi == -80
+    assert evt2.major == 69
+    assert evt2.minor == 1051
+    assert evt2.rssi == -70
+
+
+@pytest.mark.parametrize('scan_mode', ['continuous', 'interval'])
+async def test_scan_mode(setup, config: ServiceConfig, mocker: MockerFixture, scan_mode: str):
+    config.scan_mode = scan_mode
+    continuous = scan_mode == 'continuous'
+    scn = scanner.TiltScanner()
+    m_start = mocker.patch.object(scn._scanners[0]._backend, 'start')
+    m_stop = mocker.patch.object(scn._scanners[0]._backend, 'stop')
+    uuid = next(iter(const.TILT_UUID_COLORS))
+
+    await scn.start()
+    assert m_start.await_count == int(continuous)
+
+    # Advertisement received between scans
+    scn._callback(*advertisement('AA:7F:97:FC:14:1E', {const.APPLE_VID: beacon_frame(uuid, 68, 1050, 0)}))
+
+    messages = await scn.scan(0.01)
+    assert len(messages) == 1
+    assert scn._sources[0].buffers['AA:7F:97:FC:14:1E'].count == 0
+    assert m_start.await_count == 1
+    assert m_stop.await_count == int(not continuous)
+
+    await scn.stop()
+    assert m_stop.await_count == 1
+
+
+async def test_discovery_retry(setup, config: ServiceConfig, mocker: MockerFixture):
+    mocker.patch.object(scanner, 'DISCOVERY_RETRY_MIN_S', 0)
+    scn = scanner.TiltScanner()
+    m_start = mocker.patch.object(scn._scanners[0]._backend, 'start', side_effect=[OSError('No adapter'), None])
+    m_stop = mocker.patch.object(scn._scanners[0]._backend, 'stop')
+
+    # Errors during startup are not raised
+    await scn.start()
+    assert m_start.await_count == 1
+    assert m_stop.await_count == 1
+    assert not scn._discovery[0].discovering
+
+    # Discovery is started again by the next scan
+    await scn.collect(0.01)
+    assert m_start.await_count == 2
+    assert scn._discovery[0].discovering
+
+    await scn.stop()
+    assert m_stop.await_count == 2
+
+
+async def test_discovery_stall(setup, config: ServiceConfig, mocker: MockerFixture):
+    mocker.patch.object(scanner, 'DISCOVERY_STALL_SCANS', 2)
+    scn = scanner.TiltScanner()
+    m_start = mocker.patch.object(scn._scanners[0]._backend, 'start')
+    m_stop = mocker.patch.object(scn._scanners[0]._backend, 'stop')
+    uuid = next(iter(const.TILT_UUID_COLORS))
+
+    await scn.start()
+    assert m_start.await_count == 1
+
+    # Any received advertisement resets the stall counter
+    await scn.collect(0.01)
+    scn._callback(*advertisement('AA:7F:97:FC:14:1E', {const.APPLE_VID: beacon_frame(uuid, 68, 1050, 0)}))
+    await scn.collect(0.01)
+    await scn.collect(0.01)
+    assert m_start.await_count == 1
+
+    # Discovery is restarted if nothing is received
+    await scn.collect(0.01)
+    assert m_stop.await_count == 1
+    assert m_start.await_count == 2
+    assert scn._discovery[0].discovering
+
+    await scn.stop()
+
+
+def fill_source(source: scanner.AdapterSource, mac: str, rssi: list[int], age: float):
+    uuid = next(iter(const.TILT_UUID_COLORS))
+    for idx, value in enumerate(rssi):
+        source.append(mac, uuid, 68, 1050 + idx, 0, value)
+    source.last_seen[mac] = time.monotonic() - age
+
+
+@pytest.mark.parametrize('method', ['strongest', 'freshest'])
+def test_merge_sources(method: str):
+    hci0 = scanner.AdapterSource('hci0', 32, 300)
+    hci1 = scanner.AdapterSource('hci1', 32, 300)
+
+    # Both adapters receive AA, hci0 with the stronger signal, hci1 more recently
+    fill_source(hci0, 'AA:7F:97:FC:14:1E', [-60, -70], 20)
+    fill_source(hci1, 'AA:7F:97:FC:14:1E', [-80, -80, -90], 10)
+
+    # Only hci1 receives BB
+    fill_source(hci1, 'BB:7F:97:FC:14:1E', [-90], 25)
+
+    events = scanner.merge_sources([hci0, hci1], method)
+    aa_events = [evt for evt in events if evt.mac == 'AA:7F:97:FC:14:1E']
+    bb_events = [evt for evt in events if evt.mac == 'BB:7F:97:FC:14:1E']
+
+    if method == 'strongest':
+        assert [evt.rssi for evt in aa_events] == [-60, -70]
+        assert hci0.selected == 1
+        assert hci1.selected == 1
+    else:
+        assert [evt.rssi for evt in aa_events] == [-80, -80, -90]
+        assert hci0.selected == 0
+        assert hci1.selected == 2
+
+    assert len(bb_events) == 1
+    assert hci0.stats() == {'received': 0, 'samples': 2, 'selected': hci0.selected, 'devices': 1}
+
+    # All buffers are drained
+    assert scanner.merge_sources([hci0, hci1], method) == []
+
+
+def test_source_timeout():
+    source = scanner.AdapterSource('hci0', 32, 60)
+    fill_source(source, 'AA:7F:97:FC:14:1E', [-60], 61)
+    fill_source(source, 'BB:7F:97:FC:14:1E', [-60], 30)
+
+    # Samples are drained before buffers of inactive devices are removed
+    assert source.drain().keys() == {'AA:7F:97:FC:14:1E', 'BB:7F:97:FC:14:1E'}
+    assert source.buffers.keys() == {'BB:7F:97:FC:14:1E'}
+    assert source.last_seen.keys() == {'BB:7F:97:FC:14:1E'}
+    assert source.stats()['devices'] == 1
+
+    # Devices are added again when received
+    fill_source(source, 'AA:7F:97:FC:14:1E', [-60], 0)
+    assert source.drain().keys() == {'AA:7F:97:FC:14:1E'}
+    assert source.buffers.keys() == {'AA:7F:97:FC:14:1E', 'BB:7F:97:FC:14:1E'}
+
+
+async def test_adapters(setup, config: ServiceConfig, mocker: MockerFixture):
+    config.adapters = ['hci0', 'hci1']
+    scn = scanner.TiltScanner()
+    assert len(scn._scanners) == 2
+    m_starts = [mocker.patch.object(s._backend, 'start') for s in scn._scanners]
+    m_stops = [mocker.patch.object(s._backend, 'stop') for s in scn._scanners]
+    uuid = next(iter(const.TILT_UUID_COLORS))
+    hci0, hci1 = scn._sources
+
+    await scn.start()
+    assert [m.await_count for m in m_starts] == [1, 1]
+
+    scn._callback(*advertisement('AA:7F:97:FC:14:1E', {const.APPLE_VID: beacon_frame(uuid, 68, 1050, 0)}, -80),
+                  source=hci0)
+    scn._callback(*advertisement('AA:7F:97:FC:14:1E', {const.APPLE_VID: beacon_frame(uuid, 68, 1050, 0)}, -60),
+                  source=hci1)
+    scn._callback(*advertisement('AA:7F:97:FC:14:1E', {}), source=hci1)
+
+    messages = await scn.scan(0.01)
+    assert len(messages) == 1
+    assert messages[0].data['rssi[dBm]'] == -60
+    assert scn.received == 3
+    assert scn.adapter_stats() == {
+        'hci0': {'received': 1, 'samples': 1, 'selected': 0, 'devices': 1},
+        'hci1': {'received': 2, 'samples': 1, 'selected': 1, 'devices': 1},
+    }
+
+    await scn.stop()
+    assert [m.await_count for m in m_stops] == [1, 1]
+
+
+@pytest.mark.parametrize('scan_mode', ['continuous', 'interval'])
+async def test_adapter_errors(setup, config: ServiceConfig, mocker: MockerFixture, scan_mode: str):
+    mocker.patch.object(scanner, 'DISCOVERY_RETRY_MIN_S', 0)
+    config.scan_mode = scan_mode
+    config.adapters = ['hci0', 'hci1']
+    scn = scanner.TiltScanner()
+    m_start0 = mocker.patch.object(scn._scanners[0]._backend, 'start', side_effect=OSError('No adapter'))
+    m_start1 = mocker.patch.object(scn._scanners[1]._backend, 'start')
+    mocker.patch.object(scn._scanners[0]._backend, 'stop')
+    m_stop1 = mocker.patch.object(scn._scanners[1]._backend, 'stop')
+    uuid = next(iter(const.TILT_UUID_COLORS))
+    hci1 = scn._sources[1]
+
+    # A failing adapter does not stop the others
+    await scn.start()
+    scn._callback(*advertisement('AA:7F:97:FC:14:1E', {const.APPLE_VID: beacon_frame(uuid, 68, 1050, 0)}),
+                  source=hci1)
+    messages = await scn.scan(0.01)
+    assert len(messages) == 1
+
+    # The failing adapter is retried
+    await scn.scan(0.01)
+    # Interval scans start all adapters on every scan
+    # Continuous scans retry failed adapters before every scan
+    assert m_start0.await_count == (2 if scan_mode == 'interval' else 3)
+    assert m_start1.await_count == (2 if scan_mode == 'interval' else 1)
+
+    await scn.stop()
+    assert m_stop1.await_count > 0
+
+    # Scans fail if no adapter can be started
+    m_start1.side_effect = OSError('No adapter')
+    if scan_mode == 'interval':
+        with pytest.raises(OSError):
+            await scn.scan(0.01)
+
+
+async def test_record(setup, config: ServiceConfig, mocker: MockerFixture, tmp_path: Path):
+    config.record = tmp_path / 'capture.jsonl'
+    scn = scanner.TiltScanner()
+    mocker.patch.object(scn._scanners[0]._backend, 'start')
+    mocker.patch.object(scn._scanners[0]._backend, 'stop')
+    uuid = next(iter(const.TILT_UUID_COLORS))
+
+    await scn.start()
+    scn._callback(*advertisement('AA:7F:97:FC:14:1E', {const.APPLE_VID: beacon_frame(uuid, 68, 1050, 0)}))
+    scn._callback(*advertisement('BB:7F:97:FC:14:1E', {0x0059: b'\x01'}, -60))
+    await scn.stop()
+
+    records = capture.read_capture(config.record)
+    assert [(r.mac, r.manufacturer_data, r.rssi) for r in records] == [
+        ('AA:7F:97:FC:14:1E', {const.APPLE_VID: beacon_frame(uuid, 68, 1050, 0)}, -80),
+        ('BB:7F:97:FC:14:1E', {0x0059: b'\x01'}, -60),
+    ]
+
+
+@pytest.mark.parametrize('speed', [0, 100])
+async def test_replay(setup, speed: float):
+    uuid = next(iter(const.TILT_UUID_COLORS))
+    frame = {const.APPLE_VID: beacon_frame(uuid, 68, 1050, 0)}
+    records = [
+        capture.CaptureRecord(10, 'AA:7F:97:FC:14:1E', frame, -80),
+        capture.CaptureRecord(10.5, 'BB:7F:97:FC:14:1E', frame, -80),
+        capture.CaptureRecord(11, 'BB:7F:97:FC:14:1E', {0x0059: b'\x01'}, -80),
+        capture.CaptureRecord(12, 'AA:7F:97:FC:14:1E', frame, -80),
+        capture.CaptureRecord(15, 'AA:7F:97:FC:14:1E', frame, -80),
+    ]
+    scn = scanner.ReplayScanner(records, speed)
+    duration = 2 / (speed or 1)
+
+    assert len(await scn.collect(duration)) == 2
+    assert scn.received == 3
+    assert scn.rejected['non_apple'] == 1
+
+    messages = await scn.scan(duration)
+    assert [msg.mac for msg in messages] == ['AA7F97FC141E']
+    assert not scn.done
+
+    assert len(await scn.collect(duration)) == 1
+    assert scn.done
+    assert await scn.collect(duration) == []
+
+
+def test_setup_replay(setup, config: ServiceConfig, tmp_path: Path):
+    config.replay = tmp_path / 'capture.jsonl'
+    capture.write_capture(config.replay, [])
+    scanner.setup()
+    assert isinstance(scanner.CV.get(), scanner.ReplayScanner)
+
+
+async def test_load_simulation(setup, mocker: MockerFixture):
+    scn = scanner.LoadScanner(num_tilts=10,
+                              rate=2,
+                              ibeacon_rate=5,
+                              malformed_rate=5,
+                              time_scale=3600,
+                              seed=1234)
+    assert len({tilt.mac for tilt in scn.tilts}) == 10
+
+    scn.feed(10)
+    assert 190 <= scn.received <= 310
+    assert 40 <= scn.rejected['non_tilt_uuid'] <= 60
+    assert 40 <= scn.rejected['non_ibeacon'] <= 60
+    assert scn.rejected['non_apple'] == 0
+
+    events = scn._drain()
+    assert 180 <= len(events) <= 220
+
+    # Fermentation progresses, and SG is decreasing
+    messages = parser.CV.get().parse(events)
+    assert len(messages) == 10
+    start_sg = {msg.mac: msg.data['specificGravity'] for msg in messages}
+
+    scn.feed(200)
+    scn._drain()
+    m_sleep = mocker.patch(TESTED + '.asyncio.sleep', autospec=True)
+    messages = await scn.scan(5)
+    assert m_sleep.await_count == 50
+    assert len(messages) == 10
+    for msg in messages:
+        assert msg.data['specificGravity'] < start_sg[msg.mac]
+    assert any(msg.data['specificGravity'] != round(msg.data['specificGravity'], 3) for msg in messages)
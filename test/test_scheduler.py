@@ -0,0 +1,91 @@
+"""
+Tests brewblox_tilt.scheduler
+"""
+
+import math
+
+import pytest
+
+from brewblox_tilt import scheduler
+from brewblox_tilt.models import ServiceConfig
+
+TESTED = scheduler.__name__
+
+
+@pytest.fixture(autouse=True)
+def setup(config: ServiceConfig):
+    config.scan_mode = 'interval'
+    config.scan_duration = 10
+    config.scan_window_min = 1
+    config.scan_capture_probability = 0.99
+    config.active_scan_interval = 10
+    config.inactive_scan_interval = 5
+    config.scan_backoff_max = 30
+    config.scan_device_timeout = 60
+
+
+def test_window():
+    sched = scheduler.ScanScheduler()
+    assert sched.window == 10
+    assert sched.interval == 0
+
+    # The full window is used until rates are known
+    for now in range(scheduler.MIN_OBSERVATIONS - 1):
+        sched.update({'AA': 10, 'BB': 20}, 10, now)
+        assert sched.window == 10
+        assert sched.interval == 10
+
+    sched.update({'AA': 10, 'BB': 20}, 10, 2)
+    assert sched.devices['AA'].rate == pytest.approx(1)
+    assert sched.devices['BB'].rate == pytest.approx(2)
+
+    # Sized for the slowest device
+    expected = -math.log(1 - 0.99 ** (1 / 2)) / 1
+    assert sched.window == pytest.approx(expected)
+
+    # Missed devices increase the window
+    sched.update({'BB': 20}, sched.window, 3)
+    assert sched.window > expected
+    assert sched.interval == 10
+
+    # Fast devices are limited by the minimum window
+    sched = scheduler.ScanScheduler()
+    for now in range(scheduler.MIN_OBSERVATIONS):
+        sched.update({'AA': 1000}, 10, now)
+    assert sched.window == 1
+
+
+def test_continuous(config: ServiceConfig):
+    config.scan_mode = 'continuous'
+    sched = scheduler.ScanScheduler()
+
+    # Advertisements received between scans are counted
+    sched.update({'AA': 10}, 10, 0)
+    sched.update({'AA': 20}, 10, 20)
+    assert sched.devices['AA'].rate == pytest.approx(1)
+
+
+def test_backoff():
+    sched = scheduler.ScanScheduler()
+
+    sched.update({'AA': 10}, 10, 0)
+    assert sched.interval == 10
+
+    # Known devices keep the active interval if they are missed in a scan
+    sched.update({}, 10, 30)
+    assert sched.interval == 10
+    assert sched.misses == 0
+
+    # Exponential backoff if no devices are in range
+    intervals = []
+    for now in range(100, 200, 10):
+        sched.update({}, 10, now)
+        intervals.append(sched.interval)
+    assert sched.devices == {}
+    assert intervals == [5, 10, 20, 30, 30, 30, 30, 30, 30, 30]
+    assert sched.window == 10
+
+    # Reset when a device is found
+    sched.update({'AA': 10}, 10, 200)
+    assert sched.interval == 10
+    assert sched.misses == 0
@@ -0,0 +1,64 @@
+"""
+Tests brewblox_tilt.serialization
+"""
+
+import json
+
+from brewblox_tilt import serialization
+from brewblox_tilt.models import TiltMessage, TiltTemperatureSync
+
+TESTED = serialization.__name__
+
+
+def test_dumps():
+    obj = {'key': 'tilt', 'data': {'Red': {'specificGravity': 1.05, 'rssi[dBm]': -80}}}
+    assert json.loads(serialization.dumps(obj)) == obj
+
+
+def test_state_encoder():
+    encoder = serialization.StateEncoder('tilt', 'brewcast/state/tilt')
+    msg = TiltMessage(name='Ferment "1"',
+                      mac='AA7F97FC141E',
+                      color='Red',
+                      data={'specificGravity': 1.05, 'temperature[degC]': 20.12},
+                      samples=3)
+
+    topic, payload = encoder.encode(msg, 1234)
+    assert topic == 'brewcast/state/tilt/Red/AA7F97FC141E'
+    assert json.loads(payload) == {
+        'key': 'tilt',
+        'type': 'Tilt.state',
+        'color': 'Red',
+        'mac': 'AA7F97FC141E',
+        'name': 'Ferment "1"',
+        'timestamp': 1234,
+        'samples': 3,
+        'data': {'specificGravity': 1.05, 'temperature[degC]': 20.12},
+    }
+
+    # Static parts are cached per device and name
+    assert len(encoder._cache) == 1
+    encoder.encode(msg, 1235)
+    assert len(encoder._cache) == 1
+
+    renamed = TiltMessage(name='Renamed', mac=msg.mac, color=msg.color, data=msg.data)
+    topic, payload = encoder.encode(renamed, 1236)
+    assert json.loads(payload)['name'] == 'Renamed'
+    assert len(encoder._cache) == 2
+
+    # Extra fields are added to data, without changing the message
+    topic, payload = encoder.encode(msg, 1237, {'abv[%]': 1.5})
+    assert json.loads(payload)['data'] == {'specificGravity': 1.05, 'temperature[degC]': 20.12, 'abv[%]': 1.5}
+    assert msg.data == {'specificGravity': 1.05, 'temperature[degC]': 20.12}
+
+
+def test_sync_encoder():
+    encoder = serialization.SyncEncoder()
+    sync = TiltTemperatureSync(type='TempSensorExternal', service='spark-one', block='Sensor 1')
+    assert json.loads(encoder.encode(sync, 20.5)) == {
+        'id': 'Sensor 1',
+        'serviceId': 'spark-one',
+        'type': 'TempSensorExternal',
+        'data': {'setting[degC]': 20.5},
+    }
+    assert json.loads(encoder.encode(sync, 21))['data'] == {'setting[degC]': 21}
@@ -0,0 +1,25 @@
+"""
+Tests brewblox_tilt.startup
+"""
+
+from brewblox_tilt import startup
+
+TESTED = startup.__name__
+
+
+def test_timer():
+    timer = startup.StartupTimer()
+    with timer.phase('one'):
+        pass
+    with timer.phase('two'):
+        pass
+    assert [name for name, _ in timer.phases] == ['one', 'two']
+    assert timer.report().startswith('Startup done in ')
+    assert 'one=0ms, two=0ms' in timer.report()
+
+    assert timer.first_publish is None
+    timer.published()
+    first = timer.first_publish
+    assert first is not None
+    timer.published()
+    assert timer.first_publish == first
@@ -0,0 +1,56 @@
+"""
+Tests brewblox_tilt.sync
+"""
+
+import json
+from unittest.mock import Mock
+
+from brewblox_tilt import sync
+from brewblox_tilt.models import ServiceConfig, TiltTemperatureSync
+
+from .conftest import tilt_message
+
+TESTED = sync.__name__
+
+
+def patches(m: Mock) -> list[tuple[str, float]]:
+    payloads = [json.loads(c.args[1]) for c in m.publish.call_args_list]
+    m.reset_mock()
+    return [(p['id'], p['data']['setting[degC]']) for p in payloads]
+
+
+def test_publish(config: ServiceConfig):
+    config.sync_deadband = 0.1
+    config.sync_min_interval = 10
+    config.sync_refresh_interval = 60
+    publisher = sync.SyncPublisher()
+    client = Mock()
+
+    sensor1 = TiltTemperatureSync(type='TempSensorExternal', service='spark-one', block='sensor-1')
+    sensor2 = TiltTemperatureSync(type='TempSensorExternal', service='spark-one', block='sensor-2')
+    ignored = TiltTemperatureSync(type='TempSensorCombi', service='spark-one', block='sensor-3')
+
+    # Tilts that sync to the same block are coalesced
+    publisher.publish(client, [tilt_message({'temperature[degC]': 20}, mac='AA', sync=(sensor1, ignored)),
+                               tilt_message({'temperature[degC]': 21}, mac='BB', sync=(sensor1, sensor2))], 0)
+    assert patches(client) == [('sensor-1', 20.5), ('sensor-2', 21)]
+    assert client.publish.call_count == 0
+
+    # Minimum interval
+    publisher.publish(client, [tilt_message({'temperature[degC]': 25}, mac='AA', sync=(sensor1,))], 5)
+    assert patches(client) == []
+
+    # Deadband
+    publisher.publish(client, [tilt_message({'temperature[degC]': 20.55}, mac='AA', sync=(sensor1,))], 15)
+    assert patches(client) == []
+    publisher.publish(client, [tilt_message({'temperature[degC]': 22}, mac='AA', sync=(sensor1,))], 20)
+    assert patches(client) == [('sensor-1', 22)]
+
+    # Refresh
+    publisher.publish(client, [tilt_message({'temperature[degC]': 22}, mac='AA', sync=(sensor1,))], 79)
+    assert patches(client) == []
+    publisher.publish(client, [tilt_message({'temperature[degC]': 22}, mac='AA', sync=(sensor1,))], 80)
+    assert patches(client) == [('sensor-1', 22)]
+
+    assert publisher.sent == 4
+    assert publisher.suppressed == 3
@@ -0,0 +1,69 @@
+"""
+Tests brewblox_tilt.stored.watcher
+"""
+
+import asyncio
+from io import FileIO
+
+import pytest
+
+from brewblox_tilt import const, mqtt
+from brewblox_tilt.stored import calibration, devices, watcher
+
+TESTED = watcher.__name__
+
+
+@pytest.fixture(autouse=True)
+def setup(tempfiles):
+    mqtt.setup()
+    calibration.setup()
+    devices.setup()
+
+
+async def test_reload_calibration(sgcal_file: FileIO):
+    calibrator = calibration.SG_CAL.get()
+    assert 'pink' not in calibrator.evaluators
+    assert calibrator.calibration_key(['Pink']) is None
+
+    const.SG_CAL_FILE_PATH.write_text(''.join(f'Pink, 1.00{v}, 1.00{v + 1}\n' for v in range(5)))
+    await watcher.reload(watcher.watched_paths())
+
+    # Same object, new content
+    assert calibration.SG_CAL.get() is calibrator
+    assert set(calibrator.evaluators) == {'pink'}
+    assert calibrator.calibration_key(['Pink']) == 'pink'
+    assert calibrator.calibrated_value(['Pink'], 1.002, 3) == pytest.approx(1.003)
+
+
+async def test_reload_devices(devices_file: FileIO):
+    registry = devices.CV.get()
+    assert registry.names['AA7F97FC141E'] == 'Red'
+
+    # Changes made by the service itself are ignored
+    with registry.autocommit():
+        registry.lookup('FF7F97FC141E', 'Orange')
+    assert not await registry.reload()
+
+    const.DEVICES_FILE_PATH.write_text('names:\n  AA7F97FC141E: Renamed\n')
+    assert await registry.reload()
+    assert devices.CV.get() is registry
+    assert registry.names['AA7F97FC141E'] == 'Renamed'
+    # Names that were not yet written are kept
+    assert registry.names['FF7F97FC141E'] == 'Orange'
+    assert registry.sync  # defaults are added
+
+
+async def test_watch(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(watcher, 'WATCH_DEBOUNCE_MS', 10)
+    calibrator = calibration.TEMP_CAL.get()
+
+    async with watcher.lifespan():
+        await asyncio.sleep(0.2)
+        const.TEMP_CAL_FILE_PATH.write_text(''.join(f'Pink, {v}, {v + 1}\n' for v in range(60, 70, 2)))
+
+        for _ in range(50):
+            await asyncio.sleep(0.1)
+            if 'pink' in calibrator.evaluators:
+                break
+
+    assert set(calibrator.evaluators) == {'pink'}